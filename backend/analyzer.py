@@ -1,55 +1,295 @@
 import re
+import logging
 import pandas as pd
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import emoji
 from collections import Counter
+from dataclasses import asdict
 import string
 import unicodedata
+from array import array
+import threading
+import multiprocessing
+import hashlib
+import heapq
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse
+import numpy as np
+from sentiment import BatchSentimentScorer
+from emojis import EmojiMatcher
+from state import CHAT_KEY_CHARS, AnalysisState, chat_key
+from store import MESSAGE_TERMINATOR, MessageStore
+from profiling import Profile
+from timestamps import StampFormat, date_seconds, detect_format, time_seconds
+from options import DEFAULT_OPTIONS, AnalysisOptions, normalize_words
+from ingest import StreamDecoder
+
+logger = logging.getLogger(__name__)
+
+# Message line formats: bracketed iOS exports and dashed Android exports.
+# Groups: date, time, AM/PM marker (12-hour exports only), author, message
+DATE_PATTERN = r'(\d{1,2}/\d{1,2}/\d{2,4})'
+TIME_PATTERN = r'(\d{1,2}:\d{2}(?::\d{2})?)(?:\s?([AaPp]\.?[Mm]\.?))?'
+PATTERN_IOS = re.compile(rf'^\[{DATE_PATTERN},\s{TIME_PATTERN}\]\s(.*?):\s(.*)$')
+PATTERN_ANDROID = re.compile(rf'^{DATE_PATTERN},\s{TIME_PATTERN}\s-\s(.*?):\s(.*)$')
+LINE_PATTERNS = (PATTERN_IOS, PATTERN_ANDROID)
+
+# Direction marks some lines start with: iOS writes a left-to-right mark
+# before the '[' of attachment and system lines
+BIDI_MARKS = '\u200e\u200f\u202a\u202b\u202c\u202d\u202e'
+
+# Authors matching any of these are group system events, not people
+SYSTEM_KEYWORDS = [
+    ' changed the subject to',
+    ' changed the group icon',
+    ' added ',
+    ' left',
+    ' removed ',
+    ' joined using this group\'s invite link',
+    ' security code changed'
+]
+SYSTEM_AUTHOR_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in SYSTEM_KEYWORDS), re.IGNORECASE)
+
+# Characters read from the upload per parser step
+PARSE_CHUNK_SIZE = 1 << 20
+
+# Bump whenever analyze_sentiment output changes, so cached results from an
+# older version are never served
+ANALYSIS_VERSION = "11"
+
+# Messages per process-pool task in parallel mode
+DEFAULT_SHARD_SIZE = 50_000
+
+# Punctuation (including smart quotes) removed before word counting
+TOKEN_PUNCTUATION_MAP = str.maketrans('', '', string.punctuation + '“”')
+
+# Result sections that need per-message work (scoring, tokens, emojis, links)
+MESSAGE_SECTIONS = ('sentiment_by_person', 'emoji_stats', 'word_clouds', 'domain_stats')
+
+# Result sections computed over the messages in time order
+ORDERED_SECTIONS = ('sentiment_by_person', 'conversation_initiation', 'response_times', 'response_matrix', 'sessions')
+
+URL_PATTERN = re.compile(r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+')
+
+
+def _iter_chunks(source, chunk_size: int):
+    """
+    Yields str/bytes chunks from a string, a file-like object or an iterable of chunks.
+    """
+    if isinstance(source, (str, bytes)):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        yield from source
+
+
+def _iter_lines(chunks):
+    """
+    Splits a stream of chunks on '\\n' without materialising the whole text.
+    Bytes chunks are decoded incrementally (see ingest.StreamDecoder).
+    """
+    decoder = None
+    pending = ''
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = StreamDecoder()
+            chunk = decoder.decode(chunk)
+        if not chunk:
+            continue
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        yield from lines
+    if decoder is not None:
+        pending += decoder.decode(b'', final=True)
+    yield pending
+
+
+def normalize_domain(domain: str) -> str:
+    """
+    Normalizes domains so related hosts are grouped together.
+    Currently consolidates YouTube variants (youtube.com / youtu.be).
+    """
+    d = domain.lower()
+    if d in {"youtu.be", "youtube.com", "www.youtube.com"}:
+        return "youtube.com"
+    return d
+
+
+def extract_domains(text):
+    domains = []
+    for url in URL_PATTERN.findall(text):
+        try:
+            domain = urlparse(url).netloc
+            # Strip port if present and normalize www + case
+            if ':' in domain:
+                domain = domain.split(':', 1)[0]
+            if domain.startswith('www.'):
+                domain = domain[4:]
+            domains.append(normalize_domain(domain))
+        except:
+            pass
+    return domains
+
+
+def _no_progress(stage: str, done: int = 0, total: int = 0):
+    pass
 
-class WhatsAppAnalyzer:
-    def __init__(self):
-        self.analyzer = SentimentIntensityAnalyzer()
-        # Basic English stopwords list + User defined stopwords
-        self.stopwords = set([
-            'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't",
-            'omitted', 'media', 'image', 'video', 'sticker', 'gif',
-            # User defined stopwords
-            'laura', 'sean', 'mark', 'like', 'yeah', 'would', 'got', "it's", 'also', 'actually',
-            'get', 'yes', 'well', 'really', 'know', 'dont', 'bit', 'thats', 'could', 'going', 'one', "mark's", 'see', 'lot',
-            'say', 'said', 'thought', 'time', 'image', 'much', 'back', 'i\'m', 'hes', 'quite', 'sure', 'didnt', 'want', 'people', 'don\'t', 'thank', 'still',
-            'probably', 'great', 'thanks', 'maybe', 'make', 'you\'re', 'that\'s', 'it\'s', 'mark\'s', 'she\'s', 'even', 'need', 'she\'s', 'still',
-            'new', 'looks', 'I\'m', 'He\'s', 'say', 'first', 'last', 'Don\'t', 'Ive', 'I\'ll', 'though', 'this', 'This', 'didn\'t', 'He\'s',
-            'Think', 'Ive', 'That', 'i\'ll', 'It\'s', 'it\'s', 'Think', 'right', 'come'
-        ])
-        
-        # Normalize stopwords: lowercase and strip punctuation (including smart quotes)
-        punctuation_map = str.maketrans('', '', string.punctuation + '’‘“”')
-        self.stopwords = {
-            word.translate(punctuation_map).lower()
-            for word in self.stopwords
-        }
-        # Explicitly add common contractions without apostrophes
-        self.stopwords.update(['im', 'hes', 'she', 'shes', 'its', 'dont', 'wont', 'cant', 'youre', 'theyre', 'weve', 'youve'])
-        
-        print(f"DEBUG: Stopwords count: {len(self.stopwords)}")
-        print(f"DEBUG: Sample stopwords: {list(self.stopwords)[:10]}")
-        if 'im' in self.stopwords: print("DEBUG: 'im' is in stopwords")
-        if 'dont' in self.stopwords: print("DEBUG: 'dont' is in stopwords")
 
-    def parse_chat(self, file_content: str):
+# Process pool workers start from a fresh server process, never forked from
+# the app's threads (a fork copies locks other threads may be holding)
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Analyzer owned by each process-pool worker, built once by _init_worker
+_worker_analyzer = None
+
+
+def _init_worker():
+    global _worker_analyzer
+    _worker_analyzer = WhatsAppAnalyzer()
+
+
+def _extract_shard(store, scores=None, options=DEFAULT_OPTIONS):
+    profile = Profile()
+    features = _worker_analyzer.extract_message_features(store, profile, scores, options)
+    features['profile'] = profile.stages
+    return features
+
+
+def _merge_features(parts):
+    """
+    Combines per-shard features in shard order: per-message arrays are
+    concatenated and per-author Counters summed. Shards share one author code
+    table, so Counter insertion order is identical to a single serial pass.
+    """
+    merged = {}
+    for key in ('emojis', 'words', 'domains'):
+        if key not in parts[0]:
+            continue
+        merged[key] = parts[0][key]
+        for part in parts[1:]:
+            for total, counter in zip(merged[key], part[key]):
+                total.update(counter)
+    for key in ('sentiment_score', 'message_length'):
+        if key in parts[0]:
+            merged[key] = np.concatenate([part[key] for part in parts])
+    return merged
+
+
+class ChatParser:
+    """
+    Line parser behind parse_chat. It keeps the detected export format and the
+    dynamically excluded authors between feed() calls, so parsing can resume
+    on text appended to an export.
+
+    Parsed messages go straight into compact columns (see MessageStore):
+    author codes, UTF-8 message bytes with offsets, and codes into the
+    distinct date and time strings seen. Only the message being parsed and
+    its continuation lines are kept as Python strings.
+
+    The timestamp format (day/month order, year digits, seconds, 12/24-hour
+    clock) is detected once from the first distinct dates and times, unless
+    `stamp_format` is given; each distinct date and time is then converted
+    with that one fixed format.
+    """
+
+    def __init__(self, exclude_authors=None, line_pattern=None, profile: Profile = None,
+                 stamp_format: StampFormat = None):
+        self.exclude_authors = set(exclude_authors) if exclude_authors is not None else {'you'}
+        self.line_pattern = line_pattern
+        self.stamp_format = stamp_format
+        self.profile = profile or Profile()
+        self._author_clean_cache = {}
+        # Raw author -> stripped name, or None for group system events
+        self._author_names = {}
+        self._reset_columns()
+        # Normalized AM/PM markers by marker as written ('pm', 'p.m.', ...)
+        self._meridiems = {}
+        # Message being parsed: [date, time, author name or None, text]; continuation
+        # lines are joined onto it when the next message header arrives
+        self._pending = None
+        self._continuation = []
+        # Continuation lines seen before the first message (dropped)
+        self.unattached_lines = 0
+
+    def _reset_columns(self):
+        self._authors = {}
+        self._codes = array('i')
+        self._offsets = array('q', [0])
+        self._buffer = bytearray()
+        # Distinct date/time strings -> code, and the codes per message
+        self._dates = {}
+        self._times = {}
+        self._date_codes = array('i')
+        self._time_codes = array('i')
+
+    def _author_name(self, author: str):
+        name = self._author_names.get(author, False)
+        if name is False:
+            name = author.strip()
+            # Filter system messages
+            if SYSTEM_AUTHOR_PATTERN.search(name):
+                name = None
+            self._author_names[author] = name
+        return name
+
+    def _commit_pending(self):
+        if self._pending is None:
+            return
+        date, time, name, message = self._pending
+        if self._continuation:
+            message = ' '.join([message] + self._continuation)
+            self._continuation = []
+        self._pending = None
+        if name is None:
+            return
+
+        code = self._authors.get(name)
+        if code is None:
+            code = self._authors[name] = len(self._authors)
+        self._codes.append(code)
+        self._buffer += message.encode('utf-8')
+        self._buffer += MESSAGE_TERMINATOR
+        self._offsets.append(len(self._buffer))
+        date_code = self._dates.get(date)
+        if date_code is None:
+            date_code = self._dates[date] = len(self._dates)
+        self._date_codes.append(date_code)
+        time_code = self._times.get(time)
+        if time_code is None:
+            time_code = self._times[time] = len(self._times)
+        self._time_codes.append(time_code)
+
+    def _timestamps(self):
         """
-        Parses WhatsApp chat text content into a structured DataFrame.
+        Seconds since the epoch per parsed message, and a mask of the messages
+        whose date and time match the export's format.
         """
-        pattern1 = r'^\[(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2}(?::\d{2})?)\]\s(.*?):\s(.*)$'
-        pattern2 = r'^(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2})\s-\s(.*?):\s(.*)$'
+        with self.profile.stage('datetime'):
+            if self.stamp_format is None:
+                self.stamp_format = detect_format(self._dates, self._times)
+            dates = date_seconds(list(self._dates), self.stamp_format)[np.frombuffer(self._date_codes, dtype=np.int32)]
+            times = time_seconds(list(self._times), self.stamp_format)[np.frombuffer(self._time_codes, dtype=np.int32)]
+            # Dates are midnights, so -1 only ever marks a mismatch
+            return dates + times, (dates != -1) & (times != -1)
 
-        data = []
-        lines = file_content.split('\n')
-        
-        exclude_authors = {'you'}
-        
+    def _meridiem(self, marker: str) -> str:
+        normalized = self._meridiems.get(marker)
+        if normalized is None:
+            normalized = self._meridiems[marker] = marker.replace('.', '').upper()
+        return normalized
+
+    def feed(self, lines):
+        debug = logger.isEnabledFor(logging.DEBUG)
         for line in lines:
             line = line.strip()
             if not line:
@@ -63,311 +303,863 @@ class WhatsAppAnalyzer:
             or '\u200E\u200E' in line_lower # strip the double unicode character 
             or 'you started a video call' in line_lower):
                 continue
-            
-            match1 = re.match(pattern1, line)
-            match2 = re.match(pattern2, line)
-            
-            if match1:
-                date, time, author, message = match1.groups()
-                
-                # Dynamic Exclusion: Check for encryption message
-                if 'messages and calls are end-to-end encrypted' in message.lower():
-                     # Strip invisible Unicode characters
-                    author_clean = ''.join(c for c in author if unicodedata.category(c)[0] != 'C').strip().lower()
-                    print(f"DEBUG: Found encryption message from '{author}'. Adding '{author_clean}' to exclude_authors.")
-                    exclude_authors.add(author_clean)
-                    continue
-
-                # Strip invisible Unicode characters (like zero-width spaces, LTR marks, etc.)
-                author_clean = ''.join(c for c in author if unicodedata.category(c)[0] != 'C').strip().lower()
-                if author_clean in exclude_authors:
-                    print(f"DEBUG: Filtered out author '{author}' (cleaned: '{author_clean}')")
-                    continue
-                data.append({'date': date, 'time': time, 'author': author, 'message': message})
-            elif match2:
-                date, time, author, message = match2.groups()
-
-                # Dynamic Exclusion: Check for encryption message
-                if 'messages and calls are end-to-end encrypted' in message.lower():
-                     # Strip invisible Unicode characters
-                    author_clean = ''.join(c for c in author if unicodedata.category(c)[0] != 'C').strip().lower()
-                    print(f"DEBUG: Found encryption message from '{author}'. Adding '{author_clean}' to exclude_authors.")
-                    exclude_authors.add(author_clean)
-                    continue
-
-                # Strip invisible Unicode characters
+            line = line.lstrip(BIDI_MARKS)
+
+            # The export format is detected on the first message line; afterwards
+            # only that pattern is tried (the other one is a fallback for stray
+            # continuation lines, and fails on the first character).
+            match = self.line_pattern.match(line) if self.line_pattern is not None else None
+            if match is None:
+                for pattern in LINE_PATTERNS:
+                    if pattern is self.line_pattern:
+                        continue
+                    match = pattern.match(line)
+                    if match:
+                        if self.line_pattern is None:
+                            self.line_pattern = pattern
+                        break
+
+            if match is None:
+                if self._pending is not None:
+                    self._continuation.append(line)
+                else:
+                    self.unattached_lines += 1
+                continue
+
+            date, time, meridiem, author, message = match.groups()
+            if meridiem is not None:
+                time = time + ' ' + self._meridiem(meridiem)
+
+            # Strip invisible Unicode characters (like zero-width spaces, LTR marks, etc.)
+            author_clean = self._author_clean_cache.get(author)
+            if author_clean is None:
                 author_clean = ''.join(c for c in author if unicodedata.category(c)[0] != 'C').strip().lower()
-                if author_clean in exclude_authors:
-                    print(f"DEBUG: Filtered out author '{author}' (cleaned: '{author_clean}')")
-                    continue
-                data.append({'date': date, 'time': time, 'author': author, 'message': message})
+                self._author_clean_cache[author] = author_clean
+
+            # Dynamic Exclusion: Check for encryption message
+            if 'messages and calls are end-to-end encrypted' in message.lower():
+                logger.info("Found encryption message from %r, excluding author %r", author, author_clean)
+                self.exclude_authors.add(author_clean)
+                continue
+
+            if author_clean in self.exclude_authors:
+                if debug:
+                    logger.debug("Filtered out author %r (cleaned: %r)", author, author_clean)
+                continue
+
+            self._commit_pending()
+            self._pending = [date, time, self._author_name(author), message]
+
+    def to_store(self) -> MessageStore:
+        """
+        Returns the parsed messages, minus system messages and messages
+        without a valid timestamp, and starts a new set of columns.
+        """
+        self._commit_pending()
+        if not self._codes:
+            self._reset_columns()
+            return MessageStore.empty()
+
+        timestamps, valid = self._timestamps()
+        store = MessageStore(
+            list(self._authors),
+            np.frombuffer(self._codes, dtype=np.int32),
+            timestamps,
+            np.frombuffer(self._offsets, dtype=np.int64),
+            self._buffer,
+        )
+        self._reset_columns()
+        if not valid.all():
+            store = store.select(valid)
+        return store
+
+    def parse(self, source, chunk_size: int = PARSE_CHUNK_SIZE) -> MessageStore:
+        """
+        Feeds all of `source` (see _iter_chunks) and returns the store.
+        """
+        with self.profile.stage('parse'):
+            self.feed(_iter_lines(_iter_chunks(source, chunk_size)))
+            return self.to_store()
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns the parsed messages as a DataFrame (see MessageStore.to_frame).
+        """
+        return self.to_store().to_frame()
+
+
+def _skip_chars(chunks, count: int):
+    """
+    Yields the text of a stream of chunks after its first `count` characters.
+    Bytes chunks are decoded incrementally (see ingest.StreamDecoder).
+    """
+    decoder = StreamDecoder()
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        if count:
+            skipped = min(count, len(chunk))
+            chunk, count = chunk[skipped:], count - skipped
+        if chunk:
+            yield chunk
+    rest = decoder.decode(b'', final=True)[count:]
+    if rest:
+        yield rest
+
+
+class ExportScan:
+    """
+    First pass over an export in chunks (feed(), then close()): decodes and
+    hashes it without parsing anything, so the parsed-chat cache and earlier
+    analyses of the same chat can be looked up before any parsing. Records the
+    size in bytes, the length in characters and lines, the SHA-256 digest of
+    the text and its chat key (see state.chat_key). Bytes chunks are decoded
+    with ingest.StreamDecoder.
+
+    Once the chat key is known, `take_state(chat_key)` may return the
+    AnalysisState of an earlier export of the same chat; `resumes` is then
+    True if this export is that one plus appended lines (see
+    AnalysisState.can_resume).
+    """
+
+    def __init__(self, take_state=None, profile: Profile = None):
+        self.profile = profile or Profile()
+        self.size = 0
+        self.chars = 0
+        self.lines = 0
+        self.chat = None
+        self.digest = None
+        self.state = None
+        self.resumes = False
+        # The whole export's store, once analyze_source has loaded or parsed it
+        self.store = None
+        self._take_state = take_state
+        self._decoder = StreamDecoder()
+        self._hash = hashlib.sha256()
+        # Text held back until the chat key is known
+        self._head = ''
+        # consumed_chars of self.state, and what this export has there
+        self._resume_at = None
+        self._prefix_matches = False
+        self._before = None
+        self._after = None
+
+    def feed(self, chunk):
+        with self.profile.stage('digest'):
+            if isinstance(chunk, bytes):
+                self.size += len(chunk)
+                chunk = self._decoder.decode(chunk)
             else:
-                if data:
-                    data[-1]['message'] += f" {line}"
-
-        df = pd.DataFrame(data)
-        if not df.empty:
-            df['datetime'] = pd.to_datetime(df['date'] + ' ' + df['time'], dayfirst=True, errors='coerce')
-            df = df.dropna(subset=['datetime'])
-            
-            # Robust Filtering
-            # 1. Strip whitespace and normalize
-            df['author'] = df['author'].str.strip()
-            
-            # 2. Filter specific names (case insensitive) - AGGRESSIVE
-            # (Moved to early filtering loop for efficiency and correctness)
-            
-            # 3. Filter system messages
-            system_keywords = [
-                ' changed the subject to',
-                ' changed the group icon',
-                ' added ',
-                ' left',
-                ' removed ',
-                ' joined using this group\'s invite link',
-                ' security code changed'
-            ]
-            for keyword in system_keywords:
-                df = df[~df['author'].str.contains(keyword, case=False)]
-        
-        return df
-
-    def analyze_sentiment(self, df: pd.DataFrame):
+                self.size += len(chunk.encode('utf-8'))
+            if not chunk:
+                return
+            if self.chat is None:
+                self._head += chunk
+                if self._head.find('\n', 0, CHAT_KEY_CHARS) == -1 and len(self._head) < CHAT_KEY_CHARS:
+                    return
+                chunk, self._head = self._head, ''
+                self._identify(chunk)
+            self._consume(chunk)
+
+    def close(self):
+        self.feed(self._decoder.decode(b'', final=True))
+        with self.profile.stage('digest'):
+            if self.chat is None:
+                text, self._head = self._head, ''
+                self._identify(text)
+                self._consume(text)
+            self.digest = self._hash.hexdigest()
+            # The appended tail has to start on a fresh line
+            self.resumes = (
+                self._resume_at is not None and self.chars >= self._resume_at and self._prefix_matches
+                and (self._before == '\n' or self._after is None or self._after == '\n')
+            )
+
+    def _identify(self, head: str):
+        self.chat = chat_key(head)
+        state = self._take_state(self.chat) if self._take_state is not None else None
+        if state is not None:
+            self.state = state
+            if state.prefix_digest is not None and state.consumed_chars > 0:
+                self._resume_at = state.consumed_chars
+
+    def _consume(self, text: str):
+        start, end = self.chars, self.chars + len(text)
+        at = self._resume_at
+        if at is not None and start < at <= end:
+            # The state's export ends in this chunk: compare hashes there
+            self._hash.update(text[:at - start].encode('utf-8'))
+            self._prefix_matches = self._hash.hexdigest() == self.state.prefix_digest
+            self._before = text[at - start - 1]
+            self._hash.update(text[at - start:].encode('utf-8'))
+        else:
+            self._hash.update(text.encode('utf-8'))
+        if at is not None and start <= at < end and self._after is None:
+            self._after = text[at - start]
+        self.chars = end
+        self.lines += text.count('\n')
+
+
+class WhatsAppAnalyzer:
+    def __init__(self, workers: int = 0, shard_size: int = DEFAULT_SHARD_SIZE, parsed_cache=None):
+        """
+        `workers` > 1 enables parallel mode: the per-message stages of
+        analyze_sentiment run on a process pool of that size, in shards of
+        `shard_size` messages. The pool is created on first use and reused
+        until close().
+
+        With a `parsed_cache` (see cache.ParsedChatCache), analyze_incremental
+        and analyze_source store every parsed export with its sentiment scores, and loads them
+        instead of parsing and scoring when the same export comes back.
+        """
+        self.workers = workers
+        self.shard_size = shard_size
+        self.parsed_cache = parsed_cache
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.analyzer = SentimentIntensityAnalyzer()
+        self.scorer = BatchSentimentScorer(self.analyzer)
+        self.emoji_matcher = EmojiMatcher()
+
+    def parse_chat(self, file_content, chunk_size: int = PARSE_CHUNK_SIZE):
+        """
+        Parses WhatsApp chat text content into a structured DataFrame.
+
+        `file_content` may be a str/bytes, a file-like object or an iterable of
+        str/bytes chunks; it is consumed `chunk_size` characters at a time so
+        the parser never holds more than one chunk plus the parsed columns.
+        """
+        return self.parse_store(file_content, chunk_size).to_frame()
+
+    def parse_store(self, file_content, chunk_size: int = PARSE_CHUNK_SIZE) -> MessageStore:
+        """
+        Like parse_chat, but returns the compact MessageStore analysis works on.
+        """
+        return ChatParser().parse(file_content, chunk_size)
+
+    def close(self):
+        """
+        Shuts down the parallel-mode process pool, if one was started.
+        """
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker,
+                    mp_context=multiprocessing.get_context(POOL_START_METHOD),
+                )
+            return self._pool
+
+    def extract_message_features(self, store: MessageStore, profile: Profile = None, scores: np.ndarray = None,
+                                 options: AnalysisOptions = None):
+        """
+        Runs the per-message stages the sections of `options` need in a
+        single pass over the messages of `store`: word count and filtered word
+        tokens, while collecting the candidates for emoji and link domain
+        extraction, which then run over those messages only; plus the batched
+        sentiment scores, unless already known (`scores`).
+
+        The emoji, word and domain Counters are accumulated per author code.
+        Features of sections not asked for are left out.
+        """
+        profile = profile or Profile()
+        options = options or DEFAULT_OPTIONS
+        want_sentiment = options.wants('sentiment_by_person')
+        want_words = options.wants('word_clouds')
+        want_emojis = options.wants('emoji_stats')
+        want_domains = options.wants('domain_stats')
+        features = {}
+        if scores is not None:
+            features['sentiment_score'] = scores
+        if not (want_sentiment or want_words or want_emojis or want_domains):
+            return features
+
+        messages = store.messages()
+        n_authors = len(store.authors)
+
+        with profile.stage('words'):
+            user_words = [Counter() for _ in range(n_authors)]
+            stopwords = options.word_stopwords
+            message_lengths = []
+            emoji_messages = [[] for _ in range(n_authors)]
+            link_messages = [[] for _ in range(n_authors)]
+            for code, message in zip(store.author_codes.tolist(), messages):
+                if want_sentiment:
+                    message_lengths.append(len(message.split()))
+
+                if want_words:
+                    # Remove punctuation (including smart quotes) and convert to lower case
+                    tokens = message.translate(TOKEN_PUNCTUATION_MAP).lower().split()
+                    user_words[code].update([t for t in tokens if t not in stopwords and len(t) > 2])
+
+                # Cheap guards: emojis are never ASCII, links always contain "http"
+                if want_emojis and not message.isascii():
+                    emoji_messages[code].append(message)
+                if want_domains and 'http' in message:
+                    link_messages[code].append(message)
+
+        if want_sentiment:
+            features['message_length'] = np.array(message_lengths, dtype=np.int64)
+        if want_words:
+            features['words'] = user_words
+
+        if want_emojis:
+            with profile.stage('emoji'):
+                # One regex scan per author over all of their non-ASCII messages
+                features['emojis'] = [self.emoji_matcher.count(batch) for batch in emoji_messages]
+
+        if want_domains:
+            with profile.stage('domains'):
+                features['domains'] = [
+                    Counter(domain for message in batch for domain in extract_domains(message))
+                    for batch in link_messages
+                ]
+
+        if want_sentiment and scores is None:
+            with profile.stage('sentiment'):
+                # Whole batch at once, see BatchSentimentScorer
+                features['sentiment_score'] = self.scorer.score_batch(messages)
+
+        return features
+
+    def _message_features(self, store: MessageStore, progress=_no_progress, profile: Profile = None,
+                          scores: np.ndarray = None, options: AnalysisOptions = DEFAULT_OPTIONS):
+        """
+        Per-message features of `store`, computed shard by shard so only one
+        shard's messages exist as Python strings at a time. In parallel mode
+        the shards are spread across the process pool. Reports
+        progress('scoring', messages done, total) after every shard.
+        """
+        total = len(store)
+        if not any(options.wants(section) for section in MESSAGE_SECTIONS):
+            return {}
+        starts = range(0, total, self.shard_size)
+        score_shards = [None if scores is None else scores[i:i + self.shard_size] for i in starts]
+        progress('scoring', 0, total)
+        if self.workers > 1 and total > self.shard_size:
+            try:
+                parts = []
+                shards = self._get_pool().map(
+                    _extract_shard, [store.slice(i, i + self.shard_size) for i in starts], score_shards,
+                    [options] * len(starts),
+                )
+                for start, part in zip(starts, shards):
+                    # Worker stage times are CPU time summed across processes
+                    if profile is not None:
+                        profile.merge(part.pop('profile'))
+                    parts.append(part)
+                    progress('scoring', min(start + self.shard_size, total), total)
+                return _merge_features(parts)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool next time
+                # and finish this request serially.
+                logger.warning("Process pool broken, falling back to serial analysis")
+                self.close()
+        parts = []
+        for start, shard_scores in zip(starts, score_shards):
+            shard = store.slice(start, start + self.shard_size)
+            parts.append(self.extract_message_features(shard, profile, shard_scores, options))
+            progress('scoring', min(start + self.shard_size, total), total)
+        return parts[0] if len(parts) == 1 else _merge_features(parts)
+
+    def analyze_sentiment(self, df: pd.DataFrame, options: AnalysisOptions = None):
+        """
+        Analyzes parsed messages (see parse_chat). `options` sets the
+        thresholds and which sections to compute (default: all).
+        """
         if df.empty:
             return {}
 
-        # Calculate sentiment scores
-        df['sentiment_score'] = df['message'].apply(lambda x: self.analyzer.polarity_scores(str(x))['compound'])
-        
-        def categorize_sentiment(score):
-            if score >= 0.05: return 'positive'
-            elif score <= -0.05: return 'negative'
-            else: return 'neutral'
-        
-        df['sentiment_category'] = df['sentiment_score'].apply(categorize_sentiment)
-        
+        state = AnalysisState(options=options or DEFAULT_OPTIONS)
+        self._accumulate(state, MessageStore.from_frame(df))
+        return self._build_results(state)
+
+    def analyze_incremental(self, file_content: str, state: AnalysisState = None, progress=None,
+                            profile: Profile = None, options: AnalysisOptions = None):
+        """
+        Parses and analyzes a chat export, resuming from `state` when possible.
+
+        If `file_content` is the export `state` was built from plus appended
+        messages, and `state` was accumulated with options that cover
+        `options` (see AnalysisOptions.accumulates), only the appended tail is
+        parsed and scored; otherwise the whole export is analyzed from
+        scratch. Returns (results, state). The given state is updated in
+        place, so it must not be shared between concurrent calls.
+
+        A full analysis is served from, or stored in, the parsed-chat cache
+        (if configured), keyed by the hash of `file_content`.
+
+        `progress(stage, done, total)` is called as the analysis moves through
+        the 'parsing', 'scoring' and 'aggregating' stages. Stage timings and
+        counts are recorded in `profile`, if given.
+        """
+        progress = progress or _no_progress
+        profile = profile or Profile()
+        options = options or DEFAULT_OPTIONS
+        progress('parsing')
+        if state is not None and state.options.accumulates(options) and state.can_resume(file_content):
+            tail = file_content[state.consumed_chars:]
+            parser = ChatParser(state.exclude_authors, state.line_pattern, profile, state.stamp_format)
+            store = parser.parse(tail)
+            if self._resume(state, parser, store, progress, profile):
+                profile.count('characters', len(tail))
+                state.mark_consumed(file_content)
+                return self._build_results(state, profile, options), state
+
+        state = AnalysisState(options=options)
+        # The content hash doubles as the parsed-chat cache key
+        state.mark_consumed(file_content)
+        profile.count('characters', len(file_content))
+
+        def parse():
+            parser = ChatParser(profile=profile)
+            return parser, parser.parse(file_content)
+
+        self._analyze_export(state, parse, progress, profile)
+        return self._build_results(state, profile, options), state
+
+    def analyze_source(self, read, take_state=None, progress=None, profile: Profile = None,
+                       options: AnalysisOptions = None, admit=None, resume: bool = True, scan: ExportScan = None):
+        """
+        Analyzes an export that can be read more than once, such as a spooled
+        upload or a file: `read()` returns a fresh iterable of its str/bytes
+        chunks, so the text is never held whole.
+
+        A first pass only decodes and hashes it (see ExportScan), taking the
+        state of an earlier export of the same chat with
+        `take_state(chat_key)`. Then, in order of preference: only the
+        appended tail is parsed and the state resumed (unless `resume` is
+        False), or the parsed chat is loaded from the parsed-chat cache, or
+        the whole export is parsed. `admit(scan)` is called between the two
+        passes, e.g. to reserve memory for the parse; it may raise to stop.
+        A `scan` already fed the whole export and closed (e.g. while the
+        export was received) replaces the first pass; `take_state` is then
+        not used.
+
+        Returns (results, state, scan); `scan.store` is the whole export's
+        store unless the state was resumed. Reports progress and stages like
+        analyze_incremental.
+        """
+        progress = progress or _no_progress
+        profile = profile or Profile()
+        options = options or DEFAULT_OPTIONS
+        progress('parsing')
+        if scan is None:
+            scan = ExportScan(take_state, profile)
+            for chunk in read():
+                scan.feed(chunk)
+            scan.close()
+        if admit is not None:
+            admit(scan)
+
+        state = scan.state
+        if resume and scan.resumes and state.options.accumulates(options):
+            consumed_chars = state.consumed_chars
+            parser = ChatParser(state.exclude_authors, state.line_pattern, profile, state.stamp_format)
+            store = parser.parse(_skip_chars(read(), consumed_chars))
+            if self._resume(state, parser, store, progress, profile):
+                profile.count('characters', scan.chars - consumed_chars)
+                state.mark_streamed(scan.chars, scan.digest)
+                return self._build_results(state, profile, options), state, scan
+
+        state = AnalysisState(options=options)
+        state.mark_streamed(scan.chars, scan.digest)
+        profile.count('characters', scan.chars)
+
+        def parse():
+            parser = ChatParser(profile=profile)
+            return parser, parser.parse(read())
+
+        scan.store = self._analyze_export(state, parse, progress, profile)
+        return self._build_results(state, profile, options), state, scan
+
+    def _resume(self, state: AnalysisState, parser: ChatParser, store: MessageStore, progress, profile: Profile) -> bool:
+        """
+        Accumulates `store`, parsed by `parser` from the text appended to the
+        export of `state`, and adopts the parser's settings. False (and
+        `state` untouched) if the tail cannot continue the state.
+        """
+        # Day-first was only assumed: the tail's dates may prove it wrong,
+        # which would change every timestamp accumulated so far
+        if state.stamp_format is not None and not state.stamp_format.order_detected:
+            return False
+        # The tail must start with a new message and must not go back in
+        # time, otherwise earlier aggregates would change
+        resumable = parser.unattached_lines == 0 and (
+            not len(store) or state.last_datetime is None
+            or pd.Timestamp(store.timestamps.min(), unit='s') >= state.last_datetime
+        )
+        if not resumable:
+            return False
+        self._accumulate(state, store, progress, profile)
+        state.exclude_authors = parser.exclude_authors
+        state.line_pattern = parser.line_pattern
+        state.stamp_format = parser.stamp_format
+        return True
+
+    def _analyze_export(self, state: AnalysisState, parse, progress, profile: Profile):
+        """
+        Analyzes a whole export into the fresh `state`, which is marked as
+        consuming it: from the parsed-chat cache when it has the export,
+        otherwise from `parse()`, which returns (parser, store). Returns the
+        export's store.
+        """
+        cached = self._load_parsed(state, profile)
+        if cached is not None:
+            store, scores = cached
+            self._accumulate(state, store, progress, profile, scores)
+            return store
+
+        parser, store = parse()
+        state.exclude_authors = parser.exclude_authors
+        state.line_pattern = parser.line_pattern
+        state.stamp_format = parser.stamp_format
+        features = self._accumulate(state, store, progress, profile)
+        # Only exports that were scored are cached (scores are what it saves)
+        if features is not None and 'sentiment_score' in features and self.parsed_cache is not None:
+            with profile.stage('cache'):
+                self.parsed_cache.put(state.prefix_digest, store, features['sentiment_score'], {
+                    'exclude_authors': sorted(state.exclude_authors),
+                    'line_pattern': LINE_PATTERNS.index(state.line_pattern),
+                    'stamp_format': asdict(state.stamp_format),
+                })
+        return store
+
+    def _load_parsed(self, state: AnalysisState, profile: Profile):
+        """
+        The cached (store, scores) of the export `state` was just marked as
+        consuming, restoring the parser settings into `state`; or None.
+        """
+        if self.parsed_cache is None:
+            return None
+        with profile.stage('cache'):
+            cached = self.parsed_cache.get(state.prefix_digest)
+        if cached is None:
+            return None
+        store, scores, meta = cached
+        state.exclude_authors = set(meta['exclude_authors'])
+        state.line_pattern = LINE_PATTERNS[meta['line_pattern']]
+        state.stamp_format = StampFormat(**meta['stamp_format'])
+        return store, scores
+
+    def _accumulate(self, state: AnalysisState, store: MessageStore, progress=_no_progress,
+                    profile: Profile = None, scores: np.ndarray = None):
+        """
+        Adds the messages of `store` (in export order, not earlier than
+        anything already in `state`) to the running per-author accumulators
+        of the sections in `state.options`. Returns the per-message features,
+        or None for an empty store.
+        """
+        if not len(store):
+            return None
+        profile = profile or Profile()
+        profile.count('messages', len(store))
+
+        # Per-message stages, sharded across the process pool in parallel mode
+        features = self._message_features(store, progress, profile, scores, state.options)
+        progress('aggregating')
+        with profile.stage('aggregate'):
+            self._accumulate_features(state, store, features, profile)
+        return features
+
+    def _accumulate_features(self, state: AnalysisState, store: MessageStore, features: dict, profile: Profile):
+        """
+        Folds per-message features into the per-author accumulators of `state`.
+        """
+        options = state.options
+        codes = store.author_codes
+        n_authors = len(store.authors)
+        stats = [state.author(author) for author in store.authors]
+        timestamps = store.timestamps
+        counts = np.bincount(codes, minlength=n_authors)
+
+        # --- Per-author sums and counts ---
+        if options.wants('sentiment_by_person'):
+            scores = features['sentiment_score']
+            positive = scores >= options.sentiment_threshold
+            negative = (scores <= -options.sentiment_threshold) & ~positive
+            # (pandas' compensated group sum, so averages match a DataFrame groupby mean)
+            sentiment_sums = pd.Series(scores).groupby(codes).sum().to_numpy()
+            length_sums = np.bincount(codes, weights=features['message_length'], minlength=n_authors)
+            positives = np.bincount(codes[positive], minlength=n_authors)
+            negatives = np.bincount(codes[negative], minlength=n_authors)
+            for code, author_stats in enumerate(stats):
+                author_stats.sentiment_sum += float(sentiment_sums[code])
+                author_stats.length_sum += int(length_sums[code])
+                author_stats.positive += int(positives[code])
+                author_stats.negative += int(negatives[code])
+                author_stats.neutral += int(counts[code] - positives[code] - negatives[code])
+
+        if options.wants('hourly_activity'):
+            with profile.stage('hourly'):
+                hours = store.hours()
+                hourly = np.bincount(codes * 24 + hours, minlength=n_authors * 24).reshape(n_authors, 24)
+                for code, author_stats in enumerate(stats):
+                    author_stats.hourly = [total + int(count) for total, count in zip(author_stats.hourly, hourly[code])]
+
+        # --- Response times, conversation starts and sessions, continuing from the last message ---
+        if any(options.wants(section) for section in ORDERED_SECTIONS):
+            with profile.stage('response_times'):
+                order = np.argsort(timestamps, kind='stable')
+                sorted_timestamps = timestamps[order]
+                sorted_codes = codes[order]
+                prev_timestamps = np.roll(sorted_timestamps, 1)
+                # -1 stands for an author outside this batch, -2 for "no previous message"
+                prev_codes = np.roll(sorted_codes, 1)
+                if state.last_datetime is None:
+                    prev_codes[0] = -2
+                else:
+                    prev_timestamps[0] = int(state.last_datetime.timestamp())
+                    prev_codes[0] = store.authors.index(state.last_author) if state.last_author in store.authors else -1
+
+                # Calculate time difference in minutes
+                time_diff = (sorted_timestamps - prev_timestamps) / 60
+                has_prev = prev_codes != -2
+
+            if options.wants('sentiment_by_person'):
+                with profile.stage('response_times'):
+                    # Filter: only consider it a "response" if previous author was different
+                    # Also filter out long gaps (the response window, 12 hours by default) as
+                    # that's likely a new conversation, not a response
+                    is_response = has_prev & (sorted_codes != prev_codes) & (time_diff <= options.response_window_minutes)
+                    response_sums = pd.Series(time_diff[is_response]).groupby(sorted_codes[is_response]).sum()
+                    response_counts = np.bincount(sorted_codes[is_response], minlength=n_authors)
+                    for code, author_stats in enumerate(stats):
+                        if response_counts[code]:
+                            author_stats.response_time_sum += float(response_sums[code])
+                            author_stats.responses += int(response_counts[code])
+
+            # Define conversation start as first message after a gap of silence (3 hours by default)
+            if options.wants('conversation_initiation'):
+                with profile.stage('initiation'):
+                    is_conversation_start = has_prev & (time_diff > (options.conversation_gap_hours * 60))
+                    conversation_starts = np.bincount(sorted_codes[is_conversation_start], minlength=n_authors)
+                    for code, author_stats in enumerate(stats):
+                        author_stats.conversations_started += int(conversation_starts[code])
+
+            # Who replies to whom: response times per (responder, replied-to) pair
+            if options.wants('response_times') or options.wants('response_matrix'):
+                with profile.stage('response_times'):
+                    is_response = has_prev & (sorted_codes != prev_codes) & (time_diff <= options.response_window_minutes)
+                    state.responses.add(
+                        sorted_codes[is_response], prev_codes[is_response],
+                        (sorted_timestamps - prev_timestamps)[is_response], store.authors, state.last_author,
+                    )
+
+            # Sessions split at the same gaps of silence as conversation starts
+            if options.wants('sessions'):
+                with profile.stage('sessions'):
+                    session_starts = ~has_prev | (time_diff > (options.conversation_gap_hours * 60))
+                    state.sessions.add(sorted_timestamps, sorted_codes, store.authors, session_starts)
+
+            first_timestamp, last_timestamp = sorted_timestamps[0], sorted_timestamps[-1]
+            last_code = sorted_codes[-1]
+        else:
+            # Same first/last message as the stable sort above, without sorting
+            first_timestamp, last_timestamp = timestamps.min(), timestamps.max()
+            last_code = codes[len(timestamps) - 1 - np.argmax(timestamps[::-1])]
+
+        for code, author_stats in enumerate(stats):
+            author_stats.messages += int(counts[code])
+            if 'emojis' in features:
+                author_stats.emojis.update(features['emojis'][code])
+            if 'words' in features:
+                author_stats.words.update(features['words'][code])
+            if 'domains' in features:
+                author_stats.domains.update(features['domains'][code])
+
+        first_datetime = pd.Timestamp(first_timestamp, unit='s')
+        if state.first_datetime is None or first_datetime < state.first_datetime:
+            state.first_datetime = first_datetime
+        state.last_datetime = pd.Timestamp(last_timestamp, unit='s')
+        state.last_author = store.authors[last_code]
+        state.total_messages += len(store)
+        state.store_bytes += store.nbytes
+
+    def _build_results(self, state: AnalysisState, profile: Profile = None, options: AnalysisOptions = None):
+        if state.total_messages == 0:
+            return {}
+        profile = profile or Profile()
+        options = options or state.options
+        results = {}
+
+        authors = list(state.authors)
+        stats = list(state.authors.values())
+
         # --- 1. Sentiment by Person & Message Length ---
-        df['message_length'] = df['message'].apply(lambda x: len(str(x).split()))
-        
-        sentiment_by_person = df.groupby('author').agg({
-            'sentiment_score': 'mean',
-            'message': 'count',
-            'message_length': 'mean'
-        }).reset_index()
-        
-        sentiment_by_person = sentiment_by_person.rename(columns={
-            'sentiment_score': 'average_sentiment', 
-            'message': 'total_messages',
-            'message_length': 'avg_message_length'
-        })
-        
-        # Calculate distribution
-        sentiment_dist = df.groupby(['author', 'sentiment_category']).size().unstack(fill_value=0).reset_index()
-        sentiment_by_person = pd.merge(sentiment_by_person, sentiment_dist, on='author', how='left')
-        
-        for cat in ['positive', 'neutral', 'negative']:
-            if cat not in sentiment_by_person.columns:
-                sentiment_by_person[cat] = 0
-            sentiment_by_person[f'{cat}_pct'] = (sentiment_by_person[cat] / sentiment_by_person['total_messages'] * 100)
-
-        sentiment_by_person = sentiment_by_person.sort_values('average_sentiment', ascending=False)
+        if options.wants('sentiment_by_person'):
+            with profile.stage('aggregate'):
+                sentiment_by_person = pd.DataFrame({
+                    'author': authors,
+                    'average_sentiment': [s.sentiment_sum / s.messages for s in stats],
+                    'total_messages': [s.messages for s in stats],
+                    'avg_message_length': [s.length_sum / s.messages for s in stats],
+                }).sort_values('author').reset_index(drop=True)
+
+                # Calculate distribution (only categories that occur, like an unstack would)
+                order = sentiment_by_person['author'].map({author: i for i, author in enumerate(authors)})
+                for cat in ['negative', 'neutral', 'positive']:
+                    counts = [getattr(stats[i], cat) for i in order]
+                    if any(counts):
+                        sentiment_by_person[cat] = counts
+
+                for cat in ['positive', 'neutral', 'negative']:
+                    if cat not in sentiment_by_person.columns:
+                        sentiment_by_person[cat] = 0
+                    sentiment_by_person[f'{cat}_pct'] = (sentiment_by_person[cat] / sentiment_by_person['total_messages'] * 100)
+
+                sentiment_by_person = sentiment_by_person.sort_values('average_sentiment', ascending=False)
 
         # --- 2. Hourly Activity (Per User) ---
-        df['hour'] = df['datetime'].dt.hour
-        
-        # Group by hour AND author
-        hourly_activity = df.groupby(['hour', 'author']).size().reset_index(name='count')
-        
-        # Pivot to have authors as columns
-        hourly_activity_pivot = hourly_activity.pivot(index='hour', columns='author', values='count').fillna(0).reset_index()
-        
-        # Ensure all hours 0-23 are present
-        all_hours = pd.DataFrame({'hour': range(24)})
-        hourly_activity_final = pd.merge(all_hours, hourly_activity_pivot, on='hour', how='left').fillna(0)
-        
-        # Convert to list of dicts
-        hourly_activity_data = hourly_activity_final.to_dict(orient='records')
+        if options.wants('hourly_activity'):
+            with profile.stage('hourly'):
+                hourly_activity = pd.DataFrame(
+                    [(hour, author, count) for author, s in zip(authors, stats) for hour, count in enumerate(s.hourly) if count],
+                    columns=['hour', 'author', 'count']
+                ).sort_values(['hour', 'author'])
+
+                # Pivot to have authors as columns
+                hourly_activity_pivot = hourly_activity.pivot(index='hour', columns='author', values='count').fillna(0).reset_index()
+
+                # Ensure all hours 0-23 are present
+                all_hours = pd.DataFrame({'hour': range(24)})
+                hourly_activity_final = pd.merge(all_hours, hourly_activity_pivot, on='hour', how='left').fillna(0)
+
+                # Convert to list of dicts
+                hourly_activity_data = hourly_activity_final.to_dict(orient='records')
+            results['hourly_activity'] = hourly_activity_data
 
         # --- 3. Response Time Analysis ---
-        df_sorted = df.sort_values('datetime')
-        df_sorted['prev_datetime'] = df_sorted['datetime'].shift(1)
-        df_sorted['prev_author'] = df_sorted['author'].shift(1)
-        
-        # Calculate time difference in minutes
-        df_sorted['time_diff'] = (df_sorted['datetime'] - df_sorted['prev_datetime']).dt.total_seconds() / 60
-        
-        # Filter: only consider it a "response" if previous author was different
-        # Also filter out very long gaps (e.g. > 12 hours) as that's likely a new conversation, not a response
-        response_times = df_sorted[
-            (df_sorted['author'] != df_sorted['prev_author']) & 
-            (df_sorted['prev_author'].notna()) &
-            (df_sorted['time_diff'] <= 720) # 12 hours
-        ]
-        
-        avg_response_times = response_times.groupby('author')['time_diff'].mean().reset_index()
-        avg_response_times.columns = ['author', 'avg_response_time_minutes']
-        avg_response_times = avg_response_times.sort_values('avg_response_time_minutes')
-        
-        # Merge response times into sentiment_by_person for easier frontend handling
-        sentiment_by_person = pd.merge(sentiment_by_person, avg_response_times, on='author', how='left').fillna(0)
+        if options.wants('sentiment_by_person'):
+            with profile.stage('response_times'):
+                # Merge response times into sentiment_by_person for easier frontend handling
+                avg_response_times = {
+                    author: s.response_time_sum / s.responses
+                    for author, s in zip(authors, stats) if s.responses
+                }
+                sentiment_by_person['avg_response_time_minutes'] = sentiment_by_person['author'].map(avg_response_times).astype('float64')
+                sentiment_by_person = sentiment_by_person.fillna(0)
+            results['sentiment_by_person'] = sentiment_by_person.to_dict(orient='records')
 
         # --- 3.5 Conversation Initiation Analysis ---
-        # Define conversation start as first message after 3+ hours of silence
-        conversation_gap_hours = 3
-        df_sorted['is_conversation_start'] = df_sorted['time_diff'] > (conversation_gap_hours * 60)
-        
-        # Count conversation initiations per author
-        conversation_starts = df_sorted[df_sorted['is_conversation_start'] == True].groupby('author').size().reset_index(name='conversations_started')
-        
-        # Calculate total conversations
-        total_conversations = conversation_starts['conversations_started'].sum()
-        
-        # Calculate percentage for each author
-        if total_conversations > 0:
-            conversation_starts['initiation_percentage'] = (conversation_starts['conversations_started'] / total_conversations * 100).round(1)
-        else:
-            conversation_starts['initiation_percentage'] = 0
-        conversation_starts = conversation_starts.sort_values('conversations_started', ascending=False)
+        if options.wants('conversation_initiation'):
+            with profile.stage('initiation'):
+                conversation_starts = pd.DataFrame(
+                    [(author, s.conversations_started) for author, s in zip(authors, stats) if s.conversations_started],
+                    columns=['author', 'conversations_started']
+                ).sort_values('author').reset_index(drop=True)
+
+                # Calculate total conversations
+                total_conversations = conversation_starts['conversations_started'].sum()
+
+                # Calculate percentage for each author
+                if total_conversations > 0:
+                    conversation_starts['initiation_percentage'] = (conversation_starts['conversations_started'] / total_conversations * 100).round(1)
+                else:
+                    conversation_starts['initiation_percentage'] = 0
+                conversation_starts = conversation_starts.sort_values('conversations_started', ascending=False)
+            results['conversation_initiation'] = conversation_starts.to_dict(orient='records')
+
+        # --- 3.6 Response Time Distribution & Who Replies to Whom ---
+        if options.wants('response_times') or options.wants('response_matrix'):
+            with profile.stage('response_times'):
+                if options.wants('response_times'):
+                    results['response_times'] = state.responses.by_person()
+                if options.wants('response_matrix'):
+                    results['response_matrix'] = state.responses.matrix()
+
+        # --- 3.7 Conversation Sessions ---
+        if options.wants('sessions'):
+            with profile.stage('sessions'):
+                results['sessions'] = state.sessions.summary()
 
         # --- 4. Emoji Analysis ---
-        def extract_emojis(text):
-            return [c for c in text if c in emoji.EMOJI_DATA]
-
-        all_emojis = []
-        user_emojis = {}
-
-        for _, row in df.iterrows():
-            emojis = extract_emojis(row['message'])
-            all_emojis.extend(emojis)
-            
-            # For user emojis
-            if row['author'] not in user_emojis:
-                user_emojis[row['author']] = []
-            user_emojis[row['author']].extend(emojis)
-
-        # User Top Emojis
-        user_emoji_stats = []
-        for author, emojis in user_emojis.items():
-            if emojis:
-                top = Counter(emojis).most_common(5)
-                user_emoji_stats.append({
-                    "author": author,
-                    "top_emojis": [{"emoji": e, "count": c} for e, c in top]
-                })
+        if options.wants('emoji_stats'):
+            with profile.stage('emoji'):
+                # User Top Emojis
+                user_emoji_stats = []
+                for author, s in zip(authors, stats):
+                    if s.emojis:
+                        top = s.emojis.most_common(options.top_emojis)
+                        user_emoji_stats.append({
+                            "author": author,
+                            "top_emojis": [{"emoji": e, "count": c} for e, c in top]
+                        })
+            results['emoji_stats'] = {"by_person": user_emoji_stats}
 
         # --- 5. Word Cloud / Frequency ---
-        def get_tokens(text):
-            # Remove punctuation (including smart quotes) and convert to lower case
-            punctuation_map = str.maketrans('', '', string.punctuation + '“”')
-            text = text.translate(punctuation_map).lower()
-            tokens = text.split()
-            filtered = [t for t in tokens if t not in self.stopwords and len(t) > 2]
-            
-            # Debugging sample
-            if len(tokens) > 0 and len(filtered) < len(tokens):
-                 removed = set(tokens) - set(filtered)
-                 # print(f"DEBUG: Removed words: {list(removed)[:5]}")
-            
-            return filtered
-
-        user_word_freq = []
-        for author in df['author'].unique():
-            author_msgs = df[df['author'] == author]['message'].str.cat(sep=' ')
-            tokens = get_tokens(author_msgs)
-            common_words = Counter(tokens).most_common(30)
-            user_word_freq.append({
-                "author": author,
-                "words": [{"text": word, "value": count} for word, count in common_words]
-            })
+        if options.wants('word_clouds'):
+            with profile.stage('words'):
+                # Participants' names are not words anyone chose; keep them out of the clouds
+                hidden = set()
+                if options.hide_participant_names:
+                    hidden = normalize_words(part for author in authors for part in author.split())
+                    hidden |= {word + 's' for word in hidden}
+                user_word_freq = []
+                for author, s in zip(authors, stats):
+                    if hidden:
+                        common_words = heapq.nlargest(
+                            options.top_words, ((w, c) for w, c in s.words.items() if w not in hidden), key=itemgetter(1)
+                        )
+                    else:
+                        common_words = s.words.most_common(options.top_words)
+                    user_word_freq.append({
+                        "author": author,
+                        "words": [{"text": word, "value": count} for word, count in common_words]
+                    })
+            results['word_clouds'] = user_word_freq
 
         # --- 6. Domain Extraction (Per User) ---
-        url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+'
-        
-        def normalize_domain(domain: str) -> str:
-            """
-            Normalizes domains so related hosts are grouped together.
-            Currently consolidates YouTube variants (youtube.com / youtu.be).
-            """
-            d = domain.lower()
-            if d in {"youtu.be", "youtube.com", "www.youtube.com"}:
-                return "youtube.com"
-            return d
-
-        def extract_domain(text):
-            urls = re.findall(url_pattern, text)
-            domains = []
-            for url in urls:
-                try:
-                    from urllib.parse import urlparse
-                    domain = urlparse(url).netloc
-                    # Strip port if present and normalize www + case
-                    if ':' in domain:
-                        domain = domain.split(':', 1)[0]
-                    if domain.startswith('www.'):
-                        domain = domain[4:]
-                    domains.append(normalize_domain(domain))
-                except:
-                    pass
-            return domains
-
-        user_domain_stats = []
-        for author in df['author'].unique():
-            author_msgs = df[df['author'] == author]['message']
-            author_domains = []
-            for msg in author_msgs:
-                author_domains.extend(extract_domain(msg))
-            
-            if author_domains:
-                top = Counter(author_domains).most_common(5)
-                user_domain_stats.append({
-                    "author": author,
-                    "domains": [{"domain": d, "count": c} for d, c in top]
-                })
+        if options.wants('domain_stats'):
+            with profile.stage('domains'):
+                user_domain_stats = []
+                for author, s in zip(authors, stats):
+                    if s.domains:
+                        top = s.domains.most_common(options.top_domains)
+                        user_domain_stats.append({
+                            "author": author,
+                            "domains": [{"domain": d, "count": c} for d, c in top]
+                        })
+            results['domain_stats'] = user_domain_stats
 
         # --- 7. Total Duration ---
-        total_duration = "N/A"
-        if not df.empty:
-            min_date = df['datetime'].min()
-            max_date = df['datetime'].max()
+        with profile.stage('duration'):
+            min_date = state.first_datetime
+            max_date = state.last_datetime
             diff = relativedelta(max_date, min_date)
-            
+
             parts = []
             if diff.years > 0:
                 parts.append(f"{diff.years} year{'s' if diff.years != 1 else ''}")
             if diff.months > 0:
                 parts.append(f"{diff.months} month{'s' if diff.months != 1 else ''}")
-            
+
             if not parts:
                 # Less than a month
                 if diff.days > 0:
                     parts.append(f"{diff.days} day{'s' if diff.days != 1 else ''}")
                 else:
                     parts.append("Less than a day")
-            
+
             total_duration = ", ".join(parts)
 
         # --- 8. Avg Messages Per Day ---
-        avg_messages_per_day = 0
-        if not df.empty:
-            min_date = df['datetime'].min()
-            max_date = df['datetime'].max()
+        with profile.stage('aggregate'):
             days_diff = (max_date - min_date).days
             if days_diff < 1:
                 days_diff = 1
-            avg_messages_per_day = len(df) / days_diff
+            avg_messages_per_day = state.total_messages / days_diff
 
         return {
-            "sentiment_by_person": sentiment_by_person.to_dict(orient='records'),
-            "hourly_activity": hourly_activity_data,
-            "conversation_initiation": conversation_starts.to_dict(orient='records'),
-            "emoji_stats": {
-                "by_person": user_emoji_stats
-            },
-            "word_clouds": user_word_freq,
-            "domain_stats": user_domain_stats,
-            "total_messages": len(df),
-            "participants": df['author'].unique().tolist(),
+            **{section: results[section] for section in options.sections},
+            "total_messages": state.total_messages,
+            "participants": authors,
             "total_duration": total_duration,
-            "avg_messages_per_day": round(avg_messages_per_day, 1)
+            "avg_messages_per_day": round(avg_messages_per_day, 1),
+            "datetime_format": state.stamp_format.as_dict() if state.stamp_format is not None else None
         }
-
@@ -0,0 +1,113 @@
+import os
+import re
+import zipfile
+
+import numpy as np
+
+# Name of the chat text in iOS exports; Android names it "WhatsApp Chat with <name>.txt"
+IOS_CHAT_MEMBER = '_chat.txt'
+ANDROID_CHAT_PREFIX = 'WhatsApp Chat'
+
+# Bytes decompressed per read of the chat member
+MEMBER_CHUNK_SIZE = 1 << 20
+
+MEDIA_TYPES = {
+    '.jpg': 'image', '.jpeg': 'image', '.png': 'image', '.heic': 'image',
+    '.webp': 'sticker',
+    '.mp4': 'video', '.mov': 'video', '.3gp': 'video',
+    '.opus': 'audio', '.m4a': 'audio', '.mp3': 'audio', '.aac': 'audio', '.ogg': 'audio',
+    '.vcf': 'contact',
+}
+
+# Attachment references in messages: iOS "<attached: 00000012-PHOTO-....jpg>",
+# Android "IMG-20210301-WA0001.jpg (file attached)"
+ATTACHMENT_PATTERN = re.compile(rb'<attached: ([^>\n]+)>|([^\s<>]+\.\w+) \(file attached\)')
+
+
+def media_type(name: str) -> str:
+    return MEDIA_TYPES.get(os.path.splitext(name)[1].lower(), 'document')
+
+
+def find_chat_member(archive: zipfile.ZipFile):
+    """
+    The ZipInfo of the chat text in an export archive, or None: `_chat.txt`,
+    else an Android "WhatsApp Chat ..." text, else the only .txt member.
+    """
+    texts = [
+        info for info in archive.infolist()
+        if not info.is_dir() and info.filename.lower().endswith('.txt')
+    ]
+    for info in texts:
+        if os.path.basename(info.filename) == IOS_CHAT_MEMBER:
+            return info
+    for info in texts:
+        if os.path.basename(info.filename).startswith(ANDROID_CHAT_PREFIX):
+            return info
+    return texts[0] if len(texts) == 1 else None
+
+
+def iter_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, chunk_size: int = MEMBER_CHUNK_SIZE):
+    """
+    Yields the decompressed bytes of one member, `chunk_size` at a time.
+    """
+    with archive.open(info) as member:
+        while True:
+            chunk = member.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def media_index(archive: zipfile.ZipFile, chat: zipfile.ZipInfo) -> dict:
+    """
+    File name -> (media type, size in bytes) of every member but the chat
+    text, from the central directory alone; nothing is decompressed.
+    """
+    return {
+        os.path.basename(info.filename): (media_type(info.filename), info.file_size)
+        for info in archive.infolist()
+        if not info.is_dir() and info is not chat
+    }
+
+
+def _type_totals(files) -> dict:
+    totals = {}
+    for kind, size in files:
+        entry = totals.setdefault(kind, {'type': kind, 'count': 0, 'bytes': 0})
+        entry['count'] += 1
+        entry['bytes'] += size
+    return {
+        'media': sorted(totals.values(), key=lambda entry: (-entry['count'], entry['type'])),
+        'total_count': sum(entry['count'] for entry in totals.values()),
+        'total_bytes': sum(entry['bytes'] for entry in totals.values()),
+    }
+
+
+def media_stats(store, index: dict) -> dict:
+    """
+    Per-author counts and sizes by media type. Files are attributed to the
+    author of the message that attaches them (found in the store's buffer
+    without decoding it); files no analyzed message refers to are counted as
+    unattributed.
+    """
+    by_author = {}
+    attributed = set()
+    if len(store):
+        matches = [(match.start(), (match.group(1) or match.group(2)).decode('utf-8', 'replace'))
+                   for match in ATTACHMENT_PATTERN.finditer(store.buffer)]
+        positions = np.fromiter((position for position, _ in matches), dtype=np.int64, count=len(matches))
+        messages = np.searchsorted(store.offsets, positions, side='right') - 1
+        for message, (_, name) in zip(messages.tolist(), matches):
+            name = os.path.basename(name.strip())
+            if name in index and name not in attributed:
+                attributed.add(name)
+                author = store.authors[store.author_codes[message]]
+                by_author.setdefault(author, []).append(index[name])
+
+    return {
+        'by_person': [
+            {'author': author, **_type_totals(files)}
+            for author, files in sorted(by_author.items())
+        ],
+        'unattributed': _type_totals(entry for name, entry in index.items() if name not in attributed),
+    }
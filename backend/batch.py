@@ -0,0 +1,316 @@
+"""
+Offline batch analysis of many chat exports.
+
+Every export (.txt, or the .zip WhatsApp creates when exporting with media)
+is analyzed like an upload to /analyze, through the same
+analyze_source, on a process pool whose workers each build their analyzer
+(VADER, emoji matcher) and options (stopwords) once. Each result is appended
+to the output as one JSON line:
+
+    {"path": ..., "bytes": ..., "messages": ..., "seconds": ..., "results": {...}}
+
+or {"path": ..., "bytes": ..., "error": ...} for an export that failed.
+
+Rerunning with the same output resumes: exports that already have a result
+line for the same path and size are skipped (failed ones are retried), so an
+interrupted run picks up where it stopped and a grown export is analyzed again.
+A retried export's earlier line is dropped, so each export keeps one line.
+
+A worker that dies (e.g. killed for running out of memory) fails every
+export in flight on the pool. The pool is started again and those exports
+are retried one at a time; one that breaks the pool on its own gets an
+error line.
+
+Run from the backend directory:
+    python batch.py exports/ 'archive/**/*.zip' -o results.jsonl [--workers N] [--options '{"sections": [...]}']
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import multiprocessing
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from analyzer import POOL_START_METHOD, WhatsAppAnalyzer
+from archive import find_chat_member, iter_member, media_index, media_stats
+from options import AnalysisOptions
+from profiling import Profile
+
+logger = logging.getLogger("batch")
+
+EXPORT_EXTENSIONS = ('.txt', '.zip')
+
+# Bytes read from an export per parser step
+READ_CHUNK_SIZE = 1 << 20
+
+# Exports queued per worker, so results are written as they finish without
+# holding every pending one in memory
+TASKS_PER_WORKER = 2
+
+# Analyzer and options owned by each worker process, built once by _init_worker
+_worker_analyzer = None
+_worker_options = None
+
+
+def _init_worker(options: dict):
+    global _worker_analyzer, _worker_options
+    _worker_analyzer = WhatsAppAnalyzer()
+    _worker_options = AnalysisOptions.from_dict(options)
+
+
+def find_exports(sources) -> list:
+    """
+    Export files named by `sources`: files, directories (searched
+    recursively for .txt and .zip files) and glob patterns, sorted and
+    without duplicates.
+    """
+    paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            matches = glob.glob(os.path.join(source, '**', '*'), recursive=True)
+        else:
+            matches = glob.glob(source, recursive=True) or [source]
+        for path in matches:
+            if os.path.isfile(path) and (path == source or path.lower().endswith(EXPORT_EXTENSIONS)):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def _open_export(export):
+    """
+    (read, media index or None) of an open export file: read() for
+    analyze_source iterates the chat text's bytes, straight from the file or
+    from the chat text member of a zip export.
+    """
+    if not zipfile.is_zipfile(export):
+        def read():
+            export.seek(0)
+            return iter(lambda: export.read(READ_CHUNK_SIZE), b'')
+        return read, None
+
+    archive = zipfile.ZipFile(export)
+    chat = find_chat_member(archive)
+    if chat is None:
+        raise ValueError("no chat text (_chat.txt) found in the zip archive")
+    return (lambda: iter_member(archive, chat, READ_CHUNK_SIZE)), media_index(archive, chat)
+
+
+def analyze_file(path: str) -> tuple:
+    """
+    Analyzes one export in a worker; returns its output line and the line's
+    fields other than the results.
+    """
+    profile = Profile()
+    record = {'path': path, 'bytes': os.path.getsize(path)}
+    try:
+        with open(path, 'rb') as export:
+            read, index = _open_export(export)
+            results, state, scan = _worker_analyzer.analyze_source(read, profile=profile, options=_worker_options)
+            if not results:
+                raise ValueError("could not parse any messages from the file")
+            if _worker_options.media_stats and index is not None:
+                with profile.stage('archive'):
+                    results['media_stats'] = media_stats(scan.store, index)
+        profile.finish()
+        record.update(messages=state.total_messages, seconds=round(profile.seconds, 3), results=results)
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    line = json.dumps(record, ensure_ascii=False)
+    record.pop('results', None)
+    return line, record
+
+
+def _failed_line(path: str, error: Exception) -> tuple:
+    """
+    Output line and fields of an export whose worker failed, like analyze_file's.
+    """
+    record = {'path': path, 'bytes': os.path.getsize(path), 'error': f"{type(error).__name__}: {error}"}
+    return json.dumps(record, ensure_ascii=False), record
+
+
+def completed_exports(output: str) -> dict:
+    """
+    path -> size of the exports with a result line in `output`. A line cut
+    off by an interrupted run is dropped from the file, so appending starts
+    on a fresh line.
+    """
+    done = {}
+    if not os.path.exists(output):
+        return done
+    with open(output, 'rb+') as f:
+        end = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            end += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'results' in record:
+                done[record['path']] = record['bytes']
+        f.truncate(end)
+    return done
+
+
+def discard_records(output: str, paths) -> int:
+    """
+    Rewrites `output` without the lines of `paths` (earlier errors or results
+    of exports about to be analyzed again), so every export keeps one line.
+    Returns the number of lines dropped.
+    """
+    paths = set(paths)
+    if not paths or not os.path.exists(output):
+        return 0
+    dropped = 0
+    kept = output + '.tmp'
+    with open(output, 'rb') as f, open(kept, 'wb') as out:
+        for line in f:
+            try:
+                path = json.loads(line).get('path')
+            except ValueError:
+                path = None
+            if path in paths:
+                dropped += 1
+            else:
+                out.write(line)
+    if dropped:
+        os.replace(kept, output)
+    else:
+        os.remove(kept)
+    return dropped
+
+
+def run(paths: list, output: str, workers: int, options: dict) -> dict:
+    """
+    Analyzes `paths` on `workers` processes, appending result lines to
+    `output` as they finish; returns the run's totals.
+    """
+    done = completed_exports(output)
+    pending = [path for path in paths if done.get(path) != os.path.getsize(path)]
+    discard_records(output, pending)
+    totals = {'files': 0, 'skipped': len(paths) - len(pending), 'failed': 0, 'messages': 0, 'bytes': 0,
+              'interrupted': False}
+    start = time.perf_counter()
+
+    def start_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,),
+                                   mp_context=multiprocessing.get_context(POOL_START_METHOD))
+
+    # Future -> (path, pool it runs on)
+    running = {}
+
+    def submit(path: str):
+        nonlocal pool
+        try:
+            future = pool.submit(analyze_file, path)
+        except BrokenProcessPool:
+            # Broken by an export in flight, whose future reports it
+            pool.shutdown(wait=False)
+            pool = start_pool()
+            future = pool.submit(analyze_file, path)
+        running[future] = (path, pool)
+
+    with open(output, 'a', encoding='utf-8') as out:
+        queued = iter(pending)
+        # Exports caught in a broken pool, rerun one at a time
+        retries = deque()
+        retried = set()
+        pool = start_pool()
+        try:
+            while True:
+                if retries:
+                    if not running:
+                        path = retries.popleft()
+                        retried.add(path)
+                        submit(path)
+                else:
+                    while len(running) < workers * TASKS_PER_WORKER:
+                        path = next(queued, None)
+                        if path is None:
+                            break
+                        submit(path)
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path, ran_on = running.pop(future)
+                    try:
+                        line, record = future.result()
+                    except BrokenProcessPool as e:
+                        if ran_on is pool:
+                            pool.shutdown(wait=False)
+                            pool = start_pool()
+                        if path not in retried:
+                            retries.append(path)
+                            continue
+                        line, record = _failed_line(path, e)
+                    out.write(line + '\n')
+                    out.flush()
+                    totals['files'] += 1
+                    totals['bytes'] += record['bytes']
+                    if 'error' in record:
+                        totals['failed'] += 1
+                        logger.warning("%s: %s", record['path'], record['error'])
+                    else:
+                        totals['messages'] += record['messages']
+                        logger.info("%s: %d messages in %.2fs", record['path'], record['messages'], record['seconds'])
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            totals['interrupted'] = True
+            logger.warning("interrupted; rerun with the same output to resume")
+        finally:
+            pool.shutdown()
+    totals['seconds'] = time.perf_counter() - start
+    return totals
+
+
+def summary(totals: dict) -> str:
+    seconds = max(totals['seconds'], 1e-9)
+    return (
+        f"{totals['files']} exports analyzed ({totals['failed']} failed), {totals['skipped']} skipped as done\n"
+        f"{totals['messages']:,} messages, {totals['bytes'] / 2**20:,.1f} MB in {totals['seconds']:.1f}s: "
+        f"{totals['files'] / seconds:,.2f} exports/s, {totals['messages'] / seconds:,.0f} messages/s, "
+        f"{totals['bytes'] / 2**20 / seconds:,.2f} MB/s"
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sources', nargs='+', help="export files, directories or glob patterns")
+    parser.add_argument('-o', '--output', required=True, help="JSON Lines file results are appended to")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes (default: one per CPU)")
+    parser.add_argument('--options', default='{}', help="analysis options as JSON, as in the API's options field")
+    parser.add_argument('--restart', action='store_true', help="discard earlier results in the output instead of resuming")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        options = json.loads(args.options)
+        AnalysisOptions.from_dict(options)
+    except ValueError as e:
+        parser.error(f"invalid --options: {e}")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    paths = find_exports(args.sources)
+    if not paths:
+        parser.error("no exports found")
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+
+    totals = run(paths, args.output, args.workers, options)
+    print(summary(totals), file=sys.stderr)
+    if totals['interrupted']:
+        return 130
+    return 1 if totals['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Correctness check and throughput benchmark for EmojiMatcher.
+
+Checks that every sequence in emoji.EMOJI_DATA is matched as exactly one
+emoji, then counts the emojis of a corpus with the per-character
+`c in emoji.EMOJI_DATA` loop analyze_sentiment used before, with
+EmojiMatcher.find per message and with EmojiMatcher.count per batch, and
+reports messages/second.
+
+Run from the backend directory:
+    python -m benchmarks.bench_emojis [--messages N] [--chat export.txt]
+"""
+import argparse
+import random
+import sys
+import time
+from collections import Counter
+
+import emoji
+
+from emojis import EmojiMatcher
+
+WORDS = "ok see you at the station tomorrow lol haha what time are we meeting".split()
+
+
+def per_character(text):
+    return [c for c in text if c in emoji.EMOJI_DATA]
+
+
+def synthetic_corpus(count: int, seed: int = 0, emoji_density: float = 0.3) -> list:
+    """
+    Deterministic messages in which roughly `emoji_density` of the tokens are
+    emojis drawn from all of EMOJI_DATA (ZWJ sequences, modifiers and flags included).
+    """
+    rng = random.Random(seed)
+    emojis = sorted(emoji.EMOJI_DATA)
+    messages = []
+    for _ in range(count):
+        tokens = []
+        for _ in range(rng.randint(1, 14)):
+            if rng.random() < emoji_density:
+                tokens.append(rng.choice(emojis) * rng.randint(1, 3))
+            else:
+                tokens.append(rng.choice(WORDS))
+        messages.append(' '.join(tokens))
+    return messages
+
+
+def chat_corpus(path: str) -> list:
+    from analyzer import WhatsAppAnalyzer
+
+    with open(path, encoding='utf-8') as f:
+        df = WhatsAppAnalyzer().parse_chat(f)
+    return df['message'].tolist() if not df.empty else []
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100_000, help="synthetic corpus size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--emoji-density', type=float, default=0.05, help="share of synthetic tokens that are emojis")
+    parser.add_argument('--chat', help="scan the messages of a WhatsApp export instead")
+    args = parser.parse_args(argv)
+
+    matcher, build_seconds = timed(EmojiMatcher)
+    failures = [sequence for sequence in emoji.EMOJI_DATA if matcher.find(sequence) != [sequence]]
+    for sequence in failures[:20]:
+        print(f"NOT MATCHED WHOLE {sequence!r}: {matcher.find(sequence)!r}")
+
+    messages = (
+        chat_corpus(args.chat) if args.chat
+        else synthetic_corpus(args.messages, args.seed, args.emoji_density)
+    )
+    legacy, legacy_seconds = timed(lambda: Counter(e for message in messages for e in per_character(message)))
+    found, find_seconds = timed(lambda: Counter(e for message in messages for e in matcher.find(message)))
+    counted, count_seconds = timed(lambda: matcher.count(messages))
+    if found != counted:
+        failures.append('find/count disagree')
+        print("MISMATCH find() and count() totals differ")
+
+    count = len(messages)
+    multi = sum(c for e, c in counted.items() if len(e) > 1)
+    print(f"messages:        {count}")
+    print(f"matcher build:   {build_seconds * 1000:.0f} ms")
+    print(f"per-character:   {count / max(legacy_seconds, 1e-9):,.0f} msg/s ({legacy_seconds:.2f}s, {sum(legacy.values())} emojis)")
+    print(f"find:            {count / max(find_seconds, 1e-9):,.0f} msg/s ({find_seconds:.2f}s)")
+    print(f"count (batch):   {count / max(count_seconds, 1e-9):,.0f} msg/s ({count_seconds:.2f}s, {sum(counted.values())} emojis)")
+    print(f"speedup:         {legacy_seconds / max(count_seconds, 1e-9):.1f}x")
+    print(f"multi-codepoint: {multi} emojis the per-character loop split up")
+    print(f"failures:        {len(failures)}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+End-to-end benchmark of the analysis pipeline on synthetic exports.
+
+For every size, a deterministic export (see benchmarks.synthetic) is written
+once to --data-dir and reused by later runs. Each stage then runs in a fresh
+process, so its peak RSS is its own:
+
+- parse:    ChatParser over the decoded upload (parse_store)
+- analyze:  analyze_incremental, with the per-stage profile breakdown
+- endpoint: POST /analyze through the FastAPI app (result cache, chat state
+            cache and memory budget disabled, upload limit raised to fit)
+
+A stage is repeated until it has run --repeat times and for at least
+--min-time seconds; the best run is reported as latency and throughput.
+Results are compared against a stored baseline (benchmarks/baseline.json by
+default) recorded with the same export spec; a stage whose throughput drops,
+or whose peak RSS grows, by more than --tolerance is a regression and makes
+the run exit with status 1.
+
+Run from the backend directory:
+    python -m benchmarks.bench_pipeline [--sizes 1k,10k,100k,1m,5m] [--stages parse,analyze]
+    python -m benchmarks.bench_pipeline --save-baseline
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import ExportSpec, add_spec_arguments, parse_count, spec_from_args, write_export
+
+STAGES = ('parse', 'analyze', 'endpoint')
+DEFAULT_SIZES = '1k,10k,100k,1m'
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def export_path(spec: ExportSpec, data_dir: str) -> str:
+    """
+    The export for `spec` in `data_dir`, generated on first use.
+    """
+    digest = hashlib.sha1(repr(sorted(asdict(spec).items())).encode()).hexdigest()[:12]
+    path = os.path.join(data_dir, f'chat-{spec.platform}-{spec.messages}-{digest}.txt')
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        partial = path + '.partial'
+        write_export(spec, partial)
+        os.replace(partial, path)
+    return path
+
+
+def _stage_runner(stage: str, content: bytes, workers: int):
+    """
+    Returns (run, teardown) for `stage`; run() analyzes `content` once and
+    returns the profile stages of the run, if any.
+    """
+    if stage == 'endpoint':
+        # Every request must reach the analyzer; set before main is imported
+        os.environ.update({
+            'RESULT_CACHE_MAX_BYTES': '0',
+            'RESULT_CACHE_PATH': '',
+            'INCREMENTAL_STATE_SLOTS': '0',
+            'ANALYZER_MEMORY_BUDGET_BYTES': '0',
+            'ANALYZER_WORKERS': str(workers),
+            'LOG_LEVEL': 'WARNING',
+        })
+        from fastapi.testclient import TestClient
+        import main
+
+        main.MAX_UPLOAD_BYTES = max(main.MAX_UPLOAD_BYTES, len(content))
+        client = TestClient(main.app)
+        client.__enter__()
+
+        def run():
+            response = client.post('/analyze', files={'file': ('chat.txt', content, 'text/plain')})
+            if response.status_code != 200:
+                raise RuntimeError(f"/analyze returned {response.status_code}: {response.text[:200]}")
+            return None
+
+        return run, lambda: client.__exit__(None, None, None)
+
+    from analyzer import WhatsAppAnalyzer
+    from profiling import Profile
+
+    analyzer = WhatsAppAnalyzer(workers=workers)
+    text = content.decode('utf-8')
+    if stage == 'parse':
+        def run():
+            analyzer.parse_store(text)
+            return None
+    else:
+        def run():
+            profile = Profile()
+            analyzer.analyze_incremental(text, None, None, profile)
+            return profile.as_dict()['stages']
+    return run, analyzer.close
+
+
+def measure(stage: str, path: str, repeat: int, min_time: float, workers: int) -> dict:
+    """
+    Runs one stage on the export at `path`; executed in a fresh process.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    run, teardown = _stage_runner(stage, content, workers)
+    ready_rss = peak_rss_bytes()
+
+    runs, profiles = [], []
+    started = time.perf_counter()
+    try:
+        while len(runs) < repeat or time.perf_counter() - started < min_time:
+            start = time.perf_counter()
+            stages = run()
+            runs.append(time.perf_counter() - start)
+            if stages is not None:
+                profiles.append((runs[-1], stages))
+    finally:
+        teardown()
+
+    best = min(runs)
+    result = {
+        'bytes': len(content),
+        'runs': len(runs),
+        'seconds': round(best, 6),
+        'median_seconds': round(statistics.median(runs), 6),
+        'bytes_per_second': round(len(content) / best),
+        'ready_rss_bytes': ready_rss,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+    if profiles:
+        result['stages'] = {name: stage['seconds'] for name, stage in min(profiles, key=lambda item: item[0])[1].items()}
+    return result
+
+
+def run_in_child(*args) -> dict:
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(measure, *args).result()
+
+
+def compare(key: str, current: dict, previous: dict, tolerance: float) -> list:
+    """
+    Regressions of one result against its baseline, as printable strings.
+    Also records the ratios in `current`.
+    """
+    regressions = []
+    ratio = current['messages_per_second'] / max(previous['messages_per_second'], 1e-9)
+    current['throughput_vs_baseline'] = round(ratio, 3)
+    if ratio < 1 - tolerance:
+        regressions.append(f"{key}: throughput {ratio:.2f}x of baseline "
+                           f"({current['messages_per_second']:,.0f} vs {previous['messages_per_second']:,.0f} msg/s)")
+    growth = current['peak_rss_bytes'] / max(previous['peak_rss_bytes'], 1)
+    current['rss_vs_baseline'] = round(growth, 3)
+    if growth > 1 + tolerance:
+        regressions.append(f"{key}: peak RSS {growth:.2f}x of baseline "
+                           f"({current['peak_rss_bytes'] / 2**20:,.0f} vs {previous['peak_rss_bytes'] / 2**20:,.0f} MiB)")
+    return regressions
+
+
+def print_row(key: str, result: dict):
+    versus = ''
+    if 'throughput_vs_baseline' in result:
+        versus = f"  {result['throughput_vs_baseline']:.2f}x speed, {result['rss_vs_baseline']:.2f}x rss vs baseline"
+    print(f"{key:<18} {result['messages_per_second']:>12,.0f} msg/s {result['seconds'] * 1000:>11,.1f} ms "
+          f"{result['peak_rss_bytes'] / 2**20:>8,.0f} MiB peak{versus}")
+    for name, seconds in result.get('stages', {}).items():
+        print(f"{'':<20}{name:<16} {seconds * 1000:>11,.1f} ms")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="comma-separated message counts, e.g. 1k,10k,5m")
+    parser.add_argument('--stages', default=','.join(STAGES), help="comma-separated subset of " + ', '.join(STAGES))
+    parser.add_argument('--repeat', type=int, default=1, help="minimum runs per stage")
+    parser.add_argument('--min-time', type=float, default=1.0, help="minimum seconds of runs per stage")
+    parser.add_argument('--workers', type=int, default=0, help="analyzer process-pool workers (0 = serial)")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'whatsapp-analyzer-bench'),
+                        help="where generated exports are kept between runs")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="record this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown or RSS growth")
+    parser.add_argument('--output', help="also write the results as JSON to this file")
+    add_spec_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    sizes = [parse_count(size) for size in args.sizes.split(',') if size.strip()]
+
+    spec = asdict(spec_from_args(args, 0))
+    del spec['messages']
+    config = {'spec': spec, 'workers': args.workers}
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            recorded = json.load(f)
+        if recorded.get('config') != config:
+            print(f"baseline {args.baseline} was recorded with a different export spec or worker count; not compared\n")
+        else:
+            baseline = recorded['results']
+            print(f"comparing with baseline recorded {recorded['recorded_at']} on {recorded['machine']}\n")
+
+    results, regressions = {}, []
+    for size in sizes:
+        path = export_path(spec_from_args(args, size), args.data_dir)
+        for stage in stages:
+            key = f'{stage}/{size}'
+            result = run_in_child(stage, path, args.repeat, args.min_time, args.workers)
+            result['messages'] = size
+            result['messages_per_second'] = round(size / max(result['seconds'], 1e-9), 1)
+            if key in baseline:
+                regressions += compare(key, result, baseline[key], args.tolerance)
+            results[key] = result
+            print_row(key, result)
+
+    if baseline:
+        print()
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"regressions: {len(regressions)}")
+
+    report = {
+        'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'machine': f"{platform.system()} {platform.machine()}, {os.cpu_count()} cpus, Python {platform.python_version()}",
+        'config': config,
+        'results': results,
+    }
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # Keep the baseline of sizes this run did not measure
+            with open(args.baseline) as f:
+                previous = json.load(f)
+            if previous.get('config') == config:
+                report['results'] = {**previous['results'], **results}
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nbaseline saved to {args.baseline}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Equivalence check and throughput benchmark for BatchSentimentScorer.
+
+Scores a corpus with both BatchSentimentScorer.score_batch and the per-message
+SentimentIntensityAnalyzer.polarity_scores path that analyze_sentiment used
+before, fails if any compound score differs, and reports messages/second.
+
+Run from the backend directory:
+    python -m benchmarks.bench_sentiment [--messages N] [--chat export.txt]
+"""
+import argparse
+import random
+import sys
+import time
+
+from sentiment import BatchSentimentScorer
+
+# Words that exercise every VADER rule the batch scorer reimplements or defers
+RULE_WORDS = (
+    "no not never isn't don't without doubt so this least at very or nor but "
+    "kind of sort just enough the shit bomb bus stop yeah right really extremely "
+    "barely kinda"
+).split()
+FILLER_WORDS = "i you we it meeting dinner tomorrow work x 2pm a the".split()
+EMOJIS = ['😀', '😂', '❤️', '👍🏽', '🇬🇧', '🔥', '😭', '🙏', '🔛']
+EDGE_CASES = [
+    "", " ", "!!!", "???", "good", "GOOD", "not good", "NOT GOOD at all", "no good",
+    "no no good", "no problem or bad", "at least good", "least good", "very least bad",
+    "kind of good", "sort of bad", "good but bad", "never so good", "without doubt good",
+    "the shit", "yeah right", "kiss of death", "😀", "good😀😀", ":) :(", "Good!!!!!!",
+    "bad??", "bad????", "really REALLY good", "barely GOOD", "isn't bad", "ok :D",
+]
+
+
+def synthetic_corpus(count: int, seed: int = 0) -> list:
+    """
+    Deterministic messages mixing lexicon words, rule words, emojis, caps and punctuation.
+    """
+    rng = random.Random(seed)
+    lexicon = sorted(BatchSentimentScorer().lexicon)
+    messages = list(EDGE_CASES)
+    while len(messages) < count:
+        tokens = []
+        for _ in range(rng.randint(0, 14)):
+            pick = rng.random()
+            if pick < 0.35:
+                token = rng.choice(lexicon)
+            elif pick < 0.55:
+                token = rng.choice(RULE_WORDS)
+            elif pick < 0.7:
+                token = rng.choice(EMOJIS)
+            else:
+                token = rng.choice(FILLER_WORDS)
+            if rng.random() < 0.1:
+                token = token.upper()
+            if rng.random() < 0.1:
+                token += rng.choice('!?.,')
+            tokens.append(token)
+        messages.append(rng.choice([' ', '', '  ']).join(tokens) + rng.choice(['', '!', '??', '!!!!!']))
+    return messages[:count]
+
+
+def chat_corpus(path: str) -> list:
+    from analyzer import WhatsAppAnalyzer
+
+    with open(path, encoding='utf-8') as f:
+        df = WhatsAppAnalyzer().parse_chat(f)
+    return df['message'].tolist() if not df.empty else []
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100_000, help="synthetic corpus size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chat', help="score the messages of a WhatsApp export instead")
+    args = parser.parse_args(argv)
+
+    messages = chat_corpus(args.chat) if args.chat else synthetic_corpus(args.messages, args.seed)
+    scorer = BatchSentimentScorer()
+
+    start = time.perf_counter()
+    batch_scores = scorer.score_batch(messages)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference = [scorer.analyzer.polarity_scores(str(message))['compound'] for message in messages]
+    reference_seconds = time.perf_counter() - start
+
+    mismatches = [
+        (message, expected, actual)
+        for message, expected, actual in zip(messages, reference, batch_scores.tolist())
+        if expected != actual
+    ]
+    for message, expected, actual in mismatches[:20]:
+        print(f"MISMATCH {message!r}: polarity_scores={expected} score_batch={actual}")
+
+    count = len(messages)
+    print(f"messages:        {count}")
+    print(f"polarity_scores: {count / max(reference_seconds, 1e-9):,.0f} msg/s ({reference_seconds:.2f}s)")
+    print(f"score_batch:     {count / max(batch_seconds, 1e-9):,.0f} msg/s ({batch_seconds:.2f}s)")
+    print(f"speedup:         {reference_seconds / max(batch_seconds, 1e-9):.1f}x")
+    print(f"mismatches:      {len(mismatches)}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Deterministic synthetic WhatsApp exports for benchmarks.
+
+The same ExportSpec (seed included) always produces byte-identical output,
+so benchmark runs and baselines measure the same input. Exports are
+generated line by line and can be written straight to disk, which keeps
+multi-million-message files cheap to produce.
+
+Run from the backend directory to write an export:
+    python -m benchmarks.synthetic --messages 100000 --platform android -o chat.txt
+"""
+import argparse
+import random
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+WORDS = (
+    "ok see you at the station tomorrow lol haha what time are we meeting "
+    "good great love this so happy sad tired work dinner later tonight thanks "
+    "sorry not sure maybe yes no never really amazing terrible weekend plans "
+    "coffee call me when you can running late on my way home traffic again"
+).split()
+EMOJIS = ['😂', '❤️', '👍', '👍🏽', '😭', '🙏', '🔥', '😀', '🇬🇧', '👨‍👩‍👧', '🎉', '😅']
+DOMAINS = ['youtube.com', 'youtu.be', 'www.instagram.com', 'open.spotify.com', 'bbc.co.uk', 'github.com']
+FIRST_NAMES = ['Alice', 'Bob', 'Charlie', 'Dana', 'Elif', 'Farid', 'Grace', 'Hiro', 'Ines', 'Jonas']
+
+ENCRYPTION_NOTICE = "Messages and calls are end-to-end encrypted. No one outside of this chat can read or listen to them."
+
+# First message of every export
+START = datetime(2021, 3, 1, 8, 0, 0)
+
+
+@dataclass
+class ExportSpec:
+    """
+    Shape of a synthetic export. Densities are per-message probabilities:
+    a message with an emoji or URL gets one or two of them, a multi-line
+    message gets one to three continuation lines, and a system event
+    (member added, subject changed, media omitted) is written between
+    messages instead of a message.
+    """
+    messages: int = 10_000
+    authors: int = 4
+    platform: str = 'ios'
+    seed: int = 0
+    multiline_density: float = 0.05
+    emoji_density: float = 0.2
+    url_density: float = 0.02
+    system_density: float = 0.01
+    # Mean seconds between consecutive messages
+    mean_gap: float = 600.0
+
+
+def _stamp(platform: str, moment: datetime) -> str:
+    if platform == 'ios':
+        return moment.strftime('[%d/%m/%Y, %H:%M:%S] ')
+    return moment.strftime('%d/%m/%Y, %H:%M - ')
+
+
+def _system_line(rng: random.Random, platform: str, stamp: str, names: list) -> str:
+    actor, other = rng.choice(names), rng.choice(names)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return f"{stamp}{actor}: ‎image omitted"
+    event = f"{actor} added {other}" if kind == 1 else f"{actor} changed the subject to “Trip {rng.randint(1, 99)}”"
+    # iOS attributes group events to the group; Android writes them without an author
+    return f"{stamp}Group: ‎{event}" if platform == 'ios' else f"{stamp}{event}"
+
+
+def iter_export(spec: ExportSpec):
+    """
+    Yields the lines of the export described by `spec` (without newlines).
+    """
+    if spec.platform not in ('ios', 'android'):
+        raise ValueError(f"platform must be 'ios' or 'android', not {spec.platform!r}")
+    rng = random.Random(spec.seed)
+    names = [
+        FIRST_NAMES[i % len(FIRST_NAMES)] + ('' if i < len(FIRST_NAMES) else f' {i // len(FIRST_NAMES)}')
+        for i in range(max(spec.authors, 1))
+    ]
+    moment = START
+    yield _stamp(spec.platform, moment) + f"Group: ‎{ENCRYPTION_NOTICE}"
+
+    written = 0
+    while written < spec.messages:
+        moment += timedelta(seconds=int(rng.expovariate(1 / spec.mean_gap)) + 1)
+        stamp = _stamp(spec.platform, moment)
+        if rng.random() < spec.system_density:
+            yield _system_line(rng, spec.platform, stamp, names)
+            continue
+
+        tokens = rng.choices(WORDS, k=rng.randint(1, 16))
+        if rng.random() < spec.emoji_density:
+            for _ in range(rng.randint(1, 2)):
+                tokens.insert(rng.randint(0, len(tokens)), rng.choice(EMOJIS))
+        if rng.random() < spec.url_density:
+            for _ in range(rng.randint(1, 2)):
+                tokens.append(f"https://{rng.choice(DOMAINS)}/watch?v={rng.getrandbits(32):08x}")
+        yield f"{stamp}{rng.choice(names)}: {' '.join(tokens)}"
+        if rng.random() < spec.multiline_density:
+            for _ in range(rng.randint(1, 3)):
+                yield ' '.join(rng.choices(WORDS, k=rng.randint(1, 10)))
+        written += 1
+
+
+def generate_export(spec: ExportSpec) -> str:
+    return '\n'.join(iter_export(spec)) + '\n'
+
+
+def write_export(spec: ExportSpec, path: str) -> int:
+    """
+    Writes the export to `path` as UTF-8 and returns its size in bytes.
+    """
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        batch = []
+        for line in iter_export(spec):
+            batch.append(line)
+            if len(batch) >= 10_000:
+                f.write('\n'.join(batch) + '\n')
+                batch = []
+        if batch:
+            f.write('\n'.join(batch) + '\n')
+        return f.tell()
+
+
+def parse_count(value: str) -> int:
+    """
+    Parses message counts written as 1000, 10k or 5m.
+    """
+    value = value.strip().lower().replace('_', '')
+    scale = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    return int(float(value[:-1] if scale > 1 else value) * scale)
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the ExportSpec knobs (all but the message count) as options.
+    """
+    defaults = ExportSpec()
+    parser.add_argument('--authors', type=int, default=defaults.authors)
+    parser.add_argument('--platform', choices=['ios', 'android'], default=defaults.platform)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--multiline-density', type=float, default=defaults.multiline_density,
+                        help="share of messages with continuation lines")
+    parser.add_argument('--emoji-density', type=float, default=defaults.emoji_density,
+                        help="share of messages with emojis")
+    parser.add_argument('--url-density', type=float, default=defaults.url_density,
+                        help="share of messages with links")
+    parser.add_argument('--system-density', type=float, default=defaults.system_density,
+                        help="system events per message")
+    parser.add_argument('--mean-gap', type=float, default=defaults.mean_gap,
+                        help="mean seconds between consecutive messages")
+
+
+def spec_from_args(args, messages: int) -> ExportSpec:
+    return ExportSpec(
+        messages=messages,
+        authors=args.authors,
+        platform=args.platform,
+        seed=args.seed,
+        multiline_density=args.multiline_density,
+        emoji_density=args.emoji_density,
+        url_density=args.url_density,
+        system_density=args.system_density,
+        mean_gap=args.mean_gap,
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=parse_count, default=ExportSpec.messages, help="e.g. 5000, 100k, 5m")
+    parser.add_argument('-o', '--output', help="file to write (default: stdout)")
+    add_spec_arguments(parser)
+    args = parser.parse_args(argv)
+
+    spec = spec_from_args(args, args.messages)
+    if args.output:
+        size = write_export(spec, args.output)
+        print(f"wrote {spec.messages} messages ({size:,} bytes) to {args.output}", file=sys.stderr)
+    else:
+        for line in iter_export(spec):
+            sys.stdout.write(line + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
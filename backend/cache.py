@@ -0,0 +1,423 @@
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from store import MessageStore
+
+# Parsed-chat files: magic, 64-byte aligned little-endian columns (the layout
+# and alignment Arrow uses for buffers), then a JSON header with the column
+# offsets, its length and the magic again
+PARSED_MAGIC = b'WACHAT\x00\x01'
+PARSED_SUFFIX = '.chat'
+COLUMN_ALIGNMENT = 64
+PARSED_COLUMNS = (
+    ('author_codes', '<i4'),
+    ('timestamps', '<i8'),
+    ('offsets', '<i8'),
+    ('scores', '<f8'),
+    ('buffer', '|u1'),
+)
+
+# Bytes of an export read per step by `warm`
+WARM_CHUNK_BYTES = 1 << 20
+
+
+def content_key(content: bytes, *namespace: str) -> str:
+    """
+    Content address of an upload: SHA-256 of the raw bytes (or of their
+    SHA-256 digest, for uploads hashed while they were received), salted with
+    `namespace` (analysis version, options) so different results never share a key.
+    """
+    digest = hashlib.sha256()
+    for part in namespace:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(content)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of serialized /analyze responses keyed by content hash.
+
+    The memory tier is an LRU bounded by the total size of the stored values.
+    The optional disk tier is a SQLite file that survives restarts, bounded the
+    same way and evicted by least-recent access. Disk hits are promoted into
+    memory. All methods are thread-safe.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_path: str = None,
+                 disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'disk_evictions': 0,
+        }
+
+        self._db = None
+        if disk_path:
+            directory = os.path.dirname(os.path.abspath(disk_path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._db.commit()
+
+    def get(self, key: str):
+        """
+        Returns the stored bytes for `key`, or None.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                self._counters['memory_hits'] += 1
+                return value
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = bytes(row[0])
+                    self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._store_in_memory(key, value)
+                    self._counters['hits'] += 1
+                    self._counters['disk_hits'] += 1
+                    return value
+
+            self._counters['misses'] += 1
+            return None
+
+    def put(self, key: str, value: bytes):
+        with self._lock:
+            self._store_in_memory(key, value)
+            if self._db is not None and len(value) <= self.disk_max_bytes:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, len(value), time.time()),
+                )
+                self._evict_disk()
+                self._db.commit()
+
+    def _store_in_memory(self, key: str, value: bytes):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._memory_bytes += len(value)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._counters['evictions'] += 1
+
+    def _evict_disk(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+            if total <= self.disk_max_bytes:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            self._counters['disk_evictions'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['max_bytes'] = self.max_bytes
+            if self._db is not None:
+                entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+                stats['disk_entries'] = entries
+                stats['disk_bytes'] = size
+                stats['disk_max_bytes'] = self.disk_max_bytes
+            return stats
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class StateStore:
+    """
+    Bounded LRU of per-chat AnalysisState objects for incremental re-analysis.
+
+    take() removes the state it returns, so two concurrent uploads of the same
+    chat never update one state object; the caller put()s it back when done.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str):
+        with self._lock:
+            return self._states.pop(key, None)
+
+    def put(self, key: str, state):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+
+
+def _padding(size: int) -> bytes:
+    return b'\0' * (-size % COLUMN_ALIGNMENT)
+
+
+class ParsedChatCache:
+    """
+    Disk cache of parsed chats and their sentiment scores, so an export that
+    was analyzed before is never parsed or scored again, whatever the
+    analysis options.
+
+    Each entry is one file holding the columns of a MessageStore plus the
+    per-message scores, keyed by content hash. get() memory-maps the file and
+    returns the columns as views of it, so loading costs no parsing and no
+    copying; pages are read as analysis touches them. The directory is kept
+    under `max_bytes` by deleting the least recently used files (by mtime,
+    which get() refreshes), so several processes can share one directory.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 4 * 1024 * 1024 * 1024, namespace: str = ''):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'errors': 0}
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + PARSED_SUFFIX)
+
+    def get(self, key: str):
+        """
+        Returns (store, scores, meta) for `key`, or None. `meta` is the JSON
+        object given to put().
+        """
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self._counters['misses'] += 1
+            return None
+
+        columns = {}
+        try:
+            footer = len(PARSED_MAGIC) + 8
+            if mapped[:len(PARSED_MAGIC)] != PARSED_MAGIC or mapped[-len(PARSED_MAGIC):] != PARSED_MAGIC:
+                raise ValueError("not a parsed chat file")
+            (header_size,) = struct.unpack_from('<Q', mapped, len(mapped) - footer)
+            header = json.loads(bytes(mapped[len(mapped) - footer - header_size:len(mapped) - footer]))
+            if header['namespace'] != self.namespace:
+                raise ValueError("written by another analysis version")
+            for name, dtype in PARSED_COLUMNS:
+                offset, size = header['columns'][name]
+                columns[name] = np.frombuffer(mapped, dtype=dtype, count=size // np.dtype(dtype).itemsize, offset=offset)
+        except (ValueError, KeyError, struct.error):
+            # Unreadable or stale: drop it so it is rewritten
+            columns.clear()
+            try:
+                mapped.close()
+            except BufferError:
+                pass
+            self._remove(path)
+            with self._lock:
+                self._counters['errors'] += 1
+                self._counters['misses'] += 1
+            return None
+
+        offset, size = header['columns']['buffer']
+        store = MessageStore(
+            header['authors'],
+            columns['author_codes'],
+            columns['timestamps'],
+            columns['offsets'],
+            memoryview(mapped)[offset:offset + size],
+        )
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._counters['hits'] += 1
+        return store, columns['scores'], header['meta']
+
+    def put(self, key: str, store: MessageStore, scores: np.ndarray, meta: dict = None):
+        """
+        Writes an entry (atomically, so readers never see a partial file) and
+        evicts old entries beyond `max_bytes`.
+        """
+        arrays = {
+            'author_codes': store.author_codes,
+            'timestamps': store.timestamps,
+            'offsets': store.offsets,
+            'scores': scores,
+        }
+        header = {
+            'namespace': self.namespace,
+            'messages': len(store),
+            'authors': store.authors,
+            'meta': meta or {},
+            'columns': {},
+        }
+
+        handle, temporary = tempfile.mkstemp(dir=self.path, prefix='.' + key, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(PARSED_MAGIC)
+                f.write(_padding(len(PARSED_MAGIC)))
+                for name, dtype in PARSED_COLUMNS:
+                    column = store.buffer if name == 'buffer' else np.ascontiguousarray(arrays[name], dtype=dtype)
+                    size = memoryview(column).nbytes
+                    header['columns'][name] = [f.tell(), size]
+                    f.write(column)
+                    f.write(_padding(size))
+                # Header last, so column offsets are known when it is written
+                encoded = json.dumps(header).encode('utf-8')
+                f.write(encoded)
+                f.write(struct.pack('<Q', len(encoded)))
+                f.write(PARSED_MAGIC)
+            os.replace(temporary, self._file(key))
+        except BaseException:
+            self._remove(temporary)
+            raise
+        with self._lock:
+            self._counters['writes'] += 1
+        self.prune()
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self) -> list:
+        """
+        (mtime, size, path) of every entry, least recently used first.
+        """
+        entries = []
+        for path in glob.glob(os.path.join(self.path, '*' + PARSED_SUFFIX)):
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+        return sorted(entries)
+
+    def prune(self, max_bytes: int = None) -> tuple:
+        """
+        Deletes least recently used entries until the cache fits `max_bytes`
+        (default: the configured limit). Returns (entries removed, bytes freed).
+        Files still mapped by a running analysis stay readable until unmapped.
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            removed = freed = 0
+            for _, size, path in entries:
+                if total <= limit:
+                    break
+                self._remove(path)
+                total -= size
+                removed += 1
+                freed += size
+            self._counters['evictions'] += removed
+            return removed, freed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._entries()
+            stats = dict(self._counters)
+            stats['entries'] = len(entries)
+            stats['bytes'] = sum(size for _, size, _ in entries)
+            stats['max_bytes'] = self.max_bytes
+            return stats
+
+
+def main(argv=None) -> int:
+    """
+    Parsed-chat cache maintenance:
+        python -m cache warm exports/*.txt    parse and score exports ahead of time
+        python -m cache prune [--max-bytes N] evict down to a size (default: the limit)
+        python -m cache stats
+    The directory and limit default to PARSED_CACHE_PATH and PARSED_CACHE_MAX_BYTES.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default=os.environ.get('PARSED_CACHE_PATH'), help="cache directory")
+    parser.add_argument('--max-bytes', type=int, default=int(os.environ.get('PARSED_CACHE_MAX_BYTES', 4 * 1024 * 1024 * 1024)))
+    commands = parser.add_subparsers(dest='command', required=True)
+    warm = commands.add_parser('warm', help="analyze exports so later uploads of them skip parsing and scoring")
+    warm.add_argument('files', nargs='+', help="export files or glob patterns")
+    commands.add_parser('prune', help="evict least recently used entries beyond --max-bytes")
+    commands.add_parser('stats', help="print entry count, size and limit")
+    args = parser.parse_args(argv)
+    if not args.path:
+        parser.error("no cache directory: pass --path or set PARSED_CACHE_PATH")
+
+    from analyzer import ANALYSIS_VERSION, WhatsAppAnalyzer
+
+    cache = ParsedChatCache(args.path, max_bytes=args.max_bytes, namespace=ANALYSIS_VERSION)
+    if args.command == 'warm':
+        analyzer = WhatsAppAnalyzer(parsed_cache=cache)
+        paths = [path for pattern in args.files for path in (sorted(glob.glob(pattern)) or [pattern])]
+        for path in paths:
+            hits = cache.stats()['hits']
+            start = time.perf_counter()
+            # Decoded like an upload (encoding detection, BOM dropped), so the
+            # chat text gets the parsed-cache key an upload of it would
+            with open(path, 'rb') as f:
+                def read():
+                    f.seek(0)
+                    return iter(lambda: f.read(WARM_CHUNK_BYTES), b'')
+                _, state, _ = analyzer.analyze_source(read, resume=False)
+            status = 'cached' if cache.stats()['hits'] > hits else 'added'
+            print(f"{status:>6}  {state.total_messages:>9} messages  {time.perf_counter() - start:6.2f}s  {path}")
+        analyzer.close()
+    elif args.command == 'prune':
+        removed, freed = cache.prune()
+        print(f"removed {removed} entries ({freed:,} bytes)")
+    stats = cache.stats()
+    print(f"{stats['entries']} entries, {stats['bytes']:,} of {stats['max_bytes']:,} bytes in {args.path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import re
+from collections import Counter
+
+import emoji
+
+from sentiment import _character_class
+
+# Never part of an emoji, so batches can be joined on it and scanned at once
+BATCH_SEPARATOR = '\n'
+
+# Basic Multilingual Plane without surrogates; the regex engine tests classes
+# within it with a bitmap lookup
+BMP_CHARACTERS = ''.join(chr(codepoint) for codepoint in range(0x10000) if not 0xD800 <= codepoint <= 0xDFFF)
+
+
+# Most alternatives the regex engine tries one by one at the trie's root
+ROOT_FANOUT = 8
+
+
+def _dispatch(branches: list) -> str:
+    """
+    Alternation over (first character, pattern) pairs sorted by character.
+    Large alternations are split into contiguous codepoint ranges guarded by a
+    lookahead, so an emoji position is tested against a few ranges and one
+    small group instead of every first character in turn.
+    """
+    if len(branches) <= ROOT_FANOUT:
+        return '(?:' + '|'.join(pattern for _, pattern in branches) + ')'
+    size = -(-len(branches) // ROOT_FANOUT)
+    groups = []
+    for start in range(0, len(branches), size):
+        group = branches[start:start + size]
+        first, last = re.escape(group[0][0]), re.escape(group[-1][0])
+        groups.append(f'(?=[{first}-{last}]){_dispatch(group)}')
+    return '(?:' + '|'.join(groups) + ')'
+
+
+def _trie_pattern(node: dict) -> str:
+    """
+    Regex for a codepoint trie. Children are tried before a node's own end,
+    so the regex engine always returns the longest emoji at a position and
+    only backs off to a shorter one when the longer sequence is incomplete.
+    """
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    if '' in node:
+        return '(?:' + '|'.join(branches) + ')?'
+    if len(branches) == 1:
+        return branches[0]
+    return '(?:' + '|'.join(branches) + ')'
+
+
+class EmojiMatcher:
+    """
+    Finds emojis as whole sequences: ZWJ families, skin-tone and hair
+    modifiers, keycaps and flags are matched as one emoji rather than their
+    separate codepoints.
+
+    The pattern is a trie over every sequence in `emoji.EMOJI_DATA`, compiled
+    once into a single regex, so scanning a message (or a batch of messages)
+    is one pass of the regex engine. Runs of characters that cannot start an
+    emoji are consumed by a leading bitmap class instead of being tested
+    against each of the trie's first characters.
+    """
+
+    def __init__(self, sequences=None):
+        trie = {}
+        for sequence in (emoji.EMOJI_DATA if sequences is None else sequences):
+            node = trie
+            for char in sequence:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        # Matches either a skipped run (group empty) or one emoji
+        skip = _character_class(char for char in BMP_CHARACTERS if char not in trie)
+        root = [(char, re.escape(char) + _trie_pattern(child)) for char, child in sorted(trie.items())]
+        self.pattern = re.compile(f'{skip}+|({_dispatch(root)})')
+
+    def find(self, text: str) -> list:
+        """
+        Emojis in `text`, in order of appearance.
+        """
+        return [match for match in self.pattern.findall(text) if match]
+
+    def count(self, messages) -> Counter:
+        """
+        Counts the emojis of many messages with one scan over their concatenation.
+        """
+        counts = Counter(self.pattern.findall(BATCH_SEPARATOR.join(messages)))
+        counts.pop('', None)
+        return counts
@@ -0,0 +1,256 @@
+import asyncio
+import codecs
+import queue
+
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+# Bytes looked at to detect the encoding of an export without a byte order mark
+ENCODING_SAMPLE_BYTES = 64
+
+# Longer BOMs first: the UTF-32 LE mark starts with the UTF-16 LE one
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# Upload chunks waiting for the worker thread before the receiving side blocks
+PIPE_MAX_CHUNKS = 64
+
+# Combined size limit of the form fields next to the file
+MAX_FIELD_BYTES = 64 * 1024
+
+
+def _latin1_fallback(error: UnicodeDecodeError):
+    return error.object[error.start:error.end].decode('latin-1'), error.end
+
+
+# Bytes that are not valid UTF-8 are read as Latin-1, one by one, so legacy
+# exports still decode (the only other encoding WhatsApp exports come in)
+codecs.register_error('latin-1-fallback', _latin1_fallback)
+
+
+def detect_encoding(head: bytes) -> tuple:
+    """
+    (encoding, BOM length) of an export from its first bytes: the byte order
+    mark if there is one, else UTF-16 when every other byte is NUL (mostly
+    ASCII text, as chat headers are), else UTF-8.
+    """
+    for bom, encoding in BYTE_ORDER_MARKS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+    sample = head[:ENCODING_SAMPLE_BYTES]
+    sample = sample[:len(sample) - len(sample) % 2]
+    if sample:
+        pairs = len(sample) // 2
+        even_nuls, odd_nuls = sample[0::2].count(0), sample[1::2].count(0)
+        if odd_nuls * 2 > pairs and even_nuls == 0:
+            return 'utf-16-le', 0
+        if even_nuls * 2 > pairs and odd_nuls == 0:
+            return 'utf-16-be', 0
+    return 'utf-8', 0
+
+
+class StreamDecoder:
+    """
+    Incremental bytes -> str decoding of one export. The encoding is detected
+    from the first ENCODING_SAMPLE_BYTES (see detect_encoding) and the BOM is
+    dropped. Invalid UTF-8 falls back to Latin-1 per byte; invalid UTF-16/32
+    becomes U+FFFD.
+    """
+
+    def __init__(self):
+        self.encoding = None
+        self._decoder = None
+        self._head = b''
+
+    def decode(self, data: bytes, final: bool = False) -> str:
+        if self._decoder is None:
+            self._head += data
+            if len(self._head) < ENCODING_SAMPLE_BYTES and not final:
+                return ''
+            self.encoding, bom_length = detect_encoding(self._head)
+            errors = 'latin-1-fallback' if self.encoding == 'utf-8' else 'replace'
+            self._decoder = codecs.getincrementaldecoder(self.encoding)(errors)
+            data, self._head = self._head[bom_length:], b''
+        return self._decoder.decode(data, final)
+
+
+class UploadError(Exception):
+    """
+    A malformed upload; `status_code` and `detail` as on HTTPException.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class MultipartReader:
+    """
+    Incremental multipart/form-data parser for one upload request.
+
+    write() returns the data of the `file_field` part as it arrives, so the
+    file is never held whole; `filename` is set once that part's headers
+    have been read. The other fields are collected into `fields` (as str,
+    up to MAX_FIELD_BYTES together).
+    """
+
+    def __init__(self, content_type: str, file_field: str = 'file'):
+        mime, params = parse_options_header(content_type)
+        if mime != b'multipart/form-data' or not params.get(b'boundary'):
+            raise UploadError(422, "Expected a multipart/form-data upload with a 'file' field.")
+        self.file_field = file_field
+        self.filename = None
+        self.fields = {}
+        self._field_bytes = 0
+        self._header_field = b''
+        self._header_value = b''
+        self._headers = {}
+        # Name of the form field being read; None while in the file part
+        self._part = None
+        self._in_file = False
+        self._value = []
+        self._file_chunks = []
+        self._parser = MultipartParser(params[b'boundary'], {
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part = None
+        self._in_file = False
+        self._value = []
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b''
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b'content-disposition', b''))
+        name = params.get(b'name', b'').decode('utf-8', 'replace')
+        if name == self.file_field and self.filename is None:
+            self._in_file = True
+            self.filename = params.get(b'filename', b'').decode('utf-8', 'replace')
+        else:
+            self._part = name
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._file_chunks.append(data[start:end])
+            return
+        self._field_bytes += end - start
+        if self._field_bytes > MAX_FIELD_BYTES:
+            raise UploadError(413, "Form fields too large.")
+        self._value.append(data[start:end])
+
+    def _on_part_end(self):
+        if not self._in_file and self._part is not None:
+            self.fields[self._part] = b''.join(self._value).decode('utf-8', 'replace')
+        self._in_file = False
+
+    def write(self, data: bytes) -> list:
+        """
+        Parses the next piece of the request body; returns the file data in it.
+        """
+        try:
+            self._parser.write(data)
+        except UploadError:
+            raise
+        except Exception as e:
+            raise UploadError(400, f"Malformed multipart upload: {e}")
+        chunks, self._file_chunks = self._file_chunks, []
+        return chunks
+
+    def finish(self):
+        try:
+            self._parser.finalize()
+        except Exception as e:
+            raise UploadError(400, f"Malformed multipart upload: {e}")
+        if self.filename is None:
+            raise UploadError(422, f"No '{self.file_field}' field in the upload.")
+
+
+# Tells ChunkPipe's worker to stop without finishing
+_ABORT = object()
+
+
+class ChunkPipe:
+    """
+    Hands chunks from the event loop to `consume(chunk)` on a worker thread
+    through a bounded queue, so processing one chunk overlaps receiving the
+    next. send() waits while PIPE_MAX_CHUNKS are queued, which pushes back
+    on the sender. close() waits for the worker and returns `finish()`.
+
+    An exception in the worker is raised by the next send() or by close().
+    """
+
+    def __init__(self, consume, finish, max_chunks: int = PIPE_MAX_CHUNKS):
+        self._consume = consume
+        self._finish = finish
+        self._queue = queue.Queue(max_chunks)
+        self._error = None
+        self._aborted = False
+        self._task = asyncio.ensure_future(asyncio.to_thread(self._work))
+
+    def _work(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is _ABORT:
+                return None
+            if chunk is None:
+                if self._error is not None:
+                    raise self._error
+                return self._finish()
+            if self._error is None and not self._aborted:
+                try:
+                    self._consume(chunk)
+                except Exception as e:
+                    # Keep draining so the sender never blocks on a full queue
+                    self._error = e
+
+    async def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            await asyncio.to_thread(self._queue.put, item)
+
+    async def send(self, chunk: bytes):
+        if self._error is not None:
+            await self.close()
+        await self._put(chunk)
+
+    async def close(self):
+        await self._put(None)
+        return await self._task
+
+    async def abort(self):
+        """
+        Stops the worker, dropping queued chunks; errors are ignored.
+        """
+        self._aborted = True
+        if self._task.done():
+            if not self._task.cancelled():
+                self._task.exception()
+            return
+        await self._put(_ABORT)
+        try:
+            await self._task
+        except Exception:
+            pass
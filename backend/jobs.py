@@ -0,0 +1,202 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+
+class QueueFull(Exception):
+    """
+    Raised by JobQueue.submit when `max_depth` jobs are already queued or running.
+    """
+
+
+class ShuttingDown(Exception):
+    status_code = 503
+    detail = "Server is shutting down. Please submit the file again."
+
+
+@dataclass
+class Job:
+    """
+    One analysis job. `status` goes queued -> running -> done | failed;
+    while running, `stage` and `done`/`total` report progress.
+    """
+    id: str
+    status: str = 'queued'
+    stage: str = None
+    done: int = 0
+    total: int = 0
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = None
+    # Serialized JSON result of a finished job
+    result: bytes = field(default=None, repr=False)
+    error: str = None
+    status_code: int = None
+
+    def report(self, stage: str, done: int = 0, total: int = 0):
+        self.stage, self.done, self.total = stage, done, total
+
+    def to_json(self) -> bytes:
+        """
+        The job as a JSON object; a finished job's result is embedded as is,
+        without decoding it.
+        """
+        body = {
+            'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': {'done': self.done, 'total': self.total},
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+        if self.error is not None:
+            body['error'] = self.error
+            body['status_code'] = self.status_code
+        encoded = json.dumps(body).encode('utf-8')
+        if self.result is None:
+            return encoded
+        return encoded[:-1] + b', "result": ' + self.result + b'}'
+
+
+class JobQueue:
+    """
+    In-process job queue served by a fixed number of worker threads.
+
+    submit() refuses new jobs once `max_depth` are queued or running, which
+    bounds both the backlog and the memory held by waiting uploads. Finished
+    jobs are kept for `ttl` seconds, then dropped.
+    """
+
+    def __init__(self, workers: int = 2, max_depth: int = 16, ttl: float = 3600):
+        self.max_depth = max_depth
+        self.ttl = ttl
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._closed = False
+        self._counters = {'submitted': 0, 'rejected': 0, 'done': 0, 'failed': 0, 'expired': 0}
+        self._threads = [
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, task) -> Job:
+        """
+        Queues `task(job)`, which returns the job's serialized result.
+        Exceptions fail the job; their `status_code` and `detail` attributes
+        (as on HTTPException) are kept, anything else is reported as a 500.
+        """
+        job = self.reserve()
+        self.start(job, task)
+        return job
+
+    def reserve(self) -> Job:
+        """
+        Admits a job whose task is not known yet (e.g. while its upload is
+        received): it counts towards `max_depth` from now on. Raises
+        QueueFull. Follow with start() or discard().
+        """
+        with self._lock:
+            self._expire()
+            if self._pending >= self.max_depth:
+                self._counters['rejected'] += 1
+                raise QueueFull()
+            job = self._add()
+            self._pending += 1
+        return job
+
+    def start(self, job: Job, task):
+        """
+        Queues `task(job)` for a reserved job (see submit).
+        """
+        with self._lock:
+            self._counters['submitted'] += 1
+        self._queue.put((job, task))
+
+    def discard(self, job: Job):
+        """
+        Drops a reserved job that is not started.
+        """
+        with self._lock:
+            if self._jobs.pop(job.id, None) is not None:
+                self._pending -= 1
+
+    def finished(self, result: bytes) -> Job:
+        """
+        Records a job that is already done, e.g. answered from a cache.
+        """
+        with self._lock:
+            self._expire()
+            job = self._add()
+            job.status, job.result, job.finished_at = 'done', result, time.time()
+            self._counters['submitted'] += 1
+            self._counters['done'] += 1
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def _add(self) -> Job:
+        job = Job(id=uuid.uuid4().hex)
+        self._jobs[job.id] = job
+        return job
+
+    def _expire(self):
+        deadline = time.time() - self.ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < deadline
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self._counters['expired'] += len(expired)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job, task = item
+            job.status = 'running'
+            try:
+                if self._closed:
+                    raise ShuttingDown()
+                result = task(job)
+            except Exception as e:
+                job.error = str(getattr(e, 'detail', e))
+                job.status_code = getattr(e, 'status_code', 500)
+                status = 'failed'
+            else:
+                job.result = result
+                status = 'done'
+            with self._lock:
+                job.status, job.finished_at = status, time.time()
+                self._pending -= 1
+                self._counters[status] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = self._pending
+            stats['max_depth'] = self.max_depth
+            stats['workers'] = len(self._threads)
+            stats['stored'] = len(self._jobs)
+            return stats
+
+    def close(self):
+        """
+        Lets the workers finish their current job, fails the queued ones and
+        stops the workers.
+        """
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
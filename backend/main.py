@@ -1,12 +1,119 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from analyzer import WhatsAppAnalyzer
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from analyzer import ExportScan, WhatsAppAnalyzer, DEFAULT_SHARD_SIZE, ANALYSIS_VERSION
+from cache import ParsedChatCache, ResultCache, StateStore, content_key
+from store import MemoryBudget, estimate_analysis_bytes
+from jobs import JobQueue, QueueFull
+from ingest import ChunkPipe, MultipartReader, UploadError
+from archive import find_chat_member, iter_member, media_index, media_stats
+from options import DEFAULT_OPTIONS, AnalysisOptions
+from profiling import MetricsRegistry, Profile
+import logging
 import uvicorn
-import traceback
-import sys
+import os
 import asyncio
+import hashlib
+import json
+import tempfile
+import zipfile
 
-app = FastAPI(title="WhatsApp Sentiment Analyzer")
+# LOG_LEVEL=DEBUG shows per-line parser decisions; they cost nothing at INFO
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger("main")
+
+# Parsed chats and their sentiment scores, memory-mapped from PARSED_CACHE_PATH
+# so re-analyzing a known export skips parsing and scoring (unset = disabled)
+parsed_cache = ParsedChatCache(
+    os.environ["PARSED_CACHE_PATH"],
+    max_bytes=int(os.environ.get("PARSED_CACHE_MAX_BYTES", 4 * 1024 * 1024 * 1024)),
+    namespace=ANALYSIS_VERSION,
+) if os.environ.get("PARSED_CACHE_PATH") else None
+
+# Parallel analysis is opt-in: ANALYZER_WORKERS > 1 shards the per-message
+# stages of each upload across a process pool that lives as long as the app.
+analyzer = WhatsAppAnalyzer(
+    workers=int(os.environ.get("ANALYZER_WORKERS", "0")),
+    shard_size=int(os.environ.get("ANALYZER_SHARD_SIZE", DEFAULT_SHARD_SIZE)),
+    parsed_cache=parsed_cache,
+)
+
+# Finished /analyze responses keyed by a hash of the uploaded bytes.
+# RESULT_CACHE_PATH adds a SQLite tier that survives restarts.
+result_cache = ResultCache(
+    max_bytes=int(os.environ.get("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    disk_path=os.environ.get("RESULT_CACHE_PATH") or None,
+    disk_max_bytes=int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024)),
+)
+
+# Analysis state of recently uploaded chats, so a re-upload of a grown export
+# only parses and scores the appended messages
+chat_states = StateStore(max_entries=int(os.environ.get("INCREMENTAL_STATE_SLOTS", 32)))
+
+# Estimated memory of all analyses in flight is kept under this many bytes;
+# uploads that would exceed it are rejected (jobs wait) before parsing starts (0 = no limit)
+memory_budget = MemoryBudget(max_bytes=int(os.environ.get("ANALYZER_MEMORY_BUDGET_BYTES", 2 * 1024 * 1024 * 1024)))
+
+# Background analysis jobs (POST /jobs): JOB_WORKERS threads, at most
+# JOB_QUEUE_DEPTH jobs queued or running, results kept for JOB_RESULT_TTL_SECONDS
+job_queue = JobQueue(
+    workers=int(os.environ.get("JOB_WORKERS", 2)),
+    max_depth=int(os.environ.get("JOB_QUEUE_DEPTH", 16)),
+    ttl=float(os.environ.get("JOB_RESULT_TTL_SECONDS", 3600)),
+)
+
+# Per-stage timings of every analysis, served at /metrics. Peak allocations
+# are traced only with ANALYZER_TRACE_MEMORY=1 (slow) or for debug requests.
+metrics = MetricsRegistry()
+TRACE_MEMORY = os.environ.get("ANALYZER_TRACE_MEMORY", "0") == "1"
+
+# Maximum upload size (10MB by default). Uploads are spooled to a temporary
+# file as they arrive and parsed from there, never held whole, so this can go
+# up to hundreds of MB.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+
+# Largest accepted zip export (chat text plus media). Zips are spooled to a
+# temporary file, and only the chat text in them counts towards MAX_UPLOAD_BYTES.
+MAX_ARCHIVE_BYTES = int(os.environ.get("MAX_ARCHIVE_BYTES", 256 * 1024 * 1024))
+
+# Uploads up to this size are spooled in memory rather than to a temporary file
+SPOOL_MEMORY_BYTES = 1024 * 1024
+
+# Bytes read from a spooled upload per parser step
+SPOOL_CHUNK_BYTES = 1 << 20
+
+# Seconds an upload may stall before it is abandoned
+UPLOAD_IDLE_TIMEOUT = float(os.environ.get("UPLOAD_IDLE_TIMEOUT_SECONDS", 30))
+
+# Request body of /analyze and /jobs, which receive_upload reads itself
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "options": {"type": "string", "description": "Analysis options as a JSON object"},
+            },
+        }}},
+    },
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    job_queue.close()
+    analyzer.close()
+    result_cache.close()
+
+app = FastAPI(title="WhatsApp Sentiment Analyzer", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -22,64 +129,355 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-analyzer = WhatsAppAnalyzer()
-
 @app.get("/")
 async def root():
     return {"message": "WhatsApp Sentiment Analyzer API is running"}
 
-@app.post("/analyze")
-async def analyze_chat(file: UploadFile = File(...)):
-    if not file.filename.endswith('.txt'):
-        raise HTTPException(status_code=400, detail="Only .txt files are supported")
-    
+@app.get("/cache/stats")
+async def cache_stats():
+    return await asyncio.to_thread(result_cache.stats)
+
+@app.get("/cache/parsed/stats")
+async def parsed_cache_stats():
+    if parsed_cache is None:
+        raise HTTPException(status_code=404, detail="The parsed-chat cache is not enabled (set PARSED_CACHE_PATH).")
+    return parsed_cache.stats()
+
+@app.get("/memory/stats")
+async def memory_stats():
+    return memory_budget.stats()
+
+@dataclass
+class Upload:
+    """
+    A received upload, spooled and not parsed yet: the export's bytes (a chat
+    text or a zip export), their size and SHA-256 digest, the other form
+    fields, and the analysis memory reserved for it once it is scanned. For a
+    chat text, `scan` is the ExportScan run while it arrived, holding the
+    state it took from `chat_states` until the analysis uses it. For a zip
+    export, `media_index` is read from the archive's directory when the
+    analysis opens it (see open_export).
+    """
+    spool: object
+    archive: bool
+    fields: dict
+    profile: Profile
+    size: int = 0
+    digest: bytes = None
+    reserved_bytes: int = 0
+    media_index: dict = None
+    scan: ExportScan = None
+
+    def close(self):
+        self.spool.close()
+        # Not analyzed (a cache hit, invalid options, a failed upload): give
+        # back the chat state the scan took
+        if self.scan is not None and self.scan.state is not None:
+            chat_states.put(self.scan.chat, self.scan.state)
+        self.scan = None
+
+def is_archive(filename: str) -> bool:
+    """
+    True for a zip export, False for a chat text; 400 for anything else.
+    """
+    filename = (filename or '').lower()
+    if filename.endswith('.zip'):
+        return True
+    if not filename.endswith('.txt'):
+        raise HTTPException(status_code=400, detail="Only .txt files and .zip chat exports are supported")
+    return False
+
+def open_export(upload: Upload):
+    """
+    Returns read() for analyzer.analyze_source: a fresh iterator over the
+    chat text's bytes, from the spooled file or, for a zip export, from its
+    chat text member (decompressed as it is read, nothing else extracted).
+    """
+    spool, profile = upload.spool, upload.profile
+    if not upload.archive:
+        def read():
+            spool.seek(0)
+            return iter(lambda: spool.read(SPOOL_CHUNK_BYTES), b"")
+        return read
+
     try:
-        # Read file with timeout protection
-        try:
-            content = await asyncio.wait_for(file.read(), timeout=30.0)
-        except asyncio.TimeoutError:
-            raise HTTPException(status_code=408, detail="File upload timeout. Please try a smaller file or contact support.")
-        
-        # Check file size (limit to 10MB)
-        if len(content) > 10 * 1024 * 1024:
-            raise HTTPException(status_code=413, detail="File too large. Maximum size is 10MB.")
-        
-        # Decode content, handling potential encoding issues
-        try:
-            text_content = content.decode('utf-8')
-        except UnicodeDecodeError:
-            text_content = content.decode('latin-1')
-            
-        # Process with timeout (5 minutes for analysis)
+        with profile.stage('archive'):
+            archive = zipfile.ZipFile(spool)
+            chat = find_chat_member(archive)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="The uploaded file is not a valid zip archive.")
+    if chat is None:
+        raise HTTPException(status_code=400, detail="No chat text (_chat.txt) found in the zip archive.")
+    if chat.file_size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Chat text too large. Maximum size is {MAX_UPLOAD_BYTES / 2**20:g}MB.")
+    with profile.stage('archive'):
+        upload.media_index = media_index(archive, chat)
+
+    def read():
+        members = iter_member(archive, chat)
         try:
-            df = await asyncio.wait_for(
-                asyncio.to_thread(analyzer.parse_chat, text_content),
-                timeout=300.0
-            )
-        except asyncio.TimeoutError:
-            raise HTTPException(status_code=408, detail="Analysis timeout. The file may be too large or complex.")
+            while True:
+                # Decompression counts as 'archive', not as the stage reading it
+                with profile.stage('archive'):
+                    chunk = next(members, None)
+                if chunk is None:
+                    return
+                yield chunk
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+            raise HTTPException(status_code=400, detail=f"Could not read the chat text from the zip archive: {e}")
+    return read
+
+async def receive_upload(request: Request, profile: Profile) -> Upload:
+    """
+    Reads the multipart upload of /analyze and /jobs as it arrives. Each
+    chunk of the file is size-checked, then hashed and spooled on a worker
+    thread while the next one is received. A chat text is also decoded and
+    scanned there (the first pass of analyzer.analyze_source), so only the
+    parse is left once the transfer ends; nothing is parsed yet, so a result
+    cache hit costs no more than the transfer (see run_analysis for the
+    rest). A zip export is only spooled: its chat text can be read once the
+    archive's directory, at its end, has arrived.
+    """
+    try:
+        reader = MultipartReader(request.headers.get("content-type", ""))
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    upload = None
+    digest = hashlib.sha256()
+    
+    def consume(chunk: bytes):
+        digest.update(chunk)
+        upload.spool.write(chunk)
+        if upload.scan is not None:
+            upload.scan.feed(chunk)
+    
+    def open_pipe() -> ChunkPipe:
+        nonlocal upload, max_bytes
+        archive = is_archive(reader.filename)
+        upload = Upload(
+            spool=tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES),
+            archive=archive, fields=reader.fields, profile=profile,
+        )
+        max_bytes = MAX_ARCHIVE_BYTES if archive else MAX_UPLOAD_BYTES
+        if archive:
+            return ChunkPipe(consume, lambda: None)
+        upload.scan = ExportScan(chat_states.take, profile)
+        return ChunkPipe(consume, upload.scan.close)
+    
+    pipe = None
+    max_bytes = MAX_UPLOAD_BYTES
+    size = 0
+    body = request.stream().__aiter__()
+    try:
+        while True:
+            try:
+                data = await asyncio.wait_for(body.__anext__(), timeout=UPLOAD_IDLE_TIMEOUT)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=408, detail="File upload timeout. Please try a smaller file or contact support.")
+            for chunk in reader.write(data):
+                if pipe is None:
+                    pipe = open_pipe()
+                # Enforced as the bytes arrive, not after the fact
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_bytes / 2**20:g}MB.")
+                await pipe.send(chunk)
+        reader.finish()
+        if pipe is None:
+            # An empty file
+            pipe = open_pipe()
+        await pipe.close()
+    except BaseException as e:
+        if pipe is not None:
+            await pipe.abort()
+        if upload is not None:
+            upload.close()
+        if isinstance(e, UploadError):
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        raise
+    upload.size = size
+    upload.digest = digest.digest()
+    profile.count('upload_bytes', size)
+    return upload
+
+def parse_options(options: str) -> AnalysisOptions:
+    """
+    Analysis options from the optional "options" form field (a JSON object,
+    see AnalysisOptions); 422 if it is malformed.
+    """
+    if not options:
+        return DEFAULT_OPTIONS
+    try:
+        return AnalysisOptions.from_dict(json.loads(options))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid options: {e}")
+
+async def upload_cache_key(upload: Upload, debug: bool):
+    """
+    (options, result cache key, cached body or None) of a received upload.
+    The upload is closed if its options are invalid. The lookup may read the
+    cache's SQLite tier, so it runs on a worker thread.
+    """
+    try:
+        options = parse_options(upload.fields.get("options"))
+    except HTTPException:
+        upload.close()
+        raise
+    cache_key = content_key(upload.digest, ANALYSIS_VERSION, options.cache_key())
+    # Debug requests always run, to report a real profile
+    cached = None if debug else await asyncio.to_thread(result_cache.get, cache_key)
+    return options, cache_key, cached
+
+def run_analysis(upload: Upload, cache_key: str, progress=None, debug: bool = False,
+                 options: AnalysisOptions = DEFAULT_OPTIONS, wait_for_memory: bool = False) -> bytes:
+    """
+    Parses and analyzes a received upload, then closes it, and returns the
+    serialized response body. Runs in a worker thread; shared by /analyze and
+    background jobs. With `debug`, the body also carries the analysis profile
+    under "debug" (not cached).
+
+    The export is hashed first; analysis memory is then reserved from its
+    size and line count, before any parsing: 413 if it could never fit the
+    budget, else 503 if it does not fit next to the analyses in flight (or,
+    with `wait_for_memory`, once it does).
+    """
+    profile = upload.profile
+    
+    def admit(scan):
+        required_bytes = estimate_analysis_bytes(scan.size, scan.lines + 1, streamed=True)
+        if not memory_budget.fits(required_bytes):
+            raise HTTPException(status_code=413, detail="File too large to analyze within the server's memory budget.")
+        if not memory_budget.reserve(required_bytes, wait=wait_for_memory):
+            raise HTTPException(status_code=503, detail="Server is busy analyzing other files. Please try again shortly.")
+        upload.reserved_bytes = required_bytes
+    
+    # Media statistics attribute files to messages, so they need the whole export parsed
+    want_media = upload.archive and options.media_stats
+    # From here on the analysis owns the state the scan took
+    scan, upload.scan = upload.scan, None
+    try:
+        # Resumes the previous export of the same chat when this one extends it
+        results, state, scan = analyzer.analyze_source(
+            open_export(upload), chat_states.take, progress, profile, options, admit=admit, resume=not want_media,
+            scan=scan,
+        )
+        if results and want_media:
+            with profile.stage('archive'):
+                results["media_stats"] = media_stats(scan.store, upload.media_index)
+    finally:
+        memory_budget.release(upload.reserved_bytes)
+        upload.reserved_bytes = 0
+        upload.close()
+        profile.finish()
+        metrics.observe(profile)
+    
+    if not results:
+        raise HTTPException(status_code=400, detail="Could not parse any messages from the file. Ensure it's a valid WhatsApp export.")
+    chat_states.put(scan.chat, state)
+    memory_budget.record(state.total_messages, state.store_bytes)
+    
+    body = JSONResponse(content=jsonable_encoder(results)).body
+    result_cache.put(cache_key, body)
+    logger.info("Analyzed %d messages (%d bytes) in %.2fs", profile.counts.get('messages', 0), upload.size, profile.seconds)
+    if debug:
+        results["debug"] = profile.as_dict()
+        body = JSONResponse(content=jsonable_encoder(results)).body
+    return body
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    gauges = {
+        "memory_reserved_bytes": memory_budget.stats()["reserved_bytes"],
+        "jobs_pending": job_queue.stats()["pending"],
+    }
+    for name, value in (await asyncio.to_thread(result_cache.stats)).items():
+        gauges[f"result_cache_{name}"] = value
+    if parsed_cache is not None:
+        for name, value in parsed_cache.stats().items():
+            gauges[f"parsed_cache_{name}"] = value
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.post("/analyze", openapi_extra=UPLOAD_OPENAPI)
+async def analyze_chat(request: Request, debug: bool = False):
+    try:
+        upload = await receive_upload(request, Profile(trace_memory=TRACE_MEMORY or debug))
         
-        if df.empty:
-            raise HTTPException(status_code=400, detail="Could not parse any messages from the file. Ensure it's a valid WhatsApp export.")
+        # Identical uploads with the same options are answered from the cache
+        # without touching the analyzer
+        options, cache_key, cached = await upload_cache_key(upload, debug)
+        if cached is not None:
+            upload.close()
+            return Response(content=cached, media_type="application/json")
         
-        # Analyze with timeout
+        # Analyze with timeout (10 minutes)
         try:
-            results = await asyncio.wait_for(
-                asyncio.to_thread(analyzer.analyze_sentiment, df),
-                timeout=300.0
+            body = await asyncio.wait_for(
+                asyncio.to_thread(run_analysis, upload, cache_key, debug=debug, options=options),
+                timeout=600.0
             )
         except asyncio.TimeoutError:
             raise HTTPException(status_code=408, detail="Analysis timeout. The file may be too large or complex.")
         
-        return results
+        return Response(content=body, media_type="application/json")
         
     except HTTPException:
         # Re-raise HTTP exceptions (they already have proper status codes)
         raise
     except Exception as e:
-        traceback.print_exc(file=sys.stderr)
+        logger.exception("Analysis failed")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@app.post("/jobs", status_code=202, openapi_extra=UPLOAD_OPENAPI)
+async def submit_job(request: Request, debug: bool = False):
+    """
+    Accepts an upload for background analysis and returns its job id as
+    soon as the upload is received; parsing and analysis run in the job.
+    Poll GET /jobs/{id} for progress and the result.
+    """
+    # Admission first, so a full queue turns uploads away before they are sent
+    try:
+        job = job_queue.reserve()
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Too many files are waiting for analysis. Please try again shortly.")
+    try:
+        upload = await receive_upload(request, Profile(trace_memory=TRACE_MEMORY or debug))
+        options, cache_key, cached = await upload_cache_key(upload, debug)
+    except BaseException:
+        job_queue.discard(job)
+        raise
+    
+    if cached is not None:
+        upload.close()
+        job_queue.discard(job)
+        job = job_queue.finished(cached)
+    else:
+        def task(job):
+            try:
+                return run_analysis(upload, cache_key, progress=job.report, debug=debug, options=options,
+                                    wait_for_memory=True)
+            except HTTPException:
+                raise
+            except Exception:
+                logger.exception("Analysis failed")
+                raise
+        
+        job_queue.start(job, task)
+    
+    return {"id": job.id, "status": job.status}
+
+@app.get("/jobs/stats")
+async def job_stats():
+    return job_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found. Results expire after a while; please submit the file again.")
+    return Response(content=job.to_json(), media_type="application/json")
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app", 
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import math
+import string
+from dataclasses import asdict, dataclass, fields
+from functools import cached_property
+
+# Sections of the analysis results a caller can ask for. The summary fields
+# (total_messages, participants, total_duration, avg_messages_per_day,
+# datetime_format) are always returned.
+SECTIONS = (
+    'sentiment_by_person',
+    'hourly_activity',
+    'conversation_initiation',
+    'response_times',
+    'response_matrix',
+    'sessions',
+    'emoji_stats',
+    'word_clouds',
+    'domain_stats',
+)
+
+# Stopwords (and participant names) are compared without punctuation, lowercased
+STOPWORD_PUNCTUATION_MAP = str.maketrans('', '', string.punctuation + '’‘“”')
+
+
+def normalize_words(words) -> frozenset:
+    return frozenset(word.translate(STOPWORD_PUNCTUATION_MAP).lower() for word in words)
+
+
+# Basic English stopwords plus chat filler words
+DEFAULT_STOPWORDS = normalize_words([
+    # English stopwords (NLTK), apostrophes dropped
+    'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', 'youre', 'youve', 'youll', 'youd',
+    'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', 'shes', 'her', 'hers',
+    'herself', 'it', 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which', 'who',
+    'whom', 'this', 'that', 'thatll', 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been',
+    'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but',
+    'if', 'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against',
+    'between', 'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down',
+    'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when',
+    'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no',
+    'nor', 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don',
+    'dont', 'should', 'shouldve', 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', 'arent',
+    'couldn', 'couldnt', 'didn', 'didnt', 'doesn', 'doesnt', 'hadn', 'hadnt', 'hasn', 'hasnt', 'haven',
+    'havent', 'isn', 'isnt', 'ma', 'mightn', 'mightnt', 'mustn', 'mustnt', 'needn', 'neednt', 'shan', 'shant',
+    'shouldn', 'shouldnt', 'wasn', 'wasnt', 'weren', 'werent', 'won', 'wont', 'wouldn', 'wouldnt',
+    # Media placeholders
+    'omitted', 'media', 'image', 'video', 'sticker', 'gif',
+    # Chat filler words
+    'like', 'yeah', 'would', 'got', 'also', 'actually', 'get', 'yes', 'well', 'really', 'know', 'bit',
+    'thats', 'could', 'going', 'one', 'see', 'lot', 'say', 'said', 'thought', 'time', 'much', 'back', 'im',
+    'hes', 'quite', 'sure', 'want', 'people', 'thank', 'still', 'probably', 'great', 'thanks', 'maybe',
+    'make', 'even', 'need', 'new', 'looks', 'first', 'last', 'ive', 'ill', 'though', 'think', 'right', 'come',
+    # Common contractions without apostrophes
+    'cant', 'theyre', 'weve',
+])
+
+# Largest accepted value of each numeric option (the smallest is 0)
+OPTION_LIMITS = {
+    'sentiment_threshold': 1,
+    'response_window_minutes': 7 * 24 * 60,
+    'conversation_gap_hours': 30 * 24,
+    'top_emojis': 1000,
+    'top_domains': 1000,
+    'top_words': 1000,
+}
+
+
+@dataclass(frozen=True)
+class AnalysisOptions:
+    """
+    Parameters of one analysis and the result sections to compute.
+
+    - `sections`: subset of SECTIONS; the per-message work only they need
+      (sentiment scoring, word counting, emoji and link extraction) is
+      skipped for the others
+    - `sentiment_threshold`: compound score at or above which a message is
+      positive (at or below its negative, negative)
+    - `response_window_minutes`: longest gap after another author's message
+      that still counts as a response
+    - `conversation_gap_hours`: silence after which a message starts a new
+      conversation (and session)
+    - `top_emojis`, `top_domains`, `top_words`: entries per author
+    - numeric options must be finite and within OPTION_LIMITS
+    - `stopwords` replaces the default list, `extra_stopwords` adds to it;
+      `hide_participant_names` also drops the participants' names from word clouds
+    - `media_stats`: add per-author media counts and sizes (zip uploads only,
+      read from the archive's directory)
+    """
+    sections: tuple = SECTIONS
+    sentiment_threshold: float = 0.05
+    response_window_minutes: float = 720
+    conversation_gap_hours: float = 3
+    top_emojis: int = 5
+    top_domains: int = 5
+    top_words: int = 30
+    stopwords: frozenset = DEFAULT_STOPWORDS
+    extra_stopwords: frozenset = frozenset()
+    hide_participant_names: bool = True
+    media_stats: bool = False
+
+    def __post_init__(self):
+        unknown = [section for section in self.sections if section not in SECTIONS]
+        if unknown:
+            raise ValueError(f"Unknown sections: {', '.join(map(str, unknown))}. Valid sections: {', '.join(SECTIONS)}")
+        for name, limit in OPTION_LIMITS.items():
+            value = getattr(self, name)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                    or not math.isfinite(value) or not 0 <= value <= limit:
+                raise ValueError(f"{name} must be a number from 0 to {limit}")
+        for name in ('top_emojis', 'top_domains', 'top_words'):
+            if not isinstance(getattr(self, name), int):
+                raise ValueError(f"{name} must be an integer")
+        for name in ('hide_participant_names', 'media_stats'):
+            if not isinstance(getattr(self, name), bool):
+                raise ValueError(f"{name} must be true or false")
+        for name in ('stopwords', 'extra_stopwords'):
+            words = getattr(self, name)
+            if isinstance(words, str) or not all(isinstance(word, str) for word in words):
+                raise ValueError(f"{name} must be a list of strings")
+
+        # Canonical forms, so equal options compare (and cache) equal
+        object.__setattr__(self, 'sections', tuple(section for section in SECTIONS if section in self.sections))
+        if self.stopwords is not DEFAULT_STOPWORDS:
+            object.__setattr__(self, 'stopwords', normalize_words(self.stopwords))
+        object.__setattr__(self, 'extra_stopwords', normalize_words(self.extra_stopwords))
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Options from a JSON object; missing keys keep their defaults.
+        Raises ValueError for unknown keys and invalid values.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("Options must be a JSON object")
+        names = {f.name for f in fields(cls)}
+        unknown = sorted(set(data) - names)
+        if unknown:
+            raise ValueError(f"Unknown options: {', '.join(unknown)}")
+        values = dict(data)
+        for name in ('sections', 'stopwords', 'extra_stopwords'):
+            if name in values:
+                if not isinstance(values[name], list):
+                    raise ValueError(f"{name} must be a list of strings")
+                values[name] = tuple(values[name])
+        return cls(**values)
+
+    def wants(self, section: str) -> bool:
+        return section in self.sections
+
+    @cached_property
+    def word_stopwords(self) -> frozenset:
+        return self.stopwords | self.extra_stopwords
+
+    def cache_key(self) -> str:
+        """
+        Stable digest of the options, for cache keys.
+        """
+        values = asdict(self)
+        for name in ('stopwords', 'extra_stopwords'):
+            values[name] = sorted(values[name])
+        return hashlib.sha256(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def accumulates(self, other) -> bool:
+        """
+        True if per-author accumulators built with these options can answer
+        `other`: every section it wants was accumulated, with the same
+        parameters. (Top-N counts and participant names only apply when
+        results are built.)
+        """
+        if not set(other.sections) <= set(self.sections):
+            return False
+        if other.wants('sentiment_by_person') and self.sentiment_threshold != other.sentiment_threshold:
+            return False
+        if any(other.wants(section) for section in ('sentiment_by_person', 'response_times', 'response_matrix')) \
+                and self.response_window_minutes != other.response_window_minutes:
+            return False
+        if any(other.wants(section) for section in ('conversation_initiation', 'sessions')) \
+                and self.conversation_gap_hours != other.conversation_gap_hours:
+            return False
+        if other.wants('word_clouds') and self.word_stopwords != other.word_stopwords:
+            return False
+        return True
+
+
+DEFAULT_OPTIONS = AnalysisOptions()
@@ -0,0 +1,200 @@
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Stages in pipeline order, for stable reporting
+STAGES = (
+    'cache', 'archive', 'digest', 'parse', 'datetime', 'sentiment', 'words', 'emoji', 'domains',
+    'hourly', 'response_times', 'initiation', 'sessions', 'aggregate', 'duration',
+)
+
+# Seconds buckets of the analysis duration histogram
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Profiles currently tracing; tracemalloc runs while there is at least one
+_trace_lock = threading.Lock()
+_trace_users = 0
+_trace_started = False
+
+
+def _start_tracing():
+    global _trace_users, _trace_started
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _trace_started = True
+        _trace_users += 1
+
+
+def _stop_tracing():
+    global _trace_users, _trace_started
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and _trace_started:
+            tracemalloc.stop()
+            _trace_started = False
+
+
+class Profile:
+    """
+    Per-stage wall time and call counts of one analysis, plus message and
+    byte counts. Stages may nest; a stage's time excludes its nested stages.
+
+    With `trace_memory`, each stage also records its peak Python allocation
+    above the memory in use when it started (via tracemalloc, which slows the
+    analysis down noticeably and is process-wide, so concurrent analyses show
+    up in each other's peaks). Without it, a stage costs two clock reads.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counts = {}
+        self._stack = []
+        self._started = time.perf_counter()
+        self.seconds = None
+        if trace_memory:
+            _start_tracing()
+
+    @contextmanager
+    def stage(self, name: str):
+        frame = {'nested': 0.0, 'peak': 0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent['peak'] = max(parent['peak'], peak)
+            frame['base'] = current
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            peak_bytes = 0
+            if self.trace_memory:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                peak_bytes = max(peak - frame['base'], 0)
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            if self._stack:
+                self._stack[-1]['nested'] += elapsed
+            self.add(name, elapsed - frame['nested'], peak_bytes)
+
+    def add(self, name: str, seconds: float, peak_bytes: int = 0, calls: int = 1):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'seconds': 0.0, 'calls': 0, 'peak_bytes': 0}
+        stage['seconds'] += seconds
+        stage['calls'] += calls
+        stage['peak_bytes'] = max(stage['peak_bytes'], peak_bytes)
+
+    def merge(self, stages: dict):
+        """
+        Adds stages recorded elsewhere, e.g. by a process-pool worker.
+        """
+        for name, stage in stages.items():
+            self.add(name, stage['seconds'], stage['peak_bytes'], stage['calls'])
+
+    def count(self, name: str, value: int):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def finish(self):
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self._started
+            if self.trace_memory:
+                _stop_tracing()
+
+    def as_dict(self) -> dict:
+        self.finish()
+        order = {name: i for i, name in enumerate(STAGES)}
+        return {
+            'seconds': round(self.seconds, 6),
+            'stages': {
+                name: {
+                    'seconds': round(stage['seconds'], 6),
+                    'calls': stage['calls'],
+                    **({'peak_bytes': stage['peak_bytes']} if self.trace_memory else {}),
+                }
+                for name, stage in sorted(self.stages.items(), key=lambda item: order.get(item[0], len(order)))
+            },
+            'counts': dict(self.counts),
+        }
+
+
+class MetricsRegistry:
+    """
+    Aggregates finished Profiles and renders them in the Prometheus text format.
+    """
+
+    def __init__(self, prefix: str = 'analyzer'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counts = {}
+        self._analyses = 0
+        self._duration_sum = 0.0
+        self._duration_buckets = [0] * len(DURATION_BUCKETS)
+
+    def observe(self, profile: Profile):
+        profile.finish()
+        with self._lock:
+            self._analyses += 1
+            self._duration_sum += profile.seconds
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if profile.seconds <= bound:
+                    self._duration_buckets[i] += 1
+            for name, stage in profile.stages.items():
+                total = self._stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'peak_bytes': 0})
+                total['seconds'] += stage['seconds']
+                total['calls'] += stage['calls']
+                total['peak_bytes'] = max(total['peak_bytes'], stage['peak_bytes'])
+            for name, value in profile.counts.items():
+                self._counts[name] = self._counts.get(name, 0) + value
+
+    def render(self, gauges: dict = None) -> str:
+        """
+        All metrics as Prometheus exposition text. `gauges` maps extra metric
+        names (without prefix) to current values.
+        """
+        p = self.prefix
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{p}_{name}{labels} {value}')
+
+        with self._lock:
+            stages = sorted(self._stages.items())
+            metric('stage_seconds_total', 'counter', 'Wall time spent per analysis stage.',
+                   [(f'{{stage="{name}"}}', stage['seconds']) for name, stage in stages])
+            metric('stage_calls_total', 'counter', 'Times each analysis stage ran.',
+                   [(f'{{stage="{name}"}}', stage['calls']) for name, stage in stages])
+            peaks = [(f'{{stage="{name}"}}', stage['peak_bytes']) for name, stage in stages if stage['peak_bytes']]
+            if peaks:
+                metric('stage_peak_bytes', 'gauge', 'Largest traced allocation peak seen per stage.', peaks)
+            for name, value in sorted(self._counts.items()):
+                metric(f'{name}_total', 'counter', f'Total {name.replace("_", " ")} analyzed.', [('', value)])
+
+            # Bucket counts are cumulative already (see observe)
+            buckets = [
+                (f'_bucket{{le="{bound}"}}', count)
+                for bound, count in zip(DURATION_BUCKETS, self._duration_buckets)
+            ]
+            buckets.append(('_bucket{le="+Inf"}', self._analyses))
+            buckets.append(('_sum', self._duration_sum))
+            buckets.append(('_count', self._analyses))
+            lines.append(f'# HELP {p}_analysis_seconds Wall time of whole analyses.')
+            lines.append(f'# TYPE {p}_analysis_seconds histogram')
+            for suffix, value in buckets:
+                lines.append(f'{p}_analysis_seconds{suffix} {value}')
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f'# TYPE {p}_{name} gauge')
+            lines.append(f'{p}_{name} {value}')
+        return '\n'.join(lines) + '\n'
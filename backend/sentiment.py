@@ -0,0 +1,266 @@
+import re
+import string
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from vaderSentiment.vaderSentiment import (
+    BOOSTER_DICT,
+    C_INCR,
+    N_SCALAR,
+    NEGATE,
+    SPECIAL_CASES,
+    SentimentIntensityAnalyzer,
+)
+
+# VADER re-weights sentiments around "but" with an order-dependent list walk
+# that has no array form; messages combining it with a lexicon word are
+# scored by VADER itself.
+FALLBACK_WORDS = {'but'}
+
+NEGATE_WORDS = set(NEGATE)
+
+# Leading word pairs of VADER's multi-word special cases and booster n-grams
+CONTEXT_BIGRAMS = {
+    tuple(phrase.split()[:2])
+    for phrase in chain(SPECIAL_CASES, BOOSTER_DICT)
+    if ' ' in phrase
+}
+
+
+def _character_class(chars) -> str:
+    """
+    Builds a regex character class of contiguous codepoint ranges, which the
+    regex engine tests much faster than a long list of astral-plane literals.
+    """
+    codepoints = sorted(ord(char) for char in chars)
+    ranges = []
+    for codepoint in codepoints:
+        if ranges and codepoint == ranges[-1][1] + 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    parts = []
+    for first, last in ranges:
+        if first == last:
+            parts.append(re.escape(chr(first)))
+        else:
+            parts.append(f'{re.escape(chr(first))}-{re.escape(chr(last))}')
+    return '[' + ''.join(parts) + ']'
+
+
+class BatchSentimentScorer:
+    """
+    Computes VADER compound scores for many messages at once.
+
+    Messages are deduplicated, tokenized together and looked up in the lexicon
+    once per distinct token; compound scores are then reduced with array
+    operations, including the "no", booster, negation, "least" and ALL CAPS
+    rules. The few messages that combine a lexicon word with "but" or a
+    multi-word idiom fall back to `polarity_scores`,
+    so every score is identical to
+    `SentimentIntensityAnalyzer.polarity_scores(message)['compound']`.
+    """
+
+    def __init__(self, analyzer: SentimentIntensityAnalyzer = None):
+        self.analyzer = analyzer or SentimentIntensityAnalyzer()
+        self.lexicon = self.analyzer.lexicon
+
+        # polarity_scores inspects one character at a time, so only
+        # single-codepoint emoji lexicon entries can ever match
+        self._emoji_descriptions = {
+            char: description
+            for char, description in self.analyzer.emojis.items()
+            if len(char) == 1
+        }
+        self._emoji_pattern = re.compile(_character_class(self._emoji_descriptions))
+
+        bigram_words = sorted({word for pair in CONTEXT_BIGRAMS for word in pair})
+        self._bigram_word_ids = {word: i for i, word in enumerate(bigram_words)}
+        self._bigram_codes = np.array(sorted(
+            self._bigram_word_ids[first] * len(bigram_words) + self._bigram_word_ids[second]
+            for first, second in CONTEXT_BIGRAMS
+        ), dtype=np.int64)
+
+    def _describe_emoji(self, match):
+        # Mirrors polarity_scores: descriptions are space-separated from
+        # whatever precedes them, unless that is a space or the start of text
+        start = match.start()
+        description = self._emoji_descriptions[match.group()]
+        if start == 0 or match.string[start - 1] == ' ':
+            return description
+        return ' ' + description
+
+    def score_batch(self, messages) -> np.ndarray:
+        """
+        Returns an array of compound scores, one per message.
+        """
+        texts = [str(message) for message in messages]
+        if not texts:
+            return np.zeros(0, dtype=np.float64)
+
+        codes, unique_texts = pd.factorize(pd.Series(texts, dtype=object))
+        scores = self._score_unique(list(unique_texts))
+        return scores[codes]
+
+    def _score_unique(self, texts: list) -> np.ndarray:
+        n = len(texts)
+        converted = [
+            (text if text.isascii() else self._emoji_pattern.sub(self._describe_emoji, text)).strip()
+            for text in texts
+        ]
+
+        # --- Tokenize the whole batch into one flat token array ---
+        token_lists = [text.split() for text in converted]
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=n)
+        flat_tokens = np.fromiter(chain.from_iterable(token_lists), dtype=object, count=int(lengths.sum()))
+        message_ids = np.repeat(np.arange(n), lengths)
+        positions = np.arange(len(flat_tokens)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        # --- Lexicon lookup once per distinct token ---
+        token_codes, vocabulary = pd.factorize(flat_tokens)
+        vocab = self._vocabulary_table(vocabulary)
+        tokens = {name: column[token_codes] for name, column in vocab.items()}
+
+        # --- Messages that need VADER's own scoring ---
+        has_sentiment = np.bincount(message_ids, weights=tokens['in_lexicon'], minlength=n) > 0
+        needs_vader = has_sentiment & (np.bincount(message_ids, weights=tokens['fallback'], minlength=n) > 0)
+        bigram_ids = tokens['bigram_id']
+        if len(bigram_ids) > 1:
+            first, second = bigram_ids[:-1], bigram_ids[1:]
+            adjacent = (first >= 0) & (second >= 0) & (message_ids[:-1] == message_ids[1:])
+            pair_codes = first * len(self._bigram_word_ids) + second
+            hits = adjacent & np.isin(pair_codes, self._bigram_codes)
+            needs_vader[message_ids[:-1][hits]] = True
+
+        # --- Valence of every lexicon word (SentimentIntensityAnalyzer.sentiment_valence) ---
+        upper_counts = np.bincount(message_ids, weights=tokens['is_upper'], minlength=n)
+        is_cap_diff = (upper_counts > 0) & (upper_counts < lengths)
+
+        # Boosters score 0 themselves, even when they are also lexicon words
+        items = np.flatnonzero(tokens['in_lexicon'] & ~tokens['is_booster'] & ~needs_vader[message_ids])
+        item_cap_diff = is_cap_diff[message_ids[items]]
+        item_positions = positions[items]
+
+        item_remaining = lengths[message_ids[items]] - item_positions - 1
+
+        def preceding(name, distance):
+            # Token property `distance` places before each item (False/0 at message start)
+            index = np.maximum(items - distance, 0)
+            return np.where(item_positions >= distance, tokens[name][index], tokens[name].dtype.type(0))
+
+        def following(name, distance):
+            index = np.minimum(items + distance, len(token_codes) - 1)
+            return np.where(item_remaining >= distance, tokens[name][index], tokens[name].dtype.type(0))
+
+        # "no" before another lexicon word negates it instead of scoring itself
+        lexicon_valence = tokens['valence'][items]
+        valence = np.where(tokens['is_no'][items] & following('in_lexicon', 1), 0.0, lexicon_valence)
+        negated_by_no = (
+            preceding('is_no', 1)
+            | preceding('is_no', 2)
+            | (preceding('is_no', 3) & preceding('is_or_nor', 1))
+        )
+        valence = np.where(negated_by_no, lexicon_valence * N_SCALAR, valence)
+        valence = np.where(
+            tokens['is_upper'][items] & item_cap_diff,
+            np.where(valence > 0, valence + C_INCR, valence - C_INCR),
+            valence,
+        )
+
+        for start_i, damping in enumerate((1.0, 0.95, 0.9)):
+            distance = start_i + 1
+            applies = (item_positions >= distance) & ~preceding('in_lexicon', distance)
+
+            booster = preceding('booster', distance)
+            scalar = np.where(valence < 0, -booster, booster)
+            scalar = np.where(
+                preceding('is_booster', distance) & preceding('is_upper', distance) & item_cap_diff,
+                np.where(valence > 0, scalar + C_INCR, scalar - C_INCR),
+                scalar,
+            )
+            if damping != 1.0:
+                scalar = np.where(scalar != 0, scalar * damping, scalar)
+            valence = np.where(applies, valence + scalar, valence)
+
+            # SentimentIntensityAnalyzer._negation_check
+            negated = preceding('is_negation', distance)
+            if start_i == 0:
+                amplified = np.zeros(len(items), dtype=bool)
+                kept = np.zeros(len(items), dtype=bool)
+            elif start_i == 1:
+                amplified = preceding('is_never', 2) & preceding('is_so_this', 1)
+                kept = preceding('is_without', 2) & preceding('is_doubt', 1)
+            else:
+                amplified = (preceding('is_never', 3) & preceding('is_so_this', 2)) | preceding('is_so_this', 1)
+                kept = preceding('is_without', 3) & (preceding('is_doubt', 2) | preceding('is_doubt', 1))
+            valence = np.where(applies & amplified, valence * 1.25, valence)
+            valence = np.where(applies & ~amplified & ~kept & negated, valence * N_SCALAR, valence)
+
+        # SentimentIntensityAnalyzer._least_check
+        after_least = preceding('is_least', 1) & ~preceding('in_lexicon', 1)
+        least_negates = after_least & ((item_positions == 1) | ~preceding('is_at_very', 2))
+        valence = np.where(least_negates, valence * N_SCALAR, valence)
+
+        # --- Compound score from array reductions (score_valence) ---
+        # bincount adds each message's valences left to right without
+        # compensation, like VADER's sum() on Python <= 3.11. Python 3.12's
+        # sum() compensates rounding error, so scores there may differ in the
+        # last place before rounding (see test_sentiment.py)
+        sums = np.bincount(message_ids[items], weights=valence, minlength=n)
+
+        exclamations = np.fromiter((text.count('!') for text in converted), dtype=np.int64, count=n)
+        questions = np.fromiter((text.count('?') for text in converted), dtype=np.int64, count=n)
+        emphasis = np.minimum(exclamations, 4) * 0.292 + np.where(
+            questions > 1, np.where(questions <= 3, questions * 0.18, 0.96), 0.0
+        )
+        sums = np.where(sums > 0, sums + emphasis, np.where(sums < 0, sums - emphasis, sums))
+        compound = np.clip(sums / np.sqrt(sums * sums + 15), -1.0, 1.0)
+
+        # Python's round() to match polarity_scores bit for bit
+        scores = np.array([round(value, 4) for value in compound.tolist()], dtype=np.float64)
+        for i in np.flatnonzero(needs_vader):
+            scores[i] = self.analyzer.polarity_scores(texts[i])['compound']
+        return scores
+
+    def _vocabulary_table(self, vocabulary) -> dict:
+        """
+        Per distinct raw token: the properties VADER looks up for it.
+        """
+        size = len(vocabulary)
+        table = {
+            'valence': np.zeros(size, dtype=np.float64),
+            'booster': np.zeros(size, dtype=np.float64),
+            'bigram_id': np.full(size, -1, dtype=np.int64),
+        }
+        for name in ('in_lexicon', 'is_upper', 'is_booster', 'is_negation', 'is_never', 'is_so_this',
+                     'is_without', 'is_doubt', 'is_no', 'is_or_nor', 'is_least', 'is_at_very', 'fallback'):
+            table[name] = np.zeros(size, dtype=bool)
+
+        for i, token in enumerate(vocabulary):
+            # SentiText._strip_punc_if_word
+            word = token.strip(string.punctuation)
+            if len(word) <= 2:
+                word = token
+            word_lower = word.lower()
+
+            value = self.lexicon.get(word_lower)
+            if value is not None:
+                table['valence'][i] = value
+                table['in_lexicon'][i] = True
+            if word_lower in BOOSTER_DICT:
+                table['booster'][i] = BOOSTER_DICT[word_lower]
+                table['is_booster'][i] = True
+            table['is_upper'][i] = word.isupper()
+            table['is_negation'][i] = word_lower in NEGATE_WORDS or "n't" in word_lower
+            table['is_never'][i] = word_lower == 'never'
+            table['is_so_this'][i] = word_lower in ('so', 'this')
+            table['is_without'][i] = word_lower == 'without'
+            table['is_doubt'][i] = word_lower == 'doubt'
+            table['is_no'][i] = word_lower == 'no'
+            table['is_or_nor'][i] = word_lower in ('or', 'nor')
+            table['is_least'][i] = word_lower == 'least'
+            table['is_at_very'][i] = word_lower in ('at', 'very')
+            table['fallback'][i] = word_lower in FALLBACK_WORDS
+            table['bigram_id'][i] = self._bigram_word_ids.get(word_lower, -1)
+        return table
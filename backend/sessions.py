@@ -0,0 +1,208 @@
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Percentiles reported for response times
+RESPONSE_PERCENTILES = (25, 50, 75, 90)
+
+
+def _minutes(seconds) -> float:
+    return round(float(seconds) / 60, 2)
+
+
+@dataclass
+class ResponseLog:
+    """
+    Response times per (responder, replied-to author) pair, accumulated
+    across batches as exact seconds (one int32 per response), keyed by
+    author names. Averages and percentiles are computed from every value.
+    """
+    # Pair -> arrays of response seconds, one per batch until first read
+    seconds: dict = field(default_factory=dict)
+
+    def add(self, responders: np.ndarray, targets: np.ndarray, seconds: np.ndarray, authors: list, outside_author: str = None):
+        """
+        Adds responses given as aligned arrays of author codes into `authors`
+        and response times in seconds. A target code of -1 stands for
+        `outside_author` (the last author of an earlier batch).
+        """
+        if not len(responders):
+            return
+        pair_keys = responders.astype(np.int64) * (len(authors) + 1) + (targets.astype(np.int64) + 1)
+        order = np.argsort(pair_keys, kind='stable')
+        pairs, starts = np.unique(pair_keys[order], return_index=True)
+        groups = np.split(seconds[order].astype(np.int32), starts[1:])
+
+        names = list(authors) + [outside_author]
+        for key, values in zip(pairs.tolist(), groups):
+            responder, target = divmod(key, len(authors) + 1)
+            self.seconds.setdefault((names[responder], names[target - 1]), []).append(values)
+
+    def _values(self, pair) -> np.ndarray:
+        parts = self.seconds[pair]
+        if len(parts) > 1:
+            parts[:] = [np.concatenate(parts)]
+        return parts[0]
+
+    @staticmethod
+    def _row(values: np.ndarray) -> tuple:
+        percentiles = np.percentile(values, RESPONSE_PERCENTILES)
+        return len(values), float(values.mean(dtype=np.float64)), dict(zip(RESPONSE_PERCENTILES, percentiles))
+
+    def by_person(self) -> list:
+        """
+        Response count, average and percentiles per responding author.
+        """
+        by_author = {}
+        for pair in self.seconds:
+            by_author.setdefault(pair[0], []).append(self._values(pair))
+        rows = []
+        for author in sorted(by_author):
+            count, average, percentiles = self._row(np.concatenate(by_author[author]))
+            rows.append({
+                "author": author,
+                "responses": count,
+                "avg_minutes": _minutes(average),
+                "median_minutes": _minutes(percentiles[50]),
+                **{f"p{p}_minutes": _minutes(percentiles[p]) for p in RESPONSE_PERCENTILES if p != 50},
+            })
+        return rows
+
+    def matrix(self) -> list:
+        """
+        Who replies to whom: count, average, median and 90th percentile per pair.
+        """
+        rows = []
+        for responder, target in sorted(self.seconds):
+            count, average, percentiles = self._row(self._values((responder, target)))
+            rows.append({
+                "from": responder,
+                "to": target,
+                "responses": count,
+                "avg_minutes": _minutes(average),
+                "median_minutes": _minutes(percentiles[50]),
+                "p90_minutes": _minutes(percentiles[90]),
+            })
+        return rows
+
+
+def _empty(dtype) -> np.ndarray:
+    return np.zeros(0, dtype=dtype)
+
+
+@dataclass
+class SessionLog:
+    """
+    Conversation sessions (runs of messages without a gap of silence longer
+    than the conversation gap), accumulated across batches.
+
+    Completed sessions are kept as compact per-session arrays, so medians are
+    exact. The last session stays open: messages appended later may still
+    continue it.
+    """
+    messages: np.ndarray = field(default_factory=lambda: _empty(np.int32))
+    durations: np.ndarray = field(default_factory=lambda: _empty(np.int64))
+    participants: np.ndarray = field(default_factory=lambda: _empty(np.int32))
+    # Completed sessions each author wrote in
+    author_sessions: Counter = field(default_factory=Counter)
+    open_start: int = None
+    open_end: int = None
+    open_messages: int = 0
+    open_participants: set = field(default_factory=set)
+
+    def add(self, timestamps: np.ndarray, codes: np.ndarray, authors: list, starts: np.ndarray):
+        """
+        Adds a batch of messages in time order (timestamps and author codes
+        into `authors`); `starts` marks the messages that open a new session.
+        Messages before the first start continue the open session.
+        """
+        if not len(timestamps):
+            return
+        starts = starts.copy()
+        if self.open_start is not None and starts[0]:
+            self._close_open()
+            self.open_start = None
+        continues = self.open_start is not None
+        if not continues:
+            starts[0] = True
+        # Session number per message; 0 is the open session continued, if any
+        session_ids = np.cumsum(starts) - (0 if continues else 1)
+        n_sessions = int(session_ids[-1]) + 1
+        n_authors = len(authors)
+
+        messages = np.bincount(session_ids, minlength=n_sessions)
+        first = np.flatnonzero(np.r_[True, session_ids[1:] != session_ids[:-1]])
+        last = np.r_[first[1:] - 1, len(session_ids) - 1]
+        session_start = timestamps[first]
+        session_end = timestamps[last]
+        # Distinct (session, author) pairs give participants per session and sessions per author.
+        # Keys are already ordered by session, and a stable sort (timsort) exploits those runs
+        members = np.sort(session_ids.astype(np.int64) * n_authors + codes, kind='stable')
+        members = members[np.r_[True, members[1:] != members[:-1]]]
+        member_sessions, member_codes = np.divmod(members, n_authors)
+        participants = np.bincount(member_sessions, minlength=n_sessions)
+
+        if continues:
+            self.open_participants |= {authors[code] for code in member_codes[member_sessions == 0].tolist()}
+            self.open_end = int(session_end[0])
+            self.open_messages += int(messages[0])
+            if n_sessions > 1:
+                self._close_open()
+            session_offset = 1
+        else:
+            session_offset = 0
+
+        # Every session but the last is complete now
+        done = slice(session_offset, n_sessions - 1)
+        self.messages = np.concatenate([self.messages, messages[done].astype(np.int32)])
+        self.durations = np.concatenate([self.durations, (session_end[done] - session_start[done]).astype(np.int64)])
+        self.participants = np.concatenate([self.participants, participants[done].astype(np.int32)])
+        completed = (member_sessions >= session_offset) & (member_sessions < n_sessions - 1)
+        for code, count in enumerate(np.bincount(member_codes[completed], minlength=n_authors).tolist()):
+            if count:
+                self.author_sessions[authors[code]] += count
+
+        if n_sessions > 1 or not continues:
+            self.open_start = int(session_start[-1])
+            self.open_end = int(session_end[-1])
+            self.open_messages = int(messages[-1])
+            self.open_participants = {authors[code] for code in member_codes[member_sessions == n_sessions - 1].tolist()}
+
+    def _close_open(self):
+        self.messages = np.append(self.messages, np.int32(self.open_messages))
+        self.durations = np.append(self.durations, np.int64(self.open_end - self.open_start))
+        self.participants = np.append(self.participants, np.int32(len(self.open_participants)))
+        self.author_sessions.update(self.open_participants)
+
+    def summary(self) -> dict:
+        """
+        Session statistics over the completed sessions and the open one.
+        """
+        messages, durations, participants = self.messages, self.durations, self.participants
+        author_sessions = Counter(self.author_sessions)
+        if self.open_start is not None:
+            messages = np.append(messages, self.open_messages)
+            durations = np.append(durations, self.open_end - self.open_start)
+            participants = np.append(participants, len(self.open_participants))
+            author_sessions.update(self.open_participants)
+        count = len(messages)
+        if not count:
+            return {"count": 0}
+        sizes, sessions = np.unique(participants, return_counts=True)
+        return {
+            "count": count,
+            "avg_messages": round(float(messages.mean()), 1),
+            "median_messages": float(np.median(messages)),
+            "max_messages": int(messages.max()),
+            "avg_duration_minutes": _minutes(durations.mean()),
+            "median_duration_minutes": _minutes(np.median(durations)),
+            "avg_participants": round(float(participants.mean()), 2),
+            "participants": [
+                {"participants": int(size), "sessions": int(n)} for size, n in zip(sizes, sessions)
+            ],
+            "by_person": [
+                {"author": author, "sessions": n, "share_pct": round(n / count * 100, 1)}
+                for author, n in sorted(author_sessions.items())
+            ],
+        }
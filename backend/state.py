@@ -0,0 +1,133 @@
+import hashlib
+from collections import Counter
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from options import DEFAULT_OPTIONS, AnalysisOptions
+from sessions import ResponseLog, SessionLog
+
+
+# Characters encoded per hashing step, so large exports are never copied whole
+HASH_CHUNK_SIZE = 1 << 20
+
+# Longest first line chat_key looks at
+CHAT_KEY_CHARS = 4096
+
+
+def _hash_text(text: str, start: int = 0, end: int = None, digest=None):
+    digest = digest if digest is not None else hashlib.sha256()
+    end = len(text) if end is None else end
+    for offset in range(start, end, HASH_CHUNK_SIZE):
+        digest.update(text[offset:min(offset + HASH_CHUNK_SIZE, end)].encode('utf-8'))
+    return digest
+
+
+def _digest(text: str) -> str:
+    return _hash_text(text).hexdigest()
+
+
+def chat_key(text: str) -> str:
+    """
+    Identifies a chat across exports: the hash of its first line (usually the
+    end-to-end encryption notice with the chat's creation time), which stays
+    the same as the export grows.
+    """
+    end = text.find('\n', 0, CHAT_KEY_CHARS)
+    return _digest(text[:end if end != -1 else CHAT_KEY_CHARS])
+
+
+@dataclass
+class AuthorStats:
+    """
+    Running per-author sums, counts and Counters behind every per-author section.
+    """
+    messages: int = 0
+    sentiment_sum: float = 0.0
+    length_sum: int = 0
+    positive: int = 0
+    neutral: int = 0
+    negative: int = 0
+    response_time_sum: float = 0.0
+    responses: int = 0
+    conversations_started: int = 0
+    hourly: list = field(default_factory=lambda: [0] * 24)
+    emojis: Counter = field(default_factory=Counter)
+    words: Counter = field(default_factory=Counter)
+    domains: Counter = field(default_factory=Counter)
+
+
+@dataclass
+class AnalysisState:
+    """
+    Resumable analysis of one chat export.
+
+    Holds everything analyze_sentiment's results are built from, plus what the
+    parser needs to continue where the previous export ended: the consumed
+    prefix (length and hash), the detected line and timestamp formats and the
+    dynamically excluded authors. `authors` is ordered by first appearance.
+    Only the accumulators of the sections in `options` are filled.
+    """
+    options: AnalysisOptions = DEFAULT_OPTIONS
+    authors: dict = field(default_factory=dict)
+    total_messages: int = 0
+    first_datetime: pd.Timestamp = None
+    last_datetime: pd.Timestamp = None
+    last_author: str = None
+    # Per-pair response times and conversation sessions
+    responses: ResponseLog = field(default_factory=ResponseLog)
+    sessions: SessionLog = field(default_factory=SessionLog)
+    # Bytes of the MessageStores analyzed into this state (memory accounting)
+    store_bytes: int = 0
+
+    exclude_authors: set = field(default_factory=lambda: {'you'})
+    line_pattern: object = None
+    stamp_format: object = None
+    consumed_chars: int = 0
+    prefix_digest: str = None
+    # Running hash of the prefix verified by can_resume, extended by mark_consumed
+    _resume_digest: object = field(default=None, repr=False, compare=False)
+
+    def author(self, name: str) -> AuthorStats:
+        stats = self.authors.get(name)
+        if stats is None:
+            stats = self.authors[name] = AuthorStats()
+        return stats
+
+    def can_resume(self, text: str) -> bool:
+        """
+        True if `text` is the export this state was built from plus appended
+        lines, so only text[consumed_chars:] needs parsing.
+        """
+        end = self.consumed_chars
+        if self.prefix_digest is None or end == 0 or len(text) < end:
+            return False
+        # The appended tail has to start on a fresh line
+        if text[end - 1] != '\n' and end < len(text) and text[end] != '\n':
+            return False
+        digest = _hash_text(text, 0, end)
+        if digest.hexdigest() != self.prefix_digest:
+            return False
+        self._resume_digest = digest
+        return True
+
+    def mark_consumed(self, text: str):
+        """
+        Records `text` as the export this state now covers. After a successful
+        can_resume(text) only the appended tail is hashed.
+        """
+        digest, self._resume_digest = self._resume_digest, None
+        if digest is None:
+            digest = _hash_text(text)
+        else:
+            digest = _hash_text(text, self.consumed_chars, len(text), digest)
+        self.mark_streamed(len(text), digest.hexdigest())
+
+    def mark_streamed(self, chars: int, digest: str):
+        """
+        Records an export that was hashed while it was read (see
+        analyzer.ExportScan): `chars` characters with SHA-256 hex `digest`.
+        """
+        self._resume_digest = None
+        self.consumed_chars = chars
+        self.prefix_digest = digest
@@ -0,0 +1,222 @@
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Bytes of the fixed-width columns per message: author code, timestamp, offset
+COLUMN_BYTES_PER_MESSAGE = 4 + 8 + 8
+
+# Per-message arrays analysis builds on top of the store: scores, word counts,
+# sort order, previous author/timestamp, time differences and masks
+ANALYSIS_BYTES_PER_MESSAGE = 96
+
+# Messages are stored '\n'-terminated; parsed messages never contain '\n'
+MESSAGE_TERMINATOR = b'\n'
+
+
+class MessageStore:
+    """
+    Columnar, compact storage of parsed chat messages.
+
+    - `authors`: the distinct author names, in order of first appearance
+    - `author_codes`: int32 index into `authors`, one per message
+    - `timestamps`: int64 seconds since the epoch (naive, as written in the export)
+    - `buffer` / `offsets`: every message UTF-8 encoded and '\\n'-terminated in
+      one contiguous bytes object; message i is
+      buffer[offsets[i]:offsets[i + 1] - 1] (Arrow-style, n + 1 offsets)
+
+    Derived columns (hour, datetime) are computed on demand and never stored.
+    The columns may be views of a memory-mapped file (see ParsedChatCache);
+    a memoryview `buffer` is used as is rather than copied.
+    """
+
+    def __init__(self, authors, author_codes, timestamps, offsets, buffer):
+        self.authors = list(authors)
+        self.author_codes = np.asarray(author_codes, dtype=np.int32)
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.buffer = buffer if isinstance(buffer, memoryview) else bytes(buffer)
+
+    @classmethod
+    def from_messages(cls, authors, author_codes, timestamps, messages):
+        """
+        Builds a store from aligned columns and a sequence of message strings.
+        """
+        encoded = [message.encode('utf-8') for message in messages]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(message) + 1 for message in encoded], out=offsets[1:])
+        buffer = b''.join(message + MESSAGE_TERMINATOR for message in encoded)
+        return cls(authors, author_codes, timestamps, offsets, buffer)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        """
+        Builds a store from a DataFrame with `author`, `message` and `datetime` columns.
+        """
+        if df.empty:
+            return cls.empty()
+        codes, authors = pd.factorize(df['author'].astype(object))
+        timestamps = df['datetime'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        return cls.from_messages(list(authors), codes, timestamps, [str(m) for m in df['message']])
+
+    @classmethod
+    def empty(cls):
+        return cls([], np.zeros(0), np.zeros(0), np.zeros(1), b'')
+
+    def __len__(self) -> int:
+        return len(self.author_codes)
+
+    def messages(self) -> list:
+        """
+        All messages as strings, decoded with one pass over the buffer.
+        """
+        if not len(self):
+            return []
+        return str(self.buffer[:-1], 'utf-8').split('\n')
+
+    def message(self, i: int) -> str:
+        return str(self.buffer[self.offsets[i]:self.offsets[i + 1] - 1], 'utf-8')
+
+    def slice(self, start: int, stop: int):
+        """
+        Messages [start, stop) as a new store sharing the author list (codes
+        keep their meaning). Used to hand shards to workers, so the slice of
+        the buffer is always copied into bytes, which pickle.
+        """
+        stop = min(stop, len(self))
+        begin, end = int(self.offsets[start]), int(self.offsets[stop])
+        return MessageStore(
+            self.authors,
+            self.author_codes[start:stop],
+            self.timestamps[start:stop],
+            self.offsets[start:stop + 1] - begin,
+            bytes(self.buffer[begin:end]),
+        )
+
+    def select(self, mask: np.ndarray):
+        """
+        Keeps the messages where `mask` is True and drops authors left without
+        messages (remaining codes keep their first-appearance order).
+        """
+        mask = np.asarray(mask, dtype=bool)
+        messages = [message for message, keep in zip(self.messages(), mask.tolist()) if keep]
+        used = np.bincount(self.author_codes[mask], minlength=len(self.authors)) > 0
+        remap = np.cumsum(used) - 1
+        authors = [author for author, keep in zip(self.authors, used.tolist()) if keep]
+        return MessageStore.from_messages(authors, remap[self.author_codes[mask]],
+                                          self.timestamps[mask], messages)
+
+    def hours(self) -> np.ndarray:
+        return (self.timestamps // 3600) % 24
+
+    def datetimes(self) -> np.ndarray:
+        return self.timestamps.astype('datetime64[s]')
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        The messages as a DataFrame with `author`, `message` and `datetime` columns.
+        """
+        if not len(self):
+            return pd.DataFrame()
+        return pd.DataFrame({
+            'author': np.array(self.authors, dtype=object)[self.author_codes],
+            'message': self.messages(),
+            'datetime': pd.to_datetime(self.timestamps, unit='s'),
+        })
+
+    def memory_usage(self) -> dict:
+        """
+        Bytes held per column, plus the total and bytes per message.
+        """
+        usage = {
+            'author_codes': self.author_codes.nbytes,
+            'timestamps': self.timestamps.nbytes,
+            'offsets': self.offsets.nbytes,
+            'buffer': len(self.buffer),
+            'authors': sum(sys.getsizeof(author) for author in self.authors),
+        }
+        usage['total'] = sum(usage.values())
+        usage['bytes_per_message'] = round(usage['total'] / len(self), 1) if len(self) else 0.0
+        return usage
+
+    @property
+    def nbytes(self) -> int:
+        return self.memory_usage()['total']
+
+
+def estimate_analysis_bytes(content_size: int, line_count: int, streamed: bool = False) -> int:
+    """
+    Upper estimate of the memory analyzing an upload takes, from its size and
+    line count alone: the raw upload and its decoded text, the message store
+    (never larger than the text plus its fixed-width columns) and the
+    per-message arrays of the analysis.
+
+    A `streamed` upload is parsed as it arrives and never held whole; only
+    the store counts, twice while the parser hands its buffer over. The
+    estimate is additive, so it can be reserved chunk by chunk.
+    """
+    text_copies = 2 if streamed else 3
+    return text_copies * content_size + line_count * (COLUMN_BYTES_PER_MESSAGE + ANALYSIS_BYTES_PER_MESSAGE)
+
+
+class MemoryBudget:
+    """
+    Admission control for analysis memory. Each request reserves its estimate
+    before parsing starts and releases it when done; a reservation that would
+    take the total over `max_bytes` is refused, or waits for running analyses
+    to release theirs. `max_bytes` <= 0 disables the limit.
+
+    Also reports the compact size of the most recently analyzed chat.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.reserved_bytes = 0
+        self._lock = threading.Condition()
+        self._counters = {'admitted': 0, 'rejected': 0, 'last_messages': 0, 'last_store_bytes': 0}
+
+    def fits(self, nbytes: int) -> bool:
+        """
+        True if a request of `nbytes` could ever be admitted.
+        """
+        if self.max_bytes <= 0 or nbytes <= self.max_bytes:
+            return True
+        with self._lock:
+            self._counters['rejected'] += 1
+        return False
+
+    def reserve(self, nbytes: int, wait: bool = False) -> bool:
+        """
+        Reserves `nbytes`. If they do not fit next to the current reservations,
+        returns False, or with `wait` blocks until they do (`nbytes` must fit()).
+        """
+        with self._lock:
+            while self.max_bytes > 0 and self.reserved_bytes + nbytes > self.max_bytes:
+                if not wait:
+                    self._counters['rejected'] += 1
+                    return False
+                self._lock.wait()
+            self.reserved_bytes += nbytes
+            self._counters['admitted'] += 1
+            return True
+
+    def release(self, nbytes: int):
+        with self._lock:
+            self.reserved_bytes -= nbytes
+            self._lock.notify_all()
+
+    def record(self, messages: int, store_bytes: int):
+        with self._lock:
+            self._counters['last_messages'] = messages
+            self._counters['last_store_bytes'] = store_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['max_bytes'] = self.max_bytes
+            stats['reserved_bytes'] = self.reserved_bytes
+            stats['last_bytes_per_message'] = (
+                round(stats['last_store_bytes'] / stats['last_messages'], 1) if stats['last_messages'] else 0.0
+            )
+            return stats
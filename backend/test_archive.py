@@ -0,0 +1,147 @@
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from analyzer import ChatParser
+from archive import find_chat_member, iter_member, media_index, media_stats, media_type
+
+IOS_CHAT = (
+    "[01/03/2021, 08:00:00] Alice: Morning\n"
+    "[01/03/2021, 08:00:10] Alice: \u200e<attached: 00000001-PHOTO-2021-03-01-08-00-10.jpg>\n"
+    "[01/03/2021, 08:01:00] Bob: \u200e<attached: 00000002-VIDEO-2021-03-01-08-01-00.mp4>\n"
+    "[01/03/2021, 08:02:00] Bob: \u200e<attached: 00000003-AUDIO-2021-03-01-08-02-00.opus>\n"
+    "[01/03/2021, 08:03:00] Alice: nice 😀\n"
+    # Real exports put a left-to-right mark before the '[' of attachment lines
+    "\u200e[01/03/2021, 08:04:00] Alice: \u200e<attached: 00000005-PHOTO-2021-03-01-08-04-00.jpg>\n"
+)
+
+ANDROID_CHAT = (
+    "01/03/2021, 08:00 - Alice: IMG-20210301-WA0001.jpg (file attached)\n"
+    "01/03/2021, 08:01 - Bob: STK-20210301-WA0002.webp (file attached)\n"
+    "01/03/2021, 08:02 - Bob: see the card\n"
+    "Contact.vcf (file attached)\n"
+)
+
+
+def _zip(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _ios_zip() -> bytes:
+    return _zip({
+        '_chat.txt': '\ufeff' + IOS_CHAT,
+        '00000001-PHOTO-2021-03-01-08-00-10.jpg': b'j' * 1000,
+        '00000002-VIDEO-2021-03-01-08-01-00.mp4': b'v' * 5000,
+        '00000003-AUDIO-2021-03-01-08-02-00.opus': b'a' * 300,
+        '00000004-PHOTO-2021-03-01-09-00-00.jpg': b'j' * 700,
+        '00000005-PHOTO-2021-03-01-08-04-00.jpg': b'j' * 200,
+    })
+
+
+def test_find_chat_member():
+    def member(names):
+        return find_chat_member(zipfile.ZipFile(io.BytesIO(_zip({name: b'x' for name in names}))))
+
+    assert member(['a.jpg', 'notes.txt', '_chat.txt']).filename == '_chat.txt'
+    assert member(['WhatsApp Chat with Bob.txt', 'readme.txt']).filename == 'WhatsApp Chat with Bob.txt'
+    assert member(['only.txt', 'a.jpg']).filename == 'only.txt'
+    assert member(['one.txt', 'two.txt']) is None
+    assert member(['a.jpg']) is None
+
+
+def test_iter_member_chunks():
+    archive = zipfile.ZipFile(io.BytesIO(_ios_zip()))
+    chat = find_chat_member(archive)
+    chunks = list(iter_member(archive, chat, chunk_size=16))
+    assert all(len(chunk) <= 16 for chunk in chunks)
+    assert b''.join(chunks).decode('utf-8-sig') == IOS_CHAT
+
+
+def test_media_index_reads_only_directory():
+    archive = zipfile.ZipFile(io.BytesIO(_ios_zip()))
+    index = media_index(archive, find_chat_member(archive))
+    assert '_chat.txt' not in index
+    assert index['00000002-VIDEO-2021-03-01-08-01-00.mp4'] == ('video', 5000)
+    assert media_type('x.WEBP') == 'sticker' and media_type('x.pdf') == 'document'
+
+
+def test_parser_reads_lines_starting_with_direction_mark():
+    frame = ChatParser().parse(IOS_CHAT).to_frame()
+    assert len(frame) == 6
+    # Its own message, not a continuation line of the one before
+    assert frame['author'].tolist()[-2:] == ['Alice', 'Alice']
+    assert frame['message'].iloc[-2] == 'nice 😀'
+    assert frame['message'].iloc[-1].endswith('<attached: 00000005-PHOTO-2021-03-01-08-04-00.jpg>')
+
+
+def test_media_stats_attributes_ios_attachments():
+    archive = zipfile.ZipFile(io.BytesIO(_ios_zip()))
+    index = media_index(archive, find_chat_member(archive))
+    stats = media_stats(ChatParser().parse(IOS_CHAT), index)
+
+    by_person = {entry['author']: entry for entry in stats['by_person']}
+    assert by_person['Alice']['media'] == [{'type': 'image', 'count': 2, 'bytes': 1200}]
+    assert (by_person['Bob']['total_count'], by_person['Bob']['total_bytes']) == (2, 5300)
+    assert stats['unattributed']['media'] == [{'type': 'image', 'count': 1, 'bytes': 700}]
+
+
+def test_media_stats_attributes_android_attachments():
+    index = {
+        'IMG-20210301-WA0001.jpg': ('image', 10),
+        'STK-20210301-WA0002.webp': ('sticker', 20),
+        'Contact.vcf': ('contact', 30),
+    }
+    stats = media_stats(ChatParser().parse(ANDROID_CHAT), index)
+    by_person = {entry['author']: {media['type'] for media in entry['media']} for entry in stats['by_person']}
+    # The card is on a continuation line of Bob's message
+    assert by_person == {'Alice': {'image'}, 'Bob': {'sticker', 'contact'}}
+    assert stats['unattributed']['total_count'] == 0
+
+
+def test_media_stats_of_empty_store():
+    stats = media_stats(ChatParser().parse(''), {'a.jpg': ('image', 5)})
+    assert stats['by_person'] == []
+    assert stats['unattributed']['total_bytes'] == 5
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def _analyze(client, name, data, options=None):
+    # debug bypasses the result cache, so every call analyzes the upload
+    form = {'options': json.dumps(options)} if options else {}
+    return client.post('/analyze', files={'file': (name, data)}, data=form, params={'debug': 'true'})
+
+
+def test_zip_upload_matches_text_upload(client):
+    from_zip = _analyze(client, 'export.zip', _ios_zip())
+    from_text = _analyze(client, 'chat.txt', IOS_CHAT.encode())
+    assert from_zip.status_code == from_text.status_code == 200
+    zip_results, text_results = from_zip.json(), from_text.json()
+    zip_results.pop('debug'), text_results.pop('debug')
+    assert zip_results == text_results
+
+
+def test_zip_upload_with_media_stats(client):
+    response = _analyze(client, 'export.zip', _ios_zip(), options={'media_stats': True})
+    assert response.status_code == 200
+    stats = response.json()['media_stats']
+    assert [entry['author'] for entry in stats['by_person']] == ['Alice', 'Bob']
+    assert stats['unattributed']['total_count'] == 1
+
+
+def test_zip_upload_errors(client):
+    response = _analyze(client, 'export.zip', _zip({'photo.jpg': b'x'}))
+    assert response.status_code == 400
+    response = _analyze(client, 'export.zip', b'PK\x03\x04 not really a zip')
+    assert response.status_code == 400
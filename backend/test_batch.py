@@ -0,0 +1,84 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import batch
+from batch import run
+
+CHAT = (
+    "[01/01/2022, 08:00:00] Alice: Good morning\n"
+    "[01/01/2022, 08:05:00] Bob: Morning, great news\n"
+)
+
+
+def _lines(output) -> list:
+    with open(output, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_rerun_keeps_one_line_per_export(tmp_path):
+    good, bad = tmp_path / 'good.txt', tmp_path / 'bad.txt'
+    good.write_text(CHAT, encoding='utf-8')
+    bad.write_text("not a chat export\n", encoding='utf-8')
+    output = str(tmp_path / 'results.jsonl')
+    paths = [str(good), str(bad)]
+
+    totals = run(paths, output, 1, {})
+    assert (totals['files'], totals['failed']) == (2, 1)
+
+    # The failure is retried and replaces its earlier error line
+    totals = run(paths, output, 1, {})
+    assert (totals['files'], totals['skipped'], totals['failed']) == (1, 1, 1)
+    lines = _lines(output)
+    assert sorted(line['path'] for line in lines) == sorted(paths)
+
+    # A fixed export and a grown one are analyzed again, still one line each
+    bad.write_text(CHAT, encoding='utf-8')
+    with open(good, 'a', encoding='utf-8') as f:
+        f.write("[01/01/2022, 09:00:00] Alice: See you later\n")
+    totals = run(paths, output, 1, {})
+    assert (totals['files'], totals['failed']) == (2, 0)
+    lines = {line['path']: line for line in _lines(output)}
+    assert len(lines) == 2 and len(_lines(output)) == 2
+    assert lines[str(good)]['messages'] == 3
+    assert 'results' in lines[str(bad)]
+
+
+def test_cut_off_line_is_dropped(tmp_path):
+    export = tmp_path / 'chat.txt'
+    export.write_text(CHAT, encoding='utf-8')
+    output = tmp_path / 'results.jsonl'
+    output.write_text('{"path": "elsewhere.txt", "bytes": 1, "res', encoding='utf-8')
+
+    run([str(export)], str(output), 1, {})
+    lines = _lines(output)
+    assert [line['path'] for line in lines] == [str(export)]
+
+
+class CrashingPool(ProcessPoolExecutor):
+    """
+    Pool whose worker dies when given an export named crash.txt, as one
+    killed for running out of memory would.
+    """
+
+    def submit(self, fn, path):
+        if os.path.basename(path) == 'crash.txt':
+            return super().submit(os._exit, 1)
+        return super().submit(fn, path)
+
+
+def test_dead_worker_fails_only_its_export(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', CrashingPool)
+    paths = []
+    for name in ('a.txt', 'crash.txt', 'b.txt', 'c.txt'):
+        export = tmp_path / name
+        export.write_text(CHAT, encoding='utf-8')
+        paths.append(str(export))
+    output = str(tmp_path / 'results.jsonl')
+
+    totals = run(paths, output, 1, {})
+    assert (totals['files'], totals['failed'], totals['messages']) == (4, 1, 6)
+    lines = {os.path.basename(line['path']): line for line in _lines(output)}
+    assert len(lines) == 4 and len(_lines(output)) == 4
+    assert lines['crash.txt']['error'].startswith('BrokenProcessPool')
+    assert all('results' in lines[name] for name in ('a.txt', 'b.txt', 'c.txt'))
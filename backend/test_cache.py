@@ -0,0 +1,106 @@
+import pytest
+
+import cache
+from analyzer import ANALYSIS_VERSION, WhatsAppAnalyzer
+from cache import ParsedChatCache, ResultCache, main
+
+CHAT = (
+    "[01/01/2022, 08:00:00] Alice: Good morning! ☀️\n"
+    "[01/01/2022, 08:05:00] Bob: Morning, that's great news\n"
+    "[01/01/2022, 08:06:30] Alice: I can't wait\n"
+    "continued on a second line\n"
+    "[01/01/2022, 21:15:00] Bob: Terrible day 😞\n"
+)
+
+
+def _upload_chunks(data: bytes, size: int = 7):
+    # Small chunks, so the BOM and multi-byte characters span chunk boundaries
+    return lambda: (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_warmed_export_is_parsed_cache_hit(tmp_path):
+    data = b'\xef\xbb\xbf' + CHAT.encode('utf-8')
+    export = tmp_path / 'chat.txt'
+    export.write_bytes(data)
+    cache_dir = str(tmp_path / 'parsed')
+
+    assert main(['--path', cache_dir, 'warm', str(export)]) == 0
+
+    cache = ParsedChatCache(cache_dir, namespace=ANALYSIS_VERSION)
+    analyzer = WhatsAppAnalyzer(parsed_cache=cache)
+    try:
+        results, state, _ = analyzer.analyze_source(_upload_chunks(data))
+    finally:
+        analyzer.close()
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 0)
+    assert state.total_messages == 4
+    assert results['total_messages'] == 4
+
+
+def test_warm_reports_cached_export(tmp_path, capsys):
+    export = tmp_path / 'chat.txt'
+    export.write_bytes(b'\xef\xbb\xbf' + CHAT.encode('utf-8'))
+    cache_dir = str(tmp_path / 'parsed')
+
+    main(['--path', cache_dir, 'warm', str(export)])
+    main(['--path', cache_dir, 'warm', str(export)])
+    statuses = [line.split()[0] for line in capsys.readouterr().out.splitlines() if line.endswith('chat.txt')]
+    assert statuses == ['added', 'cached']
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Distinct, increasing access times for the disk tier's LRU order
+    ticks = iter(range(1, 1000))
+    monkeypatch.setattr(cache.time, 'time', lambda: float(next(ticks)))
+
+
+def test_result_cache_memory_tier_is_byte_bounded_lru():
+    results = ResultCache(max_bytes=10)
+    results.put('a', b'aaaa')
+    results.put('b', b'bbbb')
+    assert results.get('a') == b'aaaa'
+    results.put('c', b'cccc')
+    # 'b' was least recently used
+    assert results.get('b') is None
+    assert (results.get('a'), results.get('c')) == (b'aaaa', b'cccc')
+    # Too large to keep in memory at all
+    results.put('d', b'd' * 11)
+    assert results.get('d') is None
+
+    stats = results.stats()
+    assert (stats['entries'], stats['memory_bytes'], stats['evictions']) == (2, 8, 1)
+    assert (stats['hits'], stats['memory_hits'], stats['misses']) == (3, 3, 2)
+
+
+def test_result_cache_disk_tier_evicts_least_recently_accessed(tmp_path, clock):
+    results = ResultCache(max_bytes=0, disk_path=str(tmp_path / 'results.db'), disk_max_bytes=10)
+    results.put('a', b'aaaa')
+    results.put('b', b'bbbb')
+    assert results.get('a') == b'aaaa'
+    results.put('c', b'cccc')
+    assert results.get('b') is None
+    assert (results.get('a'), results.get('c')) == (b'aaaa', b'cccc')
+
+    stats = results.stats()
+    assert (stats['disk_entries'], stats['disk_bytes'], stats['disk_evictions']) == (2, 8, 1)
+    assert (stats['hits'], stats['disk_hits'], stats['misses']) == (3, 3, 1)
+    results.close()
+
+
+def test_result_cache_promotes_disk_hits_to_memory(tmp_path):
+    path = str(tmp_path / 'results.db')
+    results = ResultCache(disk_path=path)
+    results.put('a', b'result')
+    results.close()
+
+    # A restart keeps only the disk tier
+    results = ResultCache(disk_path=path)
+    assert results.stats()['entries'] == 0
+    assert results.get('a') == b'result'
+    assert results.get('a') == b'result'
+    stats = results.stats()
+    assert (stats['entries'], stats['memory_bytes']) == (1, 6)
+    assert (stats['hits'], stats['disk_hits'], stats['memory_hits'], stats['misses']) == (2, 1, 1, 0)
+    results.close()
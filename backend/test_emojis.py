@@ -0,0 +1,56 @@
+from collections import Counter
+
+import pytest
+
+from emojis import EmojiMatcher
+
+FAMILY = '\U0001F468\u200d\U0001F469\u200d\U0001F467\u200d\U0001F466'
+THUMBS_UP, MEDIUM_SKIN = '\U0001F44D', '\U0001F3FD'
+WOMAN_TECHNOLOGIST = '\U0001F469\U0001F3FD\u200d\U0001F4BB'
+RAINBOW_FLAG = '\U0001F3F3\ufe0f\u200d\U0001F308'
+GERMANY, FRANCE = '\U0001F1E9\U0001F1EA', '\U0001F1EB\U0001F1F7'
+KEYCAP_ONE, KEYCAP_HASH = '1\ufe0f\u20e3', '#\ufe0f\u20e3'
+MAN, WOMAN = '\U0001F468', '\U0001F469'
+
+
+@pytest.fixture(scope='module')
+def matcher():
+    return EmojiMatcher()
+
+
+@pytest.mark.parametrize('text, expected', [
+    # ZWJ sequences are one emoji
+    (f'{FAMILY} ok', [FAMILY]),
+    (f'{WOMAN_TECHNOLOGIST}{RAINBOW_FLAG}', [WOMAN_TECHNOLOGIST, RAINBOW_FLAG]),
+    # Skin tones stay with the emoji they modify
+    (f'{THUMBS_UP}{MEDIUM_SKIN}!', [THUMBS_UP + MEDIUM_SKIN]),
+    (f'{THUMBS_UP} {MEDIUM_SKIN}', [THUMBS_UP, MEDIUM_SKIN]),
+    # Regional indicators pair up into flags; an odd one out is no emoji
+    (f'{GERMANY}{FRANCE}\U0001F1E9', [GERMANY, FRANCE]),
+    # Digits and '#' are only emojis as keycaps
+    (f'1{KEYCAP_ONE}# {KEYCAP_HASH} 1\u20e3 #1', [KEYCAP_ONE, KEYCAP_HASH, '1\u20e3']),
+    ('call 112 or #3', []),
+])
+def test_find_whole_sequences(matcher, text, expected):
+    assert matcher.find(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    # An incomplete ZWJ sequence falls back to the emoji it starts with
+    (f'{MAN}\u200d x', [MAN]),
+    (f'{MAN}\u200d{WOMAN}', [MAN, WOMAN]),
+    (f'{THUMBS_UP}\u200d', [THUMBS_UP]),
+])
+def test_incomplete_sequence_falls_back_to_longest_emoji(matcher, text, expected):
+    assert matcher.find(text) == expected
+
+
+def test_longest_match_with_custom_sequences():
+    matcher = EmojiMatcher(['ab', 'abcd', 'x'])
+    assert matcher.find('abcx abc abcd abcdx') == ['ab', 'x', 'ab', 'abcd', 'abcd', 'x']
+
+
+def test_count_keeps_messages_apart(matcher):
+    messages = [THUMBS_UP, MEDIUM_SKIN, f'{FAMILY}{FAMILY}', 'no emoji', f'{GERMANY}']
+    assert matcher.count(messages) == Counter({THUMBS_UP: 1, MEDIUM_SKIN: 1, FAMILY: 2, GERMANY: 1})
+    assert matcher.count(messages) == Counter(e for message in messages for e in matcher.find(message))
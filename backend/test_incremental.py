@@ -0,0 +1,175 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from analyzer import POOL_START_METHOD, WhatsAppAnalyzer
+from cache import StateStore
+from options import AnalysisOptions
+from profiling import Profile
+
+WORDS = "good bad happy sad love hate not very really great terrible ok lol meeting tomorrow dinner but kind of".split()
+
+
+def _chat(count: int, seed: int = 3, start=datetime(2022, 1, 1, 8)) -> list:
+    """
+    Lines of a synthetic iOS export: the encryption notice, then `count`
+    messages with gaps from seconds to a day and occasional continuation lines.
+    """
+    r = random.Random(seed)
+    stamp = start
+    lines = [f"[{stamp:%d/%m/%Y, %H:%M:%S}] Group: Messages and calls are end-to-end encrypted."]
+    for _ in range(count):
+        stamp += timedelta(seconds=r.choice([5, 40, 300, 3600, 5 * 3600, 26 * 3600]))
+        author = r.choice(['Alice', 'Bob', 'Carol', 'Dave'])
+        text = ' '.join(r.choice(WORDS) for _ in range(r.randint(1, 10)))
+        if r.random() < 0.15:
+            text += ' 😂 https://example.com/x'
+        lines.append(f"[{stamp:%d/%m/%Y, %H:%M:%S}] {author}: {text}")
+        if r.random() < 0.05:
+            lines.append("and one more line")
+    return [line + '\n' for line in lines]
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    analyzer = WhatsAppAnalyzer()
+    yield analyzer
+    analyzer.close()
+
+
+def _analyze(analyzer, text, state=None, options=None):
+    profile = Profile()
+    results, state = analyzer.analyze_incremental(text, state, profile=profile, options=options)
+    return results, state, profile.counts['characters']
+
+
+def _approx(value):
+    # Sums accumulated over several batches may differ in the last bits
+    if isinstance(value, float):
+        return pytest.approx(value, rel=1e-12)
+    if isinstance(value, dict):
+        return {key: _approx(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_approx(item) for item in value]
+    return value
+
+
+def _assert_same_results(resumed: dict, full: dict):
+    assert full
+    assert resumed == _approx(full)
+
+
+@pytest.mark.parametrize('split', [1, 40, 299, 599])
+def test_resumed_analysis_matches_full_run(analyzer, split):
+    lines = _chat(600)
+    prefix, full_text = ''.join(lines[:split]), ''.join(lines)
+    full, _, _ = _analyze(analyzer, full_text)
+
+    _, state, _ = _analyze(analyzer, prefix)
+    resumed, state, parsed = _analyze(analyzer, full_text, state)
+    assert parsed == len(full_text) - len(prefix)
+    _assert_same_results(resumed, full)
+    assert state.consumed_chars == len(full_text)
+
+
+def test_resumes_repeatedly(analyzer):
+    lines = _chat(500, seed=11)
+    full, _, _ = _analyze(analyzer, ''.join(lines))
+    state = None
+    for end in (100, 220, 221, 400, len(lines)):
+        resumed, state, _ = _analyze(analyzer, ''.join(lines[:end]), state)
+    _assert_same_results(resumed, full)
+
+
+def test_edited_export_is_analyzed_from_scratch(analyzer):
+    lines = _chat(300)
+    _, state, _ = _analyze(analyzer, ''.join(lines[:200]))
+    edited = ''.join(lines[:50] + ["[01/01/2022, 09:00:00] Eve: inserted\n"] + lines[50:])
+    full, _, _ = _analyze(analyzer, edited)
+    results, _, parsed = _analyze(analyzer, edited, state)
+    assert parsed == len(edited)
+    _assert_same_results(results, full)
+
+
+def test_tail_continuing_last_message_is_analyzed_from_scratch(analyzer):
+    lines = _chat(200)
+    text = ''.join(lines)
+    _, state, _ = _analyze(analyzer, text)
+    extended = text + "a continuation line of the last message\n" + ''.join(_chat(20, seed=5, start=datetime(2023, 1, 1))[1:])
+    full, _, _ = _analyze(analyzer, extended)
+    results, _, parsed = _analyze(analyzer, extended, state)
+    assert parsed == len(extended)
+    _assert_same_results(results, full)
+
+
+def test_state_with_fewer_sections_is_not_resumed(analyzer):
+    lines = _chat(200)
+    prefix, full_text = ''.join(lines[:100]), ''.join(lines)
+    _, state, _ = _analyze(analyzer, prefix, options=AnalysisOptions(sections=('hourly_activity',)))
+    full, _, _ = _analyze(analyzer, full_text)
+    results, _, parsed = _analyze(analyzer, full_text, state)
+    assert parsed == len(full_text)
+    _assert_same_results(results, full)
+
+
+def test_source_resume_matches_full_run(analyzer):
+    lines = _chat(400, seed=8)
+    prefix, full_bytes = ''.join(lines[:250]).encode(), ''.join(lines).encode()
+    full, _, _ = _analyze(analyzer, full_bytes.decode())
+
+    def chunks(data):
+        return lambda: (data[i:i + 1000] for i in range(0, len(data), 1000))
+
+    states = {}
+    _, state, scan = analyzer.analyze_source(chunks(prefix), take_state=lambda key: states.pop(key, None))
+    states[scan.chat] = state
+    profile = Profile()
+    resumed, state, scan = analyzer.analyze_source(
+        chunks(full_bytes), take_state=lambda key: states.pop(key, None), profile=profile,
+    )
+    assert scan.resumes
+    assert profile.counts['characters'] == len(full_bytes.decode()) - len(prefix.decode())
+    _assert_same_results(resumed, full)
+
+
+
+def test_upload_is_scanned_during_transfer(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    client = TestClient(main.app)
+    lines = _chat(300, seed=12)
+    prefix, full_bytes = ''.join(lines[:200]).encode(), ''.join(lines).encode()
+    monkeypatch.setattr(main, 'chat_states', StateStore())
+
+    def upload(data, debug=True):
+        response = client.post('/analyze', files={'file': ('chat.txt', data)}, params={'debug': str(debug).lower()})
+        assert response.status_code == 200
+        return response.json()
+
+    upload(prefix)
+    resumed = upload(full_bytes)
+    # The scan ran while the upload arrived; the analysis only parsed the tail
+    assert resumed['debug']['counts']['characters'] == len(full_bytes.decode()) - len(prefix.decode())
+    assert 'digest' in resumed['debug']['stages']
+
+    (chat, state), = main.chat_states._states.items()
+    # A cache hit gives back the state the upload's scan took
+    upload(full_bytes, debug=False)
+    assert main.chat_states._states == {chat: state}
+
+
+def test_parallel_analysis_matches_serial(analyzer):
+    text = ''.join(_chat(600, seed=21))
+    serial, _, _ = _analyze(analyzer, text)
+
+    parallel = WhatsAppAnalyzer(workers=2, shard_size=64)
+    try:
+        results, _, _ = _analyze(parallel, text)
+        assert parallel._pool is not None
+        assert parallel._pool._mp_context.get_start_method() == POOL_START_METHOD
+    finally:
+        parallel.close()
+    _assert_same_results(results, serial)
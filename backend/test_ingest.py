@@ -0,0 +1,138 @@
+import asyncio
+import codecs
+import threading
+
+import pytest
+
+from ingest import MAX_FIELD_BYTES, ChunkPipe, MultipartReader, StreamDecoder, UploadError, detect_encoding
+
+TEXT = "[01/01/2022, 08:00:00] Zoë: café ☕ 😀\n[01/01/2022, 08:01:00] Bob: ok\n"
+
+
+def _decode(data: bytes, size: int) -> str:
+    decoder = StreamDecoder()
+    parts = [decoder.decode(data[i:i + size]) for i in range(0, len(data), size)]
+    return ''.join(parts) + decoder.decode(b'', final=True)
+
+
+@pytest.mark.parametrize('encoding, bom', [
+    ('utf-8', b''), ('utf-8', codecs.BOM_UTF8),
+    ('utf-16-le', codecs.BOM_UTF16_LE), ('utf-16-be', codecs.BOM_UTF16_BE),
+    ('utf-16-le', b''), ('utf-16-be', b''),
+    ('utf-32-le', codecs.BOM_UTF32_LE),
+])
+@pytest.mark.parametrize('size', [1, 3, 1000])
+def test_stream_decoder_drops_bom_across_chunks(encoding, bom, size):
+    assert _decode(bom + TEXT.encode(encoding), size) == TEXT
+
+
+def test_detect_encoding():
+    assert detect_encoding(codecs.BOM_UTF32_LE + b'a\0\0\0') == ('utf-32-le', 4)
+    assert detect_encoding(codecs.BOM_UTF16_LE + b'a\0') == ('utf-16-le', 2)
+    assert detect_encoding('[01/01/2022]'.encode('utf-16-le')) == ('utf-16-le', 0)
+    assert detect_encoding(b'plain') == ('utf-8', 0)
+    assert detect_encoding(b'') == ('utf-8', 0)
+
+
+def test_invalid_utf8_falls_back_to_latin1():
+    data = "ok: caf".encode() + b'\xe9 ' + "😀".encode()
+    assert _decode(data, 2) == "ok: café 😀"
+
+
+BOUNDARY = 'testboundary'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def _body(file_data: bytes, filename='chat.txt', fields=None, file_field='file') -> bytes:
+    parts = []
+    for name, value in (fields or {}).items():
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+        f'Content-Type: text/plain\r\n\r\n'.encode() + file_data + b'\r\n'
+    )
+    parts.append(f'--{BOUNDARY}--\r\n'.encode())
+    return b''.join(parts)
+
+
+@pytest.mark.parametrize('size', [1, 7, 100000])
+def test_multipart_reader_streams_file_part(size):
+    data = TEXT.encode() * 50
+    body = _body(data, fields={'options': '{"top_words": 5}', 'other': 'x'})
+    reader = MultipartReader(CONTENT_TYPE)
+    received = b''.join(chunk for i in range(0, len(body), size) for chunk in reader.write(body[i:i + size]))
+    reader.finish()
+    assert received == data
+    assert reader.filename == 'chat.txt'
+    assert reader.fields == {'options': '{"top_words": 5}', 'other': 'x'}
+
+
+def test_multipart_reader_errors():
+    with pytest.raises(UploadError) as error:
+        MultipartReader('application/json')
+    assert error.value.status_code == 422
+
+    reader = MultipartReader(CONTENT_TYPE)
+    reader.write(_body(b'data', file_field='upload'))
+    with pytest.raises(UploadError) as error:
+        reader.finish()
+    assert error.value.status_code == 422
+
+    reader = MultipartReader(CONTENT_TYPE)
+    with pytest.raises(UploadError) as error:
+        reader.write(_body(b'data', fields={'options': 'x' * (MAX_FIELD_BYTES + 1)}))
+    assert error.value.status_code == 413
+
+    reader = MultipartReader(CONTENT_TYPE)
+    with pytest.raises(UploadError) as error:
+        reader.write(b'not a multipart body at all\r\n')
+        reader.finish()
+    assert error.value.status_code == 400
+
+
+def test_chunk_pipe_consumes_in_order_on_worker_thread():
+    received, threads = [], set()
+
+    def consume(chunk):
+        threads.add(threading.get_ident())
+        received.append(chunk)
+
+    async def run():
+        pipe = ChunkPipe(consume, lambda: len(received), max_chunks=2)
+        for i in range(100):
+            await pipe.send(bytes([i]))
+        return await pipe.close()
+
+    assert asyncio.run(run()) == 100
+    assert received == [bytes([i]) for i in range(100)]
+    assert threading.get_ident() not in threads
+
+
+def test_chunk_pipe_raises_worker_errors():
+    def consume(chunk):
+        if chunk == b'bad':
+            raise ValueError("bad chunk")
+
+    async def run():
+        pipe = ChunkPipe(consume, lambda: 'done', max_chunks=1)
+        await pipe.send(b'ok')
+        await pipe.send(b'bad')
+        # The error surfaces by close() at the latest, and the sender never blocks
+        for _ in range(10):
+            await pipe.send(b'more')
+        await pipe.close()
+
+    with pytest.raises(ValueError, match="bad chunk"):
+        asyncio.run(run())
+
+
+def test_chunk_pipe_abort_skips_finish():
+    finished = []
+
+    async def run():
+        pipe = ChunkPipe(lambda chunk: None, lambda: finished.append(True))
+        await pipe.send(b'data')
+        await pipe.abort()
+
+    asyncio.run(run())
+    assert finished == []
@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import jobs
+import main
+from jobs import Job, JobQueue, QueueFull
+
+CHAT = (
+    "[01/01/2022, 08:00:00] Alice: Good morning everyone\n"
+    "[01/01/2022, 08:05:00] Bob: Morning, that's great news 😀\n"
+    "[01/01/2022, 08:06:30] Alice: I can't wait\n"
+    "[01/01/2022, 21:15:00] Bob: Terrible day\n"
+)
+
+
+def _wait(get, job_id: str) -> dict:
+    # Polls until the job is finished, as a client would
+    for _ in range(500):
+        body = json.loads(get(job_id))
+        if body['status'] in ('done', 'failed'):
+            return body
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def _queue_get(queue: JobQueue):
+    return lambda job_id: queue.get(job_id).to_json()
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(workers=1, max_depth=2, ttl=60)
+    yield queue
+    queue.close()
+
+
+def test_running_job_reports_progress(queue):
+    started, release = threading.Event(), threading.Event()
+
+    def task(job):
+        job.report('scoring', 5, 10)
+        started.set()
+        release.wait(5)
+        return b'{"total_messages": 4}'
+
+    job = queue.submit(task)
+    assert started.wait(5)
+    body = json.loads(queue.get(job.id).to_json())
+    assert (body['status'], body['stage'], body['progress']) == ('running', 'scoring', {'done': 5, 'total': 10})
+    assert 'result' not in body
+    release.set()
+
+    body = _wait(_queue_get(queue), job.id)
+    # The result bytes are embedded as JSON, not as a string
+    assert body['status'] == 'done'
+    assert body['result'] == {'total_messages': 4}
+    assert body['finished_at'] >= body['created_at']
+
+
+def test_failed_jobs_keep_status_code(queue):
+    def too_large(job):
+        raise HTTPException(status_code=413, detail="Too large")
+
+    def broken(job):
+        raise ValueError("boom")
+
+    failed = _wait(_queue_get(queue), queue.submit(too_large).id)
+    assert (failed['status'], failed['error'], failed['status_code']) == ('failed', 'Too large', 413)
+    failed = _wait(_queue_get(queue), queue.submit(broken).id)
+    assert (failed['error'], failed['status_code']) == ('boom', 500)
+    assert 'result' not in failed
+    stats = queue.stats()
+    assert (stats['failed'], stats['pending']) == (2, 0)
+
+
+def test_full_queue_rejects_until_reservation_released(queue):
+    first, second = queue.reserve(), queue.reserve()
+    with pytest.raises(QueueFull):
+        queue.reserve()
+    queue.discard(first)
+    assert queue.get(first.id) is None
+    third = queue.reserve()
+    stats = queue.stats()
+    assert (stats['pending'], stats['rejected']) == (2, 1)
+    for job in (second, third):
+        queue.discard(job)
+    assert queue.stats()['pending'] == 0
+
+
+def test_finished_jobs_expire_after_ttl(queue, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jobs.time, 'time', lambda: now[0])
+    job = queue.finished(b'{}')
+    now[0] += 60
+    assert queue.get(job.id) is job
+    now[0] += 1
+    assert queue.get(job.id) is None
+    assert queue.stats()['expired'] == 1
+
+
+@pytest.fixture
+def client(monkeypatch, queue):
+    monkeypatch.setattr(main, 'job_queue', queue)
+    return TestClient(main.app)
+
+
+def _submit(client, name: str, data: bytes):
+    # debug bypasses the result cache, so the job always runs
+    return client.post('/jobs', files={'file': (name, data)}, params={'debug': 'true'})
+
+
+def _get_job(client):
+    return lambda job_id: client.get(f'/jobs/{job_id}').content
+
+
+def test_job_api_runs_analysis(client, monkeypatch):
+    stages = []
+    report = Job.report
+
+    def record(job, stage, done=0, total=0):
+        if not stages or stages[-1] != stage:
+            stages.append(stage)
+        report(job, stage, done, total)
+
+    monkeypatch.setattr(Job, 'report', record)
+    response = _submit(client, 'chat.txt', CHAT.encode())
+    assert response.status_code == 202
+    assert response.json()['status'] == 'queued'
+
+    body = _wait(_get_job(client), response.json()['id'])
+    assert body['status'] == 'done'
+    assert stages == ['parsing', 'scoring', 'aggregating']
+    expected = client.post('/analyze', files={'file': ('chat.txt', CHAT.encode())}).json()
+    body['result'].pop('debug')
+    assert body['result'] == expected
+
+
+def test_job_api_rejects_when_full(client, queue):
+    held = [queue.reserve(), queue.reserve()]
+    response = _submit(client, 'chat.txt', CHAT.encode())
+    assert response.status_code == 503
+    assert queue.stats()['rejected'] == 1
+
+    queue.discard(held.pop())
+    # A rejected upload releases its reservation
+    assert _submit(client, 'chat.pdf', CHAT.encode()).status_code == 400
+    assert queue.stats()['pending'] == 1
+    response = _submit(client, 'chat.txt', CHAT.encode())
+    assert response.status_code == 202
+    assert _wait(_get_job(client), response.json()['id'])['status'] == 'done'
+    queue.discard(held.pop())
+    assert queue.stats()['pending'] == 0
+
+
+def test_job_api_reports_failure(client):
+    response = _submit(client, 'chat.txt', b'not a chat export\n')
+    body = _wait(_get_job(client), response.json()['id'])
+    assert (body['status'], body['status_code']) == ('failed', 400)
+    assert 'Could not parse any messages' in body['error']
+    assert client.get('/jobs/unknown').status_code == 404
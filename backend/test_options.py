@@ -0,0 +1,114 @@
+import json
+from unittest import mock
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from analyzer import WhatsAppAnalyzer
+from options import DEFAULT_OPTIONS, DEFAULT_STOPWORDS, OPTION_LIMITS, SECTIONS, AnalysisOptions
+from profiling import Profile
+
+CHAT = (
+    "[01/03/2021, 08:00:00] Ann: Great news 😀 https://www.example.com/a\n"
+    "[01/03/2021, 08:05:00] Bob: terrible traffic today\n"
+    "[01/03/2021, 12:30:00] Ann: lunch? 🍕\n"
+)
+
+
+def test_from_dict_defaults_and_canonical_forms():
+    assert AnalysisOptions.from_dict({}) == DEFAULT_OPTIONS
+    options = AnalysisOptions.from_dict({
+        'sections': ['word_clouds', 'hourly_activity', 'word_clouds'],
+        'extra_stopwords': ["Don't", 'PIZZA'],
+        'top_words': 10,
+    })
+    assert options.sections == ('hourly_activity', 'word_clouds')
+    assert options.extra_stopwords == frozenset({'dont', 'pizza'})
+    assert options.stopwords is DEFAULT_STOPWORDS
+    assert 'pizza' in options.word_stopwords
+
+
+def test_cache_key_ignores_order_and_spelling():
+    first = AnalysisOptions.from_dict({'sections': ['sessions', 'emoji_stats'], 'stopwords': ['A', 'b']})
+    second = AnalysisOptions.from_dict({'sections': ['emoji_stats', 'sessions'], 'stopwords': ['b', 'a']})
+    assert first.cache_key() == second.cache_key()
+    assert first.cache_key() != DEFAULT_OPTIONS.cache_key()
+
+
+@pytest.mark.parametrize('data', [
+    [], {'colour': 'blue'}, {'sections': ['everything']}, {'sections': 'word_clouds'},
+    {'top_words': 2.5}, {'top_words': True}, {'top_words': '5'}, {'top_emojis': -1},
+    {'media_stats': 1}, {'stopwords': 'the'}, {'extra_stopwords': [1, 2]},
+])
+def test_from_dict_rejects_invalid(data):
+    with pytest.raises(ValueError):
+        AnalysisOptions.from_dict(data)
+
+
+@pytest.mark.parametrize('name', sorted(OPTION_LIMITS))
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), -float('inf'), 'limit'])
+def test_numeric_options_must_be_finite_and_bounded(name, value):
+    if value == 'limit':
+        limit = OPTION_LIMITS[name]
+        AnalysisOptions.from_dict({name: limit})
+        value = limit + 1
+    with pytest.raises(ValueError, match=name):
+        AnalysisOptions.from_dict({name: value})
+
+
+@pytest.mark.parametrize('field', ['Infinity', 'NaN', '1e9'])
+def test_api_rejects_non_finite_options(field):
+    client = TestClient(main.app)
+    for name in ('response_window_minutes', 'sentiment_threshold'):
+        response = client.post('/analyze', files={'file': ('chat.txt', CHAT.encode())},
+                               data={'options': f'{{"{name}": {field}}}'})
+        assert response.status_code == 422, response.text
+
+
+def test_accumulates():
+    full = DEFAULT_OPTIONS
+    assert full.accumulates(AnalysisOptions(sections=('hourly_activity',)))
+    assert not AnalysisOptions(sections=('hourly_activity',)).accumulates(full)
+    # Parameters only matter for the sections that use them
+    assert full.accumulates(AnalysisOptions(sentiment_threshold=0.5, sections=('hourly_activity',)))
+    assert not full.accumulates(AnalysisOptions(sentiment_threshold=0.5))
+    assert not full.accumulates(AnalysisOptions(response_window_minutes=60, sections=('response_matrix',)))
+    assert full.accumulates(AnalysisOptions(response_window_minutes=60, sections=('sessions',)))
+    assert not full.accumulates(AnalysisOptions(conversation_gap_hours=1, sections=('sessions',)))
+    assert not full.accumulates(AnalysisOptions(extra_stopwords=frozenset({'pizza'})))
+    assert full.accumulates(AnalysisOptions(extra_stopwords=frozenset({'pizza'}), sections=('emoji_stats',)))
+    # Top-N counts apply when results are built
+    assert full.accumulates(AnalysisOptions(top_words=3, top_emojis=1))
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    analyzer = WhatsAppAnalyzer()
+    yield analyzer
+    analyzer.close()
+
+
+def _analyze(analyzer, options):
+    profile = Profile()
+    results, _ = analyzer.analyze_incremental(CHAT, profile=profile, options=options)
+    return results, profile
+
+
+def test_section_selection_skips_per_message_work(analyzer):
+    options = AnalysisOptions(sections=('hourly_activity',))
+    with mock.patch.object(analyzer.scorer, 'score_batch') as score_batch, \
+            mock.patch.object(analyzer.emoji_matcher, 'count') as count_emojis:
+        results, profile = _analyze(analyzer, options)
+    score_batch.assert_not_called()
+    count_emojis.assert_not_called()
+    assert {'sentiment', 'words', 'emoji', 'domains'}.isdisjoint(profile.stages)
+    assert set(SECTIONS) & set(results) == {'hourly_activity'}
+    assert results['total_messages'] == 3
+
+
+def test_selected_sections_match_full_analysis(analyzer):
+    full, _ = _analyze(analyzer, DEFAULT_OPTIONS)
+    for section in SECTIONS:
+        results, _ = _analyze(analyzer, AnalysisOptions(sections=(section,)))
+        assert json.dumps(results[section], sort_keys=True) == json.dumps(full[section], sort_keys=True), section
@@ -0,0 +1,147 @@
+import re
+import unicodedata
+
+import pandas as pd
+import pytest
+
+from analyzer import ChatParser, WhatsAppAnalyzer
+
+# The baseline's pd.to_datetime warns when it falls back to dateutil
+pytestmark = pytest.mark.filterwarnings('ignore:Could not infer format:UserWarning')
+
+IOS_CHAT = """\
+[01/03/2021, 08:00:00] Group: Messages and calls are end-to-end encrypted. No one outside of this chat can read them.
+[01/03/2021, 08:00:05] Alice: Good morning everyone
+[01/03/2021, 08:01:10] Bob: Morning! Long message
+that continues on a second line
+
+and a third after a blank one
+[01/03/2021, 08:02:00] Alice added Carol
+[01/03/2021, 08:02:30] Carol: hi 👋
+[01/03/2021, 08:03:00] Bob: image omitted
+[01/03/2021, 08:03:30] \u200e\u200eAlice: \u200eimage omitted
+[01/03/2021, 08:04:00] You: sent from my phone
+[01/03/2021, 08:05:00] Bob changed the subject to "Weekend"
+[01/03/2021, 08:06:00] Dave left
+[01/03/2021, 08:06:10] Alice added Dave: welcome back
+[01/03/2021, 08:06:20] Dave left: bye
+[13/03/2021, 21:15:59] Carol: you started a video call
+[13/03/2021, 21:16:00] \u202aCarol\u202c: Dates with day 13 fix the order
+[14/03/2021, 07:00:00] Alice: Back: with a colon: in the text
+"""
+
+ANDROID_CHAT = """\
+31/12/20, 23:59 - Messages and calls are end-to-end encrypted. No one outside of this chat can read them.
+31/12/20, 23:59 - Alice: Happy new year!
+1/1/21, 00:00 - Bob: Same to you
+multi
+line
+1/1/21, 00:01 - Bob removed Eve
+1/1/21, 00:01 - Bob removed Eve: spam
+1/1/21, 00:02 - Carol joined using this group's invite link
+1/1/21, 00:03 - Alice: GIF omitted
+1/2/21, 10:30 - Alice: 🎉🎉
+"""
+
+
+def _baseline_parse(file_content: str) -> pd.DataFrame:
+    """
+    The original line-by-line parse_chat, kept as the reference the
+    streaming parser must reproduce.
+    """
+    pattern1 = r'^\[(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2}(?::\d{2})?)\]\s(.*?):\s(.*)$'
+    pattern2 = r'^(\d{1,2}/\d{1,2}/\d{2,4}),\s(\d{1,2}:\d{2})\s-\s(.*?):\s(.*)$'
+
+    def clean(author):
+        return ''.join(c for c in author if unicodedata.category(c)[0] != 'C').strip().lower()
+
+    data = []
+    exclude_authors = {'you'}
+    for line in file_content.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        line_lower = line.lower()
+        if ('image omitted' in line_lower or 'gif omitted' in line_lower
+                or '\u200e\u200e' in line_lower or 'you started a video call' in line_lower):
+            continue
+        match = re.match(pattern1, line) or re.match(pattern2, line)
+        if match:
+            date, time, author, message = match.groups()
+            if 'messages and calls are end-to-end encrypted' in message.lower():
+                exclude_authors.add(clean(author))
+                continue
+            if clean(author) in exclude_authors:
+                continue
+            data.append({'date': date, 'time': time, 'author': author, 'message': message})
+        elif data:
+            data[-1]['message'] += f" {line}"
+
+    df = pd.DataFrame(data)
+    if df.empty:
+        return df
+    df['datetime'] = pd.to_datetime(df['date'] + ' ' + df['time'], dayfirst=True, errors='coerce')
+    df = df.dropna(subset=['datetime'])
+    df['author'] = df['author'].str.strip()
+    for keyword in [' changed the subject to', ' changed the group icon', ' added ', ' left', ' removed ',
+                    ' joined using this group\'s invite link', ' security code changed']:
+        df = df[~df['author'].str.contains(keyword, case=False)]
+    return df
+
+
+def _records(df: pd.DataFrame) -> list:
+    return list(zip(df['author'], df['message'], pd.to_datetime(df['datetime'])))
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    analyzer = WhatsAppAnalyzer()
+    yield analyzer
+    analyzer.close()
+
+
+@pytest.mark.parametrize('chat', [IOS_CHAT, ANDROID_CHAT, IOS_CHAT.replace('\n', '\r\n')], ids=['ios', 'android', 'crlf'])
+def test_matches_baseline_parser(analyzer, chat):
+    expected = _records(_baseline_parse(chat))
+    assert expected
+    assert _records(analyzer.parse_chat(chat)) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64])
+def test_chunk_boundaries_do_not_change_messages(analyzer, chunk_size):
+    expected = _records(_baseline_parse(IOS_CHAT))
+    assert _records(analyzer.parse_chat(IOS_CHAT, chunk_size=chunk_size)) == expected
+    chunks = (IOS_CHAT[i:i + chunk_size] for i in range(0, len(IOS_CHAT), chunk_size))
+    assert _records(analyzer.parse_chat(chunks)) == expected
+
+
+def test_bytes_and_file_sources(analyzer, tmp_path):
+    expected = _records(_baseline_parse(ANDROID_CHAT))
+    assert _records(analyzer.parse_chat(ANDROID_CHAT.encode('utf-8'))) == expected
+    path = tmp_path / 'chat.txt'
+    path.write_text(ANDROID_CHAT, encoding='utf-8')
+    with open(path, encoding='utf-8') as f:
+        assert _records(analyzer.parse_chat(f)) == expected
+
+
+def test_multiline_and_system_messages():
+    store = ChatParser().parse(IOS_CHAT)
+    authors = [store.authors[code] for code in store.author_codes]
+    messages = store.messages()
+    # Continuation lines (and system events without an author) join the message before them
+    assert messages[1].startswith("Morning! Long message that continues on a second line and a third after a blank one")
+    assert authors[1] == 'Bob'
+    assert not any('omitted' in message or 'video call' in message for message in messages)
+    # Encryption notice author, "You", and "X added Y:" / "X left:" pseudo-authors are dropped
+    assert set(authors) == {'Alice', 'Bob', 'Carol', '\u202aCarol\u202c'}
+
+
+def test_encryption_notice_excludes_its_author():
+    parser = ChatParser()
+    parser.parse(IOS_CHAT)
+    assert {'you', 'group'} <= parser.exclude_authors
+
+
+def test_empty_and_unparseable_input(analyzer):
+    assert analyzer.parse_chat('').empty
+    assert analyzer.parse_chat('just some text\nwithout any messages\n').empty
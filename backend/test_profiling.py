@@ -0,0 +1,101 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import profiling
+from profiling import MetricsRegistry, Profile
+
+CHAT = (
+    "[01/01/2022, 08:00:00] Alice: Good morning everyone\n"
+    "[01/01/2022, 08:05:00] Bob: Morning, that's great news 😀 https://example.com/a\n"
+    "[01/01/2022, 21:15:00] Bob: Terrible day\n"
+)
+
+# One line of the Prometheus text format: a comment or a sample
+SAMPLE_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[a-zA-Z_][a-zA-Z0-9_]*="[^"]*"\})? (\S+)$')
+COMMENT_LINE = re.compile(r'^# (HELP|TYPE) ([a-zA-Z_:][a-zA-Z0-9_:]*) (.+)$')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(profiling.time, 'perf_counter', lambda: now[0])
+    return now
+
+
+def test_nested_stage_time_excludes_children(clock):
+    profile = Profile()
+    with profile.stage('parse'):
+        clock[0] = 1.0
+        with profile.stage('datetime'):
+            clock[0] = 4.0
+        with profile.stage('datetime'):
+            clock[0] = 4.5
+        clock[0] = 6.0
+    profile.finish()
+
+    assert profile.stages['parse']['seconds'] == pytest.approx(2.5)
+    assert profile.stages['datetime'] == {'seconds': pytest.approx(3.5), 'calls': 2, 'peak_bytes': 0}
+    assert profile.seconds == 6.0
+    # Stages are reported in pipeline order
+    assert list(profile.as_dict()['stages']) == ['parse', 'datetime']
+
+
+def test_merge_adds_worker_stages():
+    profile = Profile()
+    profile.add('sentiment', 1.0, peak_bytes=100)
+    profile.merge({
+        'sentiment': {'seconds': 0.5, 'calls': 3, 'peak_bytes': 50},
+        'emoji': {'seconds': 0.25, 'calls': 2, 'peak_bytes': 400},
+    })
+    assert profile.stages == {
+        'sentiment': {'seconds': 1.5, 'calls': 4, 'peak_bytes': 100},
+        'emoji': {'seconds': 0.25, 'calls': 2, 'peak_bytes': 400},
+    }
+
+
+def _parse_exposition(text: str) -> dict:
+    """
+    Samples of Prometheus exposition text by name and labels; fails on lines
+    that are not valid or samples without a TYPE line for their family.
+    """
+    assert text.endswith('\n')
+    types, samples = {}, {}
+    for line in text.splitlines():
+        comment = COMMENT_LINE.match(line)
+        if comment:
+            kind, name, value = comment.groups()
+            if kind == 'TYPE':
+                assert value in ('counter', 'gauge', 'histogram')
+                types[name] = value
+            continue
+        sample = SAMPLE_LINE.match(line)
+        assert sample, line
+        name, labels, value = sample.groups()
+        family = re.sub(r'_(bucket|sum|count)$', '', name) if name not in types else name
+        assert family in types, line
+        samples[name + (labels or '')] = float(value)
+    return samples
+
+
+def test_metrics_after_one_analysis(monkeypatch):
+    monkeypatch.setattr(main, 'metrics', MetricsRegistry())
+    client = TestClient(main.app)
+    response = client.post('/analyze', files={'file': ('chat.txt', CHAT.encode())}, params={'debug': 'true'})
+    assert response.status_code == 200
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    samples = _parse_exposition(response.text)
+
+    for stage in ('parse', 'sentiment', 'aggregate'):
+        assert samples[f'analyzer_stage_calls_total{{stage="{stage}"}}'] >= 1
+        assert samples[f'analyzer_stage_seconds_total{{stage="{stage}"}}'] >= 0
+    assert samples['analyzer_messages_total'] == 3
+    assert samples['analyzer_analysis_seconds_count'] == 1
+    assert samples['analyzer_analysis_seconds_bucket{le="+Inf"}'] == 1
+    assert 'analyzer_memory_reserved_bytes' in samples
+    assert 'analyzer_result_cache_hits' in samples
@@ -0,0 +1,100 @@
+import random
+import sys
+
+import numpy as np
+import pytest
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+from sentiment import BatchSentimentScorer
+
+MESSAGES = [
+    # Empty and blank
+    "", " ", "\n", "   \t ",
+    # Plain lexicon words and neutral text
+    "good", "bad", "I love this pizza", "see you at dinner tomorrow", "ok",
+    # "but" clauses (VADER fallback)
+    "good but bad", "I love it but it's terrible", "but", "not bad but not great either",
+    "It was fine, BUT the ending was awful!", "nothing but love",
+    # Multi-word idioms and booster n-grams
+    "that movie was the bomb", "yeah right, great job", "he can cut the mustard",
+    "it was the kiss of death", "break a leg tonight", "kind of good", "sort of sad",
+    "this is the shit", "bad ass car",
+    # Negation, "never so", "without doubt", "least"
+    "not good", "isn't bad", "never good", "I don't love it", "never so happy",
+    "never this good", "without doubt the best", "least happy day", "at least it's good",
+    "very least good", "no problem", "no", "not not good",
+    # Boosters, ALL CAPS and punctuation emphasis
+    "very good", "extremely GOOD", "GOOD", "GOOD day", "REALLY BAD DAY", "good!!!",
+    "good!!!!!!", "bad??", "bad????", "what?? great!!", "!!!", "sooo good", "HAHA LOL",
+    # Emoji, alone and next to text
+    "😀", "I am 😞", "x😀", "❤️", "love ❤️ you", "👍🏽", "🔥🔥🔥", "😂😂 so funny", "🇬🇧",
+    # Non-ASCII text
+    "café très bon", "naïve but happy",
+]
+
+WORDS = (
+    "good bad happy sad love hate the a not very really great terrible ok lol haha "
+    "meeting tomorrow dinner pizza work tired excited sure no never but kind of so this least"
+).split()
+EMOJI = ['😀', '❤️', '👍🏽', '🇬🇧', '😂', '🔥', '🙏', '😞']
+
+
+def _random_messages(count: int, seed: int = 7) -> list:
+    r = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        message = ' '.join(r.choice(WORDS) for _ in range(r.randint(1, 12)))
+        if r.random() < 0.2:
+            message += ' ' + r.choice(EMOJI)
+        if r.random() < 0.1:
+            message = message.upper()
+        if r.random() < 0.1:
+            message += r.choice(['!', '!!!', '??', '?!'])
+        messages.append(message)
+    return messages
+
+
+@pytest.fixture(scope='module')
+def vader():
+    return SentimentIntensityAnalyzer()
+
+
+@pytest.fixture(scope='module')
+def scorer(vader):
+    return BatchSentimentScorer(vader)
+
+
+def _expected(vader, messages) -> list:
+    return [vader.polarity_scores(message)['compound'] for message in messages]
+
+
+@pytest.mark.parametrize('message', MESSAGES)
+def test_single_message_matches_polarity_scores(scorer, vader, message):
+    assert scorer.score_batch([message]).tolist() == _expected(vader, [message])
+
+
+def test_batch_matches_polarity_scores(scorer, vader):
+    messages = MESSAGES + _random_messages(3000)
+    assert scorer.score_batch(messages).tolist() == _expected(vader, messages)
+
+
+def test_duplicates_and_order(scorer, vader):
+    messages = ["good", "bad", "good", "", "good but bad", "bad", ""]
+    scores = scorer.score_batch(messages)
+    assert scores.dtype == np.float64
+    assert scores.tolist() == _expected(vader, messages)
+
+
+def test_empty_batch(scorer):
+    scores = scorer.score_batch([])
+    assert scores.dtype == np.float64 and len(scores) == 0
+
+
+def test_valence_sums_are_uncompensated():
+    # score_batch relies on np.bincount summing a message's valences left to
+    # right without compensation, as VADER's sum() does before Python 3.12
+    values = [1e16, 1.0, -1e16]
+    total = np.bincount(np.zeros(len(values), dtype=np.int64), weights=values)[0]
+    assert total == (1e16 + 1.0) - 1e16 == 0.0
+    if sys.version_info < (3, 12):
+        assert total == sum(values)
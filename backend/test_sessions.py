@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+
+from sessions import RESPONSE_PERCENTILES, ResponseLog, SessionLog
+
+
+def _response_log(batches) -> ResponseLog:
+    log = ResponseLog()
+    for responders, targets, seconds, authors, outside in batches:
+        log.add(np.array(responders), np.array(targets), np.array(seconds), authors, outside)
+    return log
+
+
+def test_response_log_by_person_and_matrix():
+    log = _response_log([([1, 0, 1, 2], [0, 1, 0, 1], [60, 120, 180, 30], ['Ann', 'Ben', 'Cat'], None)])
+    assert log.by_person() == [
+        {'author': 'Ann', 'responses': 1, 'avg_minutes': 2.0, 'median_minutes': 2.0,
+         'p25_minutes': 2.0, 'p75_minutes': 2.0, 'p90_minutes': 2.0},
+        {'author': 'Ben', 'responses': 2, 'avg_minutes': 2.0, 'median_minutes': 2.0,
+         'p25_minutes': 1.5, 'p75_minutes': 2.5, 'p90_minutes': 2.8},
+        {'author': 'Cat', 'responses': 1, 'avg_minutes': 0.5, 'median_minutes': 0.5,
+         'p25_minutes': 0.5, 'p75_minutes': 0.5, 'p90_minutes': 0.5},
+    ]
+    assert [(row['from'], row['to'], row['responses']) for row in log.matrix()] == [
+        ('Ann', 'Ben', 1), ('Ben', 'Ann', 2), ('Cat', 'Ben', 1),
+    ]
+
+
+def test_single_response_percentiles_equal_its_time():
+    log = _response_log([([1], [0], [65 * 60], ['Ann', 'Ben'], None)])
+    row = log.by_person()[0]
+    assert row['avg_minutes'] == 65.0
+    assert [row[f'p{p}_minutes'] if p != 50 else row['median_minutes'] for p in RESPONSE_PERCENTILES] == [65.0] * 4
+
+
+def test_minute_resolution_percentiles_are_exact():
+    # Exports without seconds: every response time is a whole number of minutes
+    minutes = [7] * 9 + [6] * 4 + [8] * 5 + [30, 45]
+    log = _response_log([([1] * len(minutes), [0] * len(minutes), np.array(minutes) * 60, ['Ann', 'Ben'], None)])
+    row = log.matrix()[0]
+    assert row['median_minutes'] == 7.0
+    assert row['p90_minutes'] == round(float(np.percentile(minutes, 90)), 2)
+
+
+def test_response_log_batches_match_single_batch():
+    rng = np.random.default_rng(4)
+    names = ['Ann', 'Ben', 'Cat', 'Dan']
+    responders = rng.integers(0, 4, 500)
+    targets = (responders + rng.integers(1, 4, 500)) % 4
+    seconds = rng.integers(0, 43200, 500)
+    whole = _response_log([(responders, targets, seconds, names, None)])
+
+    # Later batches have their own author lists, and their first response
+    # may reply to the last author of the batch before (code -1)
+    batches = []
+    for start, stop in [(0, 120), (120, 121), (121, 400), (400, 500)]:
+        authors = names[::-1] if start % 2 else names
+        remap = np.array([authors.index(name) for name in names])
+        batch_targets = remap[targets[start:stop]]
+        outside = None
+        if start:
+            outside = names[targets[start]]
+            batch_targets[0] = -1
+        batches.append((remap[responders[start:stop]], batch_targets, seconds[start:stop], authors, outside))
+    split = _response_log(batches)
+
+    assert split.by_person() == whole.by_person()
+    assert split.matrix() == whole.matrix()
+    # Reading compacts each pair's batches into one array
+    assert all(len(parts) == 1 for parts in split.seconds.values())
+
+    for row in whole.by_person():
+        values = seconds[responders == names.index(row['author'])]
+        assert row['responses'] == len(values)
+        assert row['median_minutes'] == round(float(np.median(values)) / 60, 2)
+
+
+def _reference_sessions(timestamps, names, gap):
+    """
+    (messages, duration, participants) per session, splitting wherever more
+    than `gap` seconds pass between messages.
+    """
+    sessions = []
+    for i, (timestamp, name) in enumerate(zip(timestamps, names)):
+        if i == 0 or timestamp - timestamps[i - 1] > gap:
+            sessions.append([timestamp, timestamp, 0, set()])
+        session = sessions[-1]
+        session[1] = timestamp
+        session[2] += 1
+        session[3].add(name)
+    return sessions
+
+
+def _session_log(timestamps, names, gap, cuts) -> SessionLog:
+    log = SessionLog()
+    bounds = [0, *cuts, len(timestamps)]
+    for batch, (start, stop) in enumerate(zip(bounds, bounds[1:])):
+        # Every batch codes authors into its own list
+        authors = sorted(set(names[start:stop]), reverse=batch % 2 == 1)
+        codes = np.array([authors.index(name) for name in names[start:stop]], dtype=np.int64)
+        stamps = np.array(timestamps[start:stop], dtype=np.int64)
+        previous = timestamps[start - 1] if start else None
+        diffs = np.diff(stamps, prepend=stamps[0] if previous is None else previous)
+        starts = diffs > gap
+        if previous is None:
+            starts[0] = True
+        log.add(stamps, codes, authors, starts)
+    return log
+
+
+@pytest.fixture(scope='module')
+def conversation():
+    rng = np.random.default_rng(5)
+    gaps = rng.choice([10, 60, 600, 4 * 3600, 30 * 3600], 400)
+    timestamps = (1_600_000_000 + np.cumsum(gaps)).tolist()
+    names = rng.choice(['Ann', 'Ben', 'Cat', 'Dan'], 400).tolist()
+    return timestamps, names
+
+
+def test_session_summary_matches_reference(conversation):
+    timestamps, names = conversation
+    summary = _session_log(timestamps, names, 3 * 3600, []).summary()
+    sessions = _reference_sessions(timestamps, names, 3 * 3600)
+
+    messages = [session[2] for session in sessions]
+    durations = [session[1] - session[0] for session in sessions]
+    assert summary['count'] == len(sessions)
+    assert summary['max_messages'] == max(messages)
+    assert summary['median_messages'] == float(np.median(messages))
+    assert summary['median_duration_minutes'] == round(float(np.median(durations)) / 60, 2)
+    assert summary['avg_participants'] == round(float(np.mean([len(session[3]) for session in sessions])), 2)
+    for entry in summary['by_person']:
+        assert entry['sessions'] == sum(entry['author'] in session[3] for session in sessions)
+
+
+@pytest.mark.parametrize('cuts', [[1], [57], [100, 101, 102], [50, 150, 250, 350], list(range(10, 400, 10))])
+def test_session_batches_match_single_batch(conversation, cuts):
+    timestamps, names = conversation
+    whole = _session_log(timestamps, names, 3 * 3600, [])
+    split = _session_log(timestamps, names, 3 * 3600, cuts)
+    assert split.summary() == whole.summary()
+
+
+def test_batch_starting_new_session_closes_open_one():
+    log = SessionLog()
+    log.add(np.array([0, 60]), np.array([0, 1]), ['Ann', 'Ben'], np.array([True, False]))
+    log.add(np.array([100_000, 100_060]), np.array([0, 0]), ['Cat'], np.array([True, False]))
+    summary = log.summary()
+    assert summary['count'] == 2
+    assert summary['participants'] == [{'participants': 1, 'sessions': 1}, {'participants': 2, 'sessions': 1}]
+    assert [entry['author'] for entry in summary['by_person']] == ['Ann', 'Ben', 'Cat']
+
+
+def test_empty_session_log():
+    assert SessionLog().summary() == {'count': 0}
@@ -0,0 +1,127 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from store import MemoryBudget, MessageStore, estimate_analysis_bytes
+
+CHAT = (
+    "[01/01/2022, 08:00:00] Alice: Good morning everyone\n"
+    "[01/01/2022, 08:05:00] Bob: Morning 😀\n"
+    "[01/01/2022, 21:15:00] Bob: Terrible day\n"
+)
+
+
+@pytest.fixture
+def store():
+    return MessageStore.from_messages(
+        ['Ann', 'Ben', 'Cat'], [0, 1, 2, 1], [100, 200, 300, 400], ['hi', 'größer 😀', '', 'last one'],
+    )
+
+
+def test_slice_copies_a_range(store):
+    part = store.slice(1, 3)
+    assert part.messages() == ['größer 😀', '']
+    assert part.authors == store.authors
+    assert part.author_codes.tolist() == [1, 2]
+    assert part.timestamps.tolist() == [200, 300]
+    assert part.offsets[0] == 0 and isinstance(part.buffer, bytes)
+    # Past the end is cut off, as with a list
+    assert store.slice(3, 10).messages() == ['last one']
+
+
+def test_slice_of_memoryview_buffer_is_bytes(store):
+    shared = MessageStore(store.authors, store.author_codes, store.timestamps, store.offsets, memoryview(store.buffer))
+    assert isinstance(shared.buffer, memoryview)
+    part = shared.slice(0, 2)
+    assert isinstance(part.buffer, bytes)
+    assert part.messages() == ['hi', 'größer 😀']
+
+
+def test_select_drops_authors_without_messages(store):
+    selected = store.select(np.array([False, True, True, True]))
+    assert selected.authors == ['Ben', 'Cat']
+    assert selected.author_codes.tolist() == [0, 1, 0]
+    assert selected.timestamps.tolist() == [200, 300, 400]
+    assert selected.messages() == ['größer 😀', '', 'last one']
+    assert len(store.select(np.zeros(4, dtype=bool))) == 0
+
+
+def test_frame_round_trip(store):
+    frame = store.to_frame()
+    assert frame['author'].tolist() == ['Ann', 'Ben', 'Cat', 'Ben']
+    again = MessageStore.from_frame(frame)
+    assert again.authors == store.authors
+    assert again.author_codes.tolist() == store.author_codes.tolist()
+    assert again.timestamps.tolist() == store.timestamps.tolist()
+    assert again.buffer == store.buffer
+    assert len(MessageStore.from_frame(pd.DataFrame())) == 0
+
+
+def test_budget_fits_and_reserve():
+    budget = MemoryBudget(max_bytes=100)
+    assert budget.fits(100)
+    assert not budget.fits(101)
+    assert budget.reserve(60)
+    assert not budget.reserve(50)
+    assert budget.reserve(40)
+    budget.release(60)
+    budget.release(40)
+    stats = budget.stats()
+    assert (stats['admitted'], stats['rejected'], stats['reserved_bytes']) == (2, 2, 0)
+
+    unlimited = MemoryBudget(max_bytes=0)
+    assert unlimited.fits(10 ** 12) and unlimited.reserve(10 ** 12)
+
+
+def test_budget_reserve_waits_for_release():
+    budget = MemoryBudget(max_bytes=100)
+    budget.reserve(80)
+    admitted = threading.Event()
+
+    def waiter():
+        budget.reserve(50, wait=True)
+        admitted.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert not admitted.wait(0.1)
+    budget.release(80)
+    assert admitted.wait(5)
+    thread.join()
+    assert budget.reserved_bytes == 50
+
+
+def _estimate(text: str) -> int:
+    data = text.encode()
+    return estimate_analysis_bytes(len(data), text.count('\n') + 1, streamed=True)
+
+
+def _analyze(client):
+    # debug bypasses the result cache, so the analysis always runs
+    return client.post('/analyze', files={'file': ('chat.txt', CHAT.encode())}, params={'debug': 'true'})
+
+
+def test_analysis_admission(monkeypatch):
+    client = TestClient(main.app)
+    budget = MemoryBudget(max_bytes=_estimate(CHAT) - 1)
+    monkeypatch.setattr(main, 'memory_budget', budget)
+    # Could never fit
+    response = _analyze(client)
+    assert response.status_code == 413
+    assert 'memory budget' in response.json()['detail']
+
+    budget.max_bytes = _estimate(CHAT)
+    budget.reserve(1)
+    # Fits once the analyses in flight are done
+    response = _analyze(client)
+    assert response.status_code == 503
+    budget.release(1)
+
+    assert _analyze(client).status_code == 200
+    stats = budget.stats()
+    assert (stats['reserved_bytes'], stats['admitted'], stats['rejected']) == (0, 2, 2)
+    assert stats['last_messages'] == 3
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analyzer import ChatParser, WhatsAppAnalyzer
+from timestamps import StampFormat, date_seconds, detect_format, time_seconds
+
+
+def _epoch(text: str) -> int:
+    return int(datetime.strptime(text, '%Y-%m-%d %H:%M:%S').timestamp() - datetime(1970, 1, 1).timestamp())
+
+
+def _stamps(chat: str) -> list:
+    store = ChatParser().parse(chat)
+    return [str(stamp) for stamp in pd.to_datetime(store.timestamps, unit='s')]
+
+
+def test_day_first_from_field_above_twelve():
+    assert detect_format(['01/03/2021', '13/03/2021'], ['08:00']).dayfirst
+    stamp_format = detect_format(['03/01/2021', '03/13/2021'], ['08:00'])
+    assert not stamp_format.dayfirst and stamp_format.order_detected
+
+
+def test_day_first_from_day_to_day_changes():
+    assert detect_format(['01/03/2021', '02/03/2021', '03/03/2021'], ['08:00']).dayfirst
+    stamp_format = detect_format(['03/01/2021', '03/02/2021', '03/03/2021'], ['08:00'])
+    assert not stamp_format.dayfirst and stamp_format.order_detected
+
+
+def test_ambiguous_dates_assume_day_first():
+    stamp_format = detect_format(['01/03/2021'], ['08:00'])
+    assert stamp_format.dayfirst and not stamp_format.order_detected
+    assert not detect_format([], []).order_detected
+
+
+def test_year_digits_seconds_and_clock():
+    stamp_format = detect_format(['1/3/21', '13/3/21'], ['8:00:05 PM', '9:10:00 AM'])
+    assert stamp_format == StampFormat(dayfirst=True, four_digit_year=False, seconds=True, twelve_hour=True,
+                                       order_detected=True)
+    assert stamp_format.pattern == '%d/%m/%y %I:%M:%S %p'
+
+
+def test_date_and_time_seconds():
+    stamp_format = StampFormat(dayfirst=False, four_digit_year=False, seconds=False, twelve_hour=True)
+    dates = date_seconds(['3/13/21', '12/31/99', '13/3/21'], stamp_format)
+    assert dates.tolist() == [_epoch('2021-03-13 00:00:00'), _epoch('1999-12-31 00:00:00'), -1]
+    times = time_seconds(['12:05 AM', '12:05 PM', '1:30 PM', '25:00 PM'], stamp_format)
+    assert times.tolist() == [300, 12 * 3600 + 300, 13 * 3600 + 1800, -1]
+    assert time_seconds(['08:00:05'], StampFormat()).dtype == np.int64
+
+
+def test_month_first_two_digit_year_export():
+    chat = (
+        "[3/12/21, 9:05:00 PM] Ann: evening\n"
+        "[3/13/21, 7:00:00 AM] Bob: morning\n"
+    )
+    assert _stamps(chat) == ['2021-03-12 21:05:00', '2021-03-13 07:00:00']
+
+
+# iOS puts a narrow no-break space (U+202F) before AM/PM
+@pytest.mark.parametrize('separator, marker', [
+    (' ', 'PM'), (' ', 'pm'), (' ', 'p.m.'), ('\u202f', 'PM'), ('\u202f', 'p.m.'), ('', 'PM'),
+])
+def test_twelve_hour_markers(separator, marker):
+    chat = (
+        f"13/03/2021, 1:05{separator}{marker} - Ann: lunch\n"
+        f"13/03/2021, 11:59{separator}{marker.replace('p', 'a').replace('P', 'A')} - Bob: early\n"
+    )
+    assert _stamps(chat) == ['2021-03-13 13:05:00', '2021-03-13 11:59:00']
+
+
+def test_android_lines_with_seconds():
+    chat = (
+        "13/03/2021, 08:00:15 - Ann: hi\n"
+        "13/03/2021, 08:01:45 - Bob: hey\n"
+    )
+    assert _stamps(chat) == ['2021-03-13 08:00:15', '2021-03-13 08:01:45']
+
+
+def test_resume_refuses_assumed_day_first():
+    analyzer = WhatsAppAnalyzer()
+    # Week one only has 01/03, which reads as either 1 March or 3 January
+    week_one = ''.join(f"01/03/2021, {hour:02d}:00 - {'Ann' if hour % 2 else 'Bob'}: hello\n" for hour in range(8, 20))
+    week_two = ''.join(f"01/{day:02d}/2021, 10:00 - Ann: day {day}\n" for day in range(4, 10))
+    try:
+        _, state = analyzer.analyze_incremental(week_one)
+        assert not state.stamp_format.order_detected
+        resumed, state = analyzer.analyze_incremental(week_one + week_two, state)
+        full, _ = analyzer.analyze_incremental(week_one + week_two)
+    finally:
+        analyzer.close()
+    assert resumed == full
+    assert resumed['total_duration'] == '6 days'
+    assert resumed['datetime_format']['day_first'] is False
+    assert state.stamp_format.order_detected
@@ -0,0 +1,125 @@
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Distinct dates and times looked at to detect an export's timestamp format
+DETECTION_SAMPLE_SIZE = 1000
+
+DATE_PARTS_PATTERN = re.compile(r'(\d+)/(\d+)/(\d+)$')
+
+# Midnight of the day strptime gives times without a date
+TIME_EPOCH = np.datetime64('1900-01-01T00:00:00', 's')
+
+
+@dataclass(frozen=True)
+class StampFormat:
+    """
+    Timestamp format of one export, detected once from a sample of its lines.
+
+    `order_detected` is False when no sampled date told day and month apart
+    (no field above 12 and no day-to-day changes), so day-first was assumed.
+    """
+    dayfirst: bool = True
+    four_digit_year: bool = True
+    seconds: bool = True
+    twelve_hour: bool = False
+    order_detected: bool = False
+
+    @property
+    def date_format(self) -> str:
+        year = '%Y' if self.four_digit_year else '%y'
+        return f'%d/%m/{year}' if self.dayfirst else f'%m/%d/{year}'
+
+    @property
+    def time_format(self) -> str:
+        hour = '%I' if self.twelve_hour else '%H'
+        time = f'{hour}:%M:%S' if self.seconds else f'{hour}:%M'
+        return f'{time} %p' if self.twelve_hour else time
+
+    @property
+    def pattern(self) -> str:
+        return f'{self.date_format} {self.time_format}'
+
+    def as_dict(self) -> dict:
+        return {
+            'format': self.pattern,
+            'day_first': self.dayfirst,
+            'year_digits': 4 if self.four_digit_year else 2,
+            'seconds': self.seconds,
+            'clock': '12h' if self.twelve_hour else '24h',
+            'order_detected': self.order_detected,
+        }
+
+
+def _day_first(dates: list):
+    """
+    True/False if the sampled dates (in order of first appearance) show
+    which field is the day, None if they cannot tell.
+
+    A field above 12 can only be a day. Failing that, the day is the field
+    that changes between consecutive dates while the other stays the same.
+    """
+    parts = [match.groups() for match in map(DATE_PARTS_PATTERN.match, dates) if match]
+    if not parts:
+        return None
+    first_over = sum(int(first) > 12 for first, _, _ in parts)
+    second_over = sum(int(second) > 12 for _, second, _ in parts)
+    if first_over != second_over:
+        return first_over > second_over
+
+    first_changes = second_changes = 0
+    for previous, current in zip(parts, parts[1:]):
+        if previous[2] != current[2]:
+            continue
+        if previous[0] != current[0] and previous[1] == current[1]:
+            first_changes += 1
+        elif previous[1] != current[1] and previous[0] == current[0]:
+            second_changes += 1
+    if first_changes != second_changes:
+        return first_changes > second_changes
+    return None
+
+
+def detect_format(dates, times) -> StampFormat:
+    """
+    Detects the format from samples of distinct date strings ('d/m/y' in
+    some order) and time strings ('H:MM[:SS][ AM|PM]'), each in order of
+    first appearance. Only the first DETECTION_SAMPLE_SIZE of each are read.
+    """
+    dates = list(dates)[:DETECTION_SAMPLE_SIZE]
+    times = list(times)[:DETECTION_SAMPLE_SIZE]
+    dayfirst = _day_first(dates)
+
+    years = [date.rsplit('/', 1)[-1] for date in dates]
+    four_digit_year = sum(len(year) == 4 for year in years) * 2 >= len(years)
+    seconds = sum(time.count(':') == 2 for time in times) * 2 >= len(times) if times else True
+    twelve_hour = sum(time.endswith('M') for time in times) * 2 > len(times)
+    return StampFormat(
+        dayfirst=True if dayfirst is None else dayfirst,
+        four_digit_year=four_digit_year,
+        seconds=seconds,
+        twelve_hour=twelve_hour,
+        order_detected=dayfirst is not None,
+    )
+
+
+def date_seconds(dates, stamp_format: StampFormat) -> np.ndarray:
+    """
+    Seconds since the epoch of each date string at midnight; -1 where a
+    string does not match the format.
+    """
+    parsed = pd.to_datetime(pd.Index(dates, dtype=object), format=stamp_format.date_format, errors='coerce')
+    values = parsed.to_numpy().astype('datetime64[s]')
+    return np.where(np.isnat(values), -1, values.astype(np.int64))
+
+
+def time_seconds(times, stamp_format: StampFormat) -> np.ndarray:
+    """
+    Seconds since midnight of each time string; -1 where a string does not
+    match the format.
+    """
+    parsed = pd.to_datetime(pd.Index(times, dtype=object), format=stamp_format.time_format, errors='coerce')
+    values = parsed.to_numpy().astype('datetime64[s]')
+    return np.where(np.isnat(values), -1, (values - TIME_EPOCH).astype(np.int64))
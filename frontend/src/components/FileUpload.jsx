@@ -3,6 +3,9 @@ import { motion } from 'framer-motion';
 import { Upload, FileText, Loader, CheckCircle, AlertCircle } from 'lucide-react';
 import axios from 'axios';
 
+// WhatsApp exports a chat as a .txt, or as a .zip with its media
+const isChatExport = (name) => /\.(txt|zip)$/i.test(name);
+
 const FileUpload = ({ onAnalysisComplete }) => {
     const [isDragging, setIsDragging] = useState(false);
     const [file, setFile] = useState(null);
@@ -23,21 +26,21 @@ const FileUpload = ({ onAnalysisComplete }) => {
         e.preventDefault();
         setIsDragging(false);
         const droppedFile = e.dataTransfer.files[0];
-        if (droppedFile && droppedFile.name.endsWith('.txt')) {
+        if (droppedFile && isChatExport(droppedFile.name)) {
             setFile(droppedFile);
             setError(null);
         } else {
-            setError("Please upload a valid .txt file");
+            setError("Please upload a valid .txt or .zip chat export");
         }
     }, []);
 
     const handleFileSelect = (e) => {
         const selectedFile = e.target.files[0];
-        if (selectedFile && selectedFile.name.endsWith('.txt')) {
+        if (selectedFile && isChatExport(selectedFile.name)) {
             setFile(selectedFile);
             setError(null);
         } else {
-            setError("Please upload a valid .txt file");
+            setError("Please upload a valid .txt or .zip chat export");
         }
     };
 
@@ -97,14 +100,14 @@ const FileUpload = ({ onAnalysisComplete }) => {
                         <p className="text-sm text-gray-500">
                             {file
                                 ? "Ready to analyze"
-                                : "Drag and drop your exported .txt file here, or click to browse"}
+                                : "Drag and drop your exported .txt or .zip file here, or click to browse"}
                         </p>
                     </div>
 
                     {!file && (
                         <input
                             type="file"
-                            accept=".txt"
+                            accept=".txt,.zip"
                             onChange={handleFileSelect}
                             className="hidden"
                             id="file-upload"